@@ -0,0 +1,291 @@
+import http.client
+import json
+import select
+import threading
+from decimal import Decimal
+from urllib.parse import urlsplit, urlencode
+import exporter
+import importer
+from finance_service import ValidationError, PAGE_SIZE
+from api_server import FILTER_PARAMS
+from storage import StorageError, DuplicateKeyError
+
+# Client for api_server with the same methods as FinanceService, so the GUI
+# can run against a shared server instead of a local database. Calls block;
+# the GUI makes them on TaskRunner workers as it does with the local service.
+# Each worker thread keeps its own keep-alive connection; close() closes all
+# of them.
+
+# Requests that may be repeated when it is unknown whether the server got them
+IDEMPOTENT_METHODS = ("GET", "PUT", "DELETE")
+
+
+class ApiClient:
+    def __init__(self, url, timeout=30.0):
+        parts = urlsplit(url)
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 8765
+        self.prefix = parts.path.rstrip("/")
+        self.timeout = timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = set()
+        self._alert_listeners = []
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and conn.sock is not None and select.select([conn.sock], [], [], 0)[0]:
+            # An idle keep-alive socket only turns readable once the server has closed it
+            self._discard(conn)
+            conn = None
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            with self._lock:
+                self._connections.add(conn)
+        return conn
+
+    def _discard(self, conn):
+        conn.close()
+        self._local.conn = None
+        with self._lock:
+            self._connections.discard(conn)
+
+    def request(self, method, path, params=None, body=None):
+        params = {name: value for name, value in (params or {}).items() if value is not None}
+        target = self.prefix + path + ("?" + urlencode(params) if params else "")
+        data = json.dumps(body, default=str).encode("utf-8") if body is not None else None
+        headers = {"Content-Type": "application/json"} if data is not None else {}
+        # A kept-alive connection the server has since closed fails on first
+        # use; retry once on a fresh one. A write that was sent may have been
+        # applied before the connection dropped, so only requests safe to
+        # repeat are retried after sending.
+        for attempt in (1, 2):
+            conn = self._connection()
+            sent = False
+            try:
+                conn.request(method, target, body=data, headers=headers)
+                sent = True
+                response = conn.getresponse()
+                payload = json.loads(response.read() or b"null")
+                break
+            except (http.client.HTTPException, ConnectionError) as e:
+                self._discard(conn)
+                if attempt == 2 or (sent and method not in IDEMPOTENT_METHODS):
+                    raise StorageError(f"API server unreachable: {e}") from e
+            except OSError as e:
+                self._discard(conn)
+                raise StorageError(f"API server unreachable: {e}") from e
+
+        if response.status >= 400:
+            message = payload.get("error", response.reason) if isinstance(payload, dict) else response.reason
+            if response.status == 400:
+                raise ValidationError(message)
+            if response.status == 409:
+                raise DuplicateKeyError(message, errno=response.status)
+            raise StorageError(message, errno=response.status)
+        self._relay_alerts(payload)
+        return payload
+
+    def add_alert_listener(self, callback):
+        # Budget alerts are raised on the server and arrive with the response
+        # to the write that crossed the threshold
+        self._alert_listeners.append(callback)
+
+    def _relay_alerts(self, payload):
+        alerts = payload.get("alerts") if isinstance(payload, dict) else None
+        if alerts:
+            alerts = [dict(alert, spent=_decimal(alert["spent"]), budget=_decimal(alert["budget"]))
+                      for alert in alerts]
+            for callback in self._alert_listeners:
+                callback(alerts)
+
+    def open(self):
+        # Checked at startup in place of running migrations
+        self.request("GET", "/health")
+        return []
+
+    def close(self):
+        # Every thread's connection, not only the caller's; a thread that
+        # makes another request afterwards opens a new one
+        with self._lock:
+            connections, self._connections = self._connections, set()
+        for conn in connections:
+            conn.close()
+
+    def stats(self):
+        return self.request("GET", "/health")["stats"]
+
+    # Expenses
+
+    def insert_expense(self, date, category, amount, note=None):
+        return _expense(self.request("POST", "/expenses", body={"date": date, "category": category,
+                                                                "amount": amount, "note": note})["expense"])
+
+    def insert_expenses(self, rows):
+        body = {"expenses": [{"date": date, "category": category, "amount": amount}
+                             for date, category, amount in rows]}
+        return self.request("POST", "/expenses/batch", body=body)["inserted"]
+
+    def save_expense(self, expense_id, date, category, amount, note=None):
+        try:
+            row = self.request("PUT", f"/expenses/{int(expense_id)}",
+                               body={"date": date, "category": category, "amount": amount,
+                                     "note": note})["expense"]
+        except StorageError as e:
+            if e.errno == 404:
+                return None
+            raise
+        return _expense(row)
+
+    def remove_expense(self, expense_id):
+        try:
+            return self.request("DELETE", f"/expenses/{int(expense_id)}")["deleted"]
+        except StorageError as e:
+            if e.errno == 404:
+                return 0
+            raise
+
+    def count_expenses(self, **filters):
+        params = {FILTER_PARAMS[name]: value for name, value in filters.items()}
+        return self.request("GET", "/expenses/count", params)["count"]
+
+    def _bulk(self, action, ids, filters, **fields):
+        body = dict(fields, action=action)
+        if ids is not None:
+            body["ids"] = list(ids)
+        else:
+            body["filters"] = {FILTER_PARAMS[name]: value for name, value in (filters or {}).items()}
+        return self.request("POST", "/expenses/bulk", body=body)
+
+    def recategorize_expenses(self, category, ids=None, filters=None):
+        result = self._bulk("recategorize", ids, filters, category=category)
+        return result["updated"], [_expense(row) for row in result["expenses"]]
+
+    def adjust_expense_amounts(self, adjustment, ids=None, filters=None):
+        result = self._bulk("adjust", ids, filters, adjustment=adjustment)
+        return result["updated"], [_expense(row) for row in result["expenses"]]
+
+    def remove_expenses(self, ids=None, filters=None):
+        return self._bulk("delete", ids, filters)["deleted"]
+
+    def import_expenses(self, path, progress=None):
+        # Parsed and validated here; each chunk is one batch request
+        return importer.import_file(path, self.insert_expenses, 5000, progress)
+
+    def fetch_expense_page(self, after=None, before=None, limit=PAGE_SIZE, **filters):
+        params = {"after": _key(after), "before": _key(before), "limit": limit}
+        params.update((FILTER_PARAMS[name], value) for name, value in filters.items())
+        rows = self.request("GET", "/expenses", params)
+        return [_expense(row) for row in rows["expenses"]]
+
+    def export_page(self, start=None, end=None, category=None, after=None, limit=5000):
+        rows = self.request("GET", "/expenses/export", {"start": start, "end": end, "category": category,
+                                                        "after": _key(after), "limit": limit})
+        return [_expense(row) for row in rows["expenses"]]
+
+    def _export_chunks(self, start, end, category):
+        after = None
+        while True:
+            rows = self.export_page(start, end, category, after)
+            if not rows:
+                return
+            yield rows
+            after = (rows[-1][1], rows[-1][0])
+
+    def export_expenses(self, path, start=None, end=None, category=None, fmt=None, progress=None):
+        # Written locally from pages of the server's export order
+        return exporter.write_expenses(self._export_chunks(start, end, category), path, fmt, progress)
+
+    def export_budget_report(self, path, start=None, end=None, fmt=None, period=None):
+        return exporter.write_budget_report([self.get_budget_comparison(start, end, period)], path, fmt)
+
+    # Aggregations
+
+    def get_category_totals(self, start=None, end=None):
+        rows = self.request("GET", "/reports/category-totals", {"start": start, "end": end})["totals"]
+        return [(category, _decimal(total)) for category, total in rows]
+
+    def get_period_totals(self, period='month', start=None, end=None, by_category=False):
+        rows = self.request("GET", "/reports/period-totals",
+                            {"period": period, "start": start, "end": end,
+                             "by_category": 1 if by_category else None})["totals"]
+        return [(*row[:-1], _decimal(row[-1])) for row in rows]
+
+    def get_budget_comparison(self, start=None, end=None, period=None):
+        rows = self.request("GET", "/reports/budget-comparison",
+                            {"start": start, "end": end, "period": period})["comparison"]
+        return [(category, period, _decimal(budget), _decimal(spent)) for category, period, budget, spent in rows]
+
+    def get_budget_forecast(self, period="month", on=None):
+        rows = self.request("GET", "/reports/budget-forecast", {"period": period, "on": on})["forecast"]
+        return [(category, *map(_decimal, amounts)) for category, *amounts in rows]
+
+    # Budgets
+
+    def insert_budget(self, category, amount, period="month"):
+        return _budget(self.request("POST", "/budgets",
+                                    body={"category": category, "amount": amount, "period": period})["budget"])
+
+    def save_budget(self, budget_id, category, amount, period=None):
+        try:
+            row = self.request("PUT", f"/budgets/{int(budget_id)}",
+                               body={"category": category, "amount": amount, "period": period})["budget"]
+        except StorageError as e:
+            if e.errno == 404:
+                return None
+            raise
+        return _budget(row)
+
+    def remove_budget(self, budget_id):
+        try:
+            return self.request("DELETE", f"/budgets/{int(budget_id)}")["deleted"]
+        except StorageError as e:
+            if e.errno == 404:
+                return 0
+            raise
+
+    def adjust_budgets(self, adjustment, ids):
+        body = {"action": "adjust", "ids": list(ids), "adjustment": adjustment}
+        return [_budget(row) for row in self.request("POST", "/budgets/bulk", body=body)["budgets"]]
+
+    def remove_budgets(self, ids):
+        body = {"action": "delete", "ids": list(ids)}
+        return self.request("POST", "/budgets/bulk", body=body)["deleted"]
+
+    def list_budgets(self):
+        return [_budget(row) for row in self.request("GET", "/budgets")["budgets"]]
+
+    def get_budgets(self):
+        return [(category, amount, period) for _, category, amount, period in self.list_budgets()]
+
+    def rebuild_rollup(self):
+        return self.request("POST", "/admin/rebuild-rollup")["rows"]
+
+    def batch(self, calls):
+        # calls: [(method, path, body)]; returns [(status, payload)] in order
+        requests = [{"method": method, "path": path, "body": body} for method, path, body in calls]
+        responses = self.request("POST", "/batch", body={"requests": requests})["responses"]
+        for response in responses:
+            self._relay_alerts(response["body"])
+        return [(response["status"], response["body"]) for response in responses]
+
+
+def _key(key):
+    return None if key is None else f"{key[0]},{key[1]}"
+
+
+def _decimal(value):
+    # Amounts arrive as decimal strings: both backends return Decimal, which
+    # the server encodes with str()
+    return None if value is None else Decimal(value)
+
+
+def _expense(row):
+    # (id, date, category, amount), plus the note on list and write responses
+    expense_id, day, category, amount, *note = row
+    return (expense_id, day, category, _decimal(amount), *note)
+
+
+def _budget(row):
+    budget_id, category, amount, period = row
+    return budget_id, category, _decimal(amount), period
@@ -0,0 +1,426 @@
+import asyncio
+import contextvars
+import functools
+import json
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from decimal import Decimal
+from urllib.parse import urlsplit, parse_qs
+from finance_service import ValidationError
+from storage import StorageError, DuplicateKeyError
+
+# Headless JSON API over FinanceService, on plain asyncio streams (HTTP/1.1
+# with keep-alive). The event loop only parses requests and writes responses;
+# every service call runs on an executor sized to the connection pool, so
+# many concurrent clients share a bounded set of pooled connections.
+#
+#   GET    /health
+#   GET    /expenses?after=DATE,ID&before=DATE,ID&limit=N   newest first
+#          &start&end&category&min&max&q                  optional filters; q searches notes
+#   POST   /expenses              {"date", "category", "amount", "note"}
+#   POST   /expenses/batch        {"expenses": [{"date", "category", "amount"}, ...]}
+#   PUT    /expenses/ID           {"date", "category", "amount", "note"}
+#   DELETE /expenses/ID
+#   GET    /expenses/count?start&end&category&min&max&q
+#   POST   /expenses/bulk         {"action": "recategorize" | "adjust" | "delete",
+#                                  "ids": [ID, ...] or "filters": {"start", ..., "q"},
+#                                  "category" | "adjustment"}   one transaction
+#   GET    /expenses/export?start&end&category&after=DATE,ID&limit=N   oldest first
+#   GET    /budgets
+#   POST   /budgets               {"category", "amount", "period"}   period defaults to month
+#   PUT    /budgets/ID            {"category", "amount", "period"}   period is kept if omitted
+#   DELETE /budgets/ID
+#   POST   /budgets/bulk          {"action": "adjust" | "delete", "ids": [ID, ...], "adjustment"}
+#   GET    /reports/category-totals?start&end
+#   GET    /reports/period-totals?period&start&end&by_category=1
+#   GET    /reports/budget-comparison?start&end&period
+#   GET    /reports/budget-forecast?period&on
+#   POST   /batch                 {"requests": [{"method", "path", "body"}, ...]}
+#   POST   /admin/rebuild-rollup  recompute expense_rollup from expenses
+#
+# Amounts are sent as decimal strings so no precision is lost. Responses to
+# writes that cross a budget threshold carry the alerts as "alerts":
+# [{"category", "period", "threshold", "spent", "budget"}, ...].
+
+logger = logging.getLogger(__name__)
+
+# Budget alerts fired by the service calls of the request being handled
+_request_alerts = contextvars.ContextVar("request_alerts", default=None)
+
+MAX_BODY = 8 * 1024 * 1024
+MAX_PAGE = 10000
+MAX_BATCH = 1000
+# fetch_expense_page filter arguments and their query parameters
+FILTER_PARAMS = {"start": "start", "end": "end", "category": "category", "min_amount": "min",
+                 "max_amount": "max", "text": "q"}
+
+REASONS = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           409: "Conflict", 413: "Payload Too Large", 500: "Internal Server Error",
+           503: "Service Unavailable"}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def encode(payload):
+    return json.dumps(payload, default=_json_default, separators=(",", ":")).encode("utf-8")
+
+
+def _key(value, name):
+    # 'YYYY-MM-DD,ID' keyset position
+    if value is None:
+        return None
+    day, _, row_id = value.partition(",")
+    try:
+        return day, int(row_id)
+    except ValueError:
+        raise HttpError(400, f"{name} must be DATE,ID")
+
+
+def _limit(query, default):
+    try:
+        limit = int(query.get("limit", default))
+    except ValueError:
+        raise HttpError(400, "limit must be an integer")
+    return max(1, min(limit, MAX_PAGE))
+
+
+def _fields(body, *names):
+    if not isinstance(body, dict):
+        raise HttpError(400, "Request body must be a JSON object")
+    return [body.get(name) for name in names]
+
+
+def _filters(params):
+    # fetch_expense_page filter arguments from query parameters or a JSON object
+    return {name: params.get(param) for name, param in FILTER_PARAMS.items()}
+
+
+def _bulk_target(body):
+    # ids and filters arguments of a bulk edit; exactly one is given
+    ids, filters = _fields(body, "ids", "filters")
+    if (ids is None) == (filters is None):
+        raise HttpError(400, "Give either ids or filters")
+    if ids is not None and not isinstance(ids, list):
+        raise HttpError(400, "ids must be a list")
+    if filters is not None:
+        if not isinstance(filters, dict):
+            raise HttpError(400, "filters must be an object")
+        filters = _filters(filters)
+    return ids, filters
+
+
+class ApiServer:
+    def __init__(self, service, host="127.0.0.1", port=8765, workers=None):
+        self.service = service
+        self.host = host
+        self.port = port
+        # One worker per pooled connection; more would only queue on the pool
+        self.executor = ThreadPoolExecutor(max_workers=workers or service.storage.pool_size,
+                                           thread_name_prefix="finance-api")
+        self.server = None
+        service.add_alert_listener(self._alerts_fired)
+        self.routes = [
+            ("GET", r"/health", self.health),
+            ("GET", r"/expenses", self.list_expenses),
+            ("POST", r"/expenses", self.add_expense),
+            ("POST", r"/expenses/batch", self.add_expenses),
+            ("GET", r"/expenses/export", self.export_expenses),
+            ("GET", r"/expenses/count", self.count_expenses),
+            ("POST", r"/expenses/bulk", self.bulk_expenses),
+            ("PUT", r"/expenses/(\d+)", self.update_expense),
+            ("DELETE", r"/expenses/(\d+)", self.delete_expense),
+            ("GET", r"/budgets", self.list_budgets),
+            ("POST", r"/budgets", self.add_budget),
+            ("PUT", r"/budgets/(\d+)", self.update_budget),
+            ("DELETE", r"/budgets/(\d+)", self.delete_budget),
+            ("POST", r"/budgets/bulk", self.bulk_budgets),
+            ("GET", r"/reports/category-totals", self.category_totals),
+            ("GET", r"/reports/period-totals", self.period_totals),
+            ("GET", r"/reports/budget-comparison", self.budget_comparison),
+            ("GET", r"/reports/budget-forecast", self.budget_forecast),
+            ("POST", r"/batch", self.batch),
+            ("POST", r"/admin/rebuild-rollup", self.rebuild_rollup),
+        ]
+        self.routes = [(method, re.compile(pattern + "$"), handler) for method, pattern, handler in self.routes]
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        logger.info("Serving the finance API on http://%s:%d", self.host, self.port)
+
+    async def serve_forever(self):
+        await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    def close(self):
+        if self.server:
+            self.server.close()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def call(self, fn, *args):
+        # Runs in a copy of the request's context, so alerts the call fires reach its response
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, contextvars.copy_context().run, functools.partial(fn, *args))
+
+    def _alerts_fired(self, alerts):
+        # Runs on the executor thread that made the write
+        for alert in alerts:
+            logger.info("Budget alert: %s at %s%% of its %s budget", alert["category"], alert["threshold"],
+                        alert["period"])
+        fired = _request_alerts.get()
+        if fired is not None:
+            fired.extend(alerts)
+
+    # HTTP
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request = await self.read_request(reader)
+                if request is None:
+                    break
+                method, target, version, headers, body = request
+                status, payload = await self.respond(method, target, body)
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                data = encode(payload)
+                writer.write(
+                    f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+                    "Content-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("ascii") + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except HttpError as e:
+            # Unparseable request: answer once and drop the connection
+            data = encode({"error": str(e)})
+            writer.write(f"HTTP/1.1 {e.status} {REASONS.get(e.status, '')}\r\n"
+                         f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n"
+                         "Connection: close\r\n\r\n".encode("ascii") + data)
+        finally:
+            writer.close()
+
+    async def read_request(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        try:
+            method, target, version = line.decode("latin-1").split()
+        except ValueError:
+            raise HttpError(400, "Malformed request line")
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        length = headers.get("content-length") or "0"
+        if not re.fullmatch(r"[0-9]+", length):
+            raise HttpError(400, "Content-Length must be a non-negative integer")
+        length = int(length)
+        if length > MAX_BODY:
+            raise HttpError(413, "Request body too large")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), target, version, headers, body
+
+    async def respond(self, method, target, body):
+        # Returns (status, payload), mapping errors to HTTP status codes
+        try:
+            parsed = json.loads(body) if body else None
+        except ValueError:
+            return 400, {"error": "Request body is not valid JSON"}
+        fired = []
+        token = _request_alerts.set(fired)
+        try:
+            status, payload = await self.dispatch(method, target, parsed)
+            if fired and isinstance(payload, dict):
+                payload = dict(payload, alerts=fired)
+            return status, payload
+        except HttpError as e:
+            return e.status, {"error": str(e)}
+        except ValidationError as e:
+            return 400, {"error": str(e)}
+        except DuplicateKeyError as e:
+            return 409, {"error": str(e)}
+        except StorageError as e:
+            logger.warning("%s %s failed: %s", method, target, e)
+            return 503, {"error": str(e)}
+        except Exception:
+            logger.exception("%s %s failed", method, target)
+            return 500, {"error": "Internal server error"}
+        finally:
+            _request_alerts.reset(token)
+
+    async def dispatch(self, method, target, body):
+        url = urlsplit(target)
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        allowed = False
+        for route_method, pattern, handler in self.routes:
+            match = pattern.match(url.path)
+            if match:
+                if route_method == method:
+                    return await handler(query, body, *match.groups())
+                allowed = True
+        if allowed:
+            raise HttpError(405, f"{method} is not allowed on {url.path}")
+        raise HttpError(404, f"No such endpoint: {url.path}")
+
+    # Endpoints; each returns (status, payload)
+
+    async def health(self, query, body):
+        return 200, {"status": "ok", "stats": self.service.stats()}
+
+    async def list_expenses(self, query, body):
+        rows = await self.call(functools.partial(self.service.fetch_expense_page, **_filters(query)),
+                               _key(query.get("after"), "after"), _key(query.get("before"), "before"),
+                               _limit(query, 100))
+        return 200, {"expenses": rows}
+
+    async def add_expense(self, query, body):
+        row = await self.call(self.service.insert_expense, *_fields(body, "date", "category", "amount", "note"))
+        return 201, {"expense": row}
+
+    async def add_expenses(self, query, body):
+        expenses = _fields(body, "expenses")[0]
+        if not isinstance(expenses, list):
+            raise HttpError(400, "expenses must be a list")
+        if len(expenses) > MAX_PAGE:
+            raise HttpError(413, f"At most {MAX_PAGE} expenses per batch")
+        rows = [_fields(expense, "date", "category", "amount") if isinstance(expense, dict) else expense
+                for expense in expenses]
+        return 201, {"inserted": await self.call(self.service.insert_expenses, rows)}
+
+    async def export_expenses(self, query, body):
+        rows = await self.call(self.service.export_page, query.get("start"), query.get("end"),
+                               query.get("category"), _key(query.get("after"), "after"), _limit(query, 5000))
+        return 200, {"expenses": rows}
+
+    async def update_expense(self, query, body, expense_id):
+        row = await self.call(self.service.save_expense, int(expense_id),
+                              *_fields(body, "date", "category", "amount", "note"))
+        if row is None:
+            raise HttpError(404, f"No expense {expense_id}")
+        return 200, {"expense": row}
+
+    async def delete_expense(self, query, body, expense_id):
+        if not await self.call(self.service.remove_expense, int(expense_id)):
+            raise HttpError(404, f"No expense {expense_id}")
+        return 200, {"deleted": 1}
+
+    async def count_expenses(self, query, body):
+        count = await self.call(functools.partial(self.service.count_expenses, **_filters(query)))
+        return 200, {"count": count}
+
+    async def bulk_expenses(self, query, body):
+        action, category, adjustment = _fields(body, "action", "category", "adjustment")
+        ids, filters = _bulk_target(body)
+        if action == "delete":
+            return 200, {"deleted": await self.call(self.service.remove_expenses, ids, filters)}
+        if action == "recategorize":
+            count, rows = await self.call(self.service.recategorize_expenses, category, ids, filters)
+        elif action == "adjust":
+            count, rows = await self.call(self.service.adjust_expense_amounts, adjustment, ids, filters)
+        else:
+            raise HttpError(400, "action must be recategorize, adjust or delete")
+        return 200, {"updated": count, "expenses": rows}
+
+    async def list_budgets(self, query, body):
+        return 200, {"budgets": await self.call(self.service.list_budgets)}
+
+    async def add_budget(self, query, body):
+        category, amount, period = _fields(body, "category", "amount", "period")
+        return 201, {"budget": await self.call(self.service.insert_budget, category, amount, period or "month")}
+
+    async def update_budget(self, query, body, budget_id):
+        category, amount, period = _fields(body, "category", "amount", "period")
+        row = await self.call(self.service.save_budget, int(budget_id), category, amount, period)
+        if row is None:
+            raise HttpError(404, f"No budget {budget_id}")
+        return 200, {"budget": row}
+
+    async def delete_budget(self, query, body, budget_id):
+        if not await self.call(self.service.remove_budget, int(budget_id)):
+            raise HttpError(404, f"No budget {budget_id}")
+        return 200, {"deleted": 1}
+
+    async def bulk_budgets(self, query, body):
+        action, ids, adjustment = _fields(body, "action", "ids", "adjustment")
+        if not isinstance(ids, list):
+            raise HttpError(400, "ids must be a list")
+        if action == "delete":
+            return 200, {"deleted": await self.call(self.service.remove_budgets, ids)}
+        if action == "adjust":
+            return 200, {"budgets": await self.call(self.service.adjust_budgets, adjustment, ids)}
+        raise HttpError(400, "action must be adjust or delete")
+
+    async def category_totals(self, query, body):
+        rows = await self.call(self.service.get_category_totals, query.get("start"), query.get("end"))
+        return 200, {"totals": rows}
+
+    async def period_totals(self, query, body):
+        period = query.get("period", "month")
+        if period not in ("day", "week", "month", "year"):
+            raise HttpError(400, "period must be day, week, month or year")
+        rows = await self.call(self.service.get_period_totals, period, query.get("start"), query.get("end"),
+                               query.get("by_category") in ("1", "true"))
+        return 200, {"totals": rows}
+
+    async def budget_comparison(self, query, body):
+        rows = await self.call(self.service.get_budget_comparison, query.get("start"), query.get("end"),
+                               query.get("period"))
+        return 200, {"comparison": rows}
+
+    async def budget_forecast(self, query, body):
+        rows = await self.call(self.service.get_budget_forecast, query.get("period", "month"), query.get("on"))
+        return 200, {"forecast": rows}
+
+    async def rebuild_rollup(self, query, body):
+        return 200, {"rows": await self.call(self.service.rebuild_rollup)}
+
+    async def batch(self, query, body):
+        # Several calls in one round trip, run in order; each gets its own
+        # status so one failure does not abort the rest
+        requests = _fields(body, "requests")[0]
+        if not isinstance(requests, list) or len(requests) > MAX_BATCH:
+            raise HttpError(400, f"requests must be a list of at most {MAX_BATCH} calls")
+        responses = []
+        for request in requests:
+            method, path, request_body = _fields(request, "method", "path", "body")
+            if not isinstance(method, str) or not isinstance(path, str) or path.startswith("/batch"):
+                responses.append({"status": 400, "body": {"error": "Each call needs a method and a path"}})
+                continue
+            status, payload = await self.respond_to(method.upper(), path, request_body)
+            responses.append({"status": status, "body": payload})
+        return 200, {"responses": responses}
+
+    async def respond_to(self, method, target, body):
+        # respond() for an already-decoded body
+        return await self.respond(method, target, encode(body) if body is not None else b"")
+
+
+def serve(service, host="127.0.0.1", port=8765):
+    server = ApiServer(service, host, port)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
@@ -0,0 +1,392 @@
+import argparse
+import itertools
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime
+from decimal import Decimal
+
+from storage import create_backend
+from migrations import migrate
+from query_cache import QueryCache
+from finance_service import FinanceService
+import rollup
+from data_visualizer import DataVisualizer
+from spending_trends import TOP_CATEGORIES
+import time_series
+
+# Headless benchmarks of the app's data paths against synthetic ledgers.
+# Every case calls the same methods the GUI runs on its worker threads, and
+# charts are rendered through DataVisualizer onto an Agg canvas, so no display
+# is needed. Results go to bench_output.txt and bench_output.json; pass
+# --compare with an older JSON file to see the change per case.
+#
+#   python benchmark.py --sizes 10k 100k 1M
+#   FINANCE_BACKEND=mysql python benchmark.py --sizes 1M --compare old.json
+#
+# --load-test URL instead drives a running `main.py --serve` with concurrent
+# clients and reports latency per endpoint (the size column is the client count).
+
+logger = logging.getLogger(__name__)
+
+BENCH_DB_CONFIG = {
+    'host': 'localhost',
+    'user': 'root',
+    'password': '0000',
+    'database': 'personal_finance_bench'
+}
+
+FIRST_DAY = date(2015, 1, 1)
+# Generated ledgers span ten years from FIRST_DAY; forecasts are made part way through their last month
+FORECAST_DAY = "2024-12-17"
+# get_expenses materialises the whole ledger, skip it on the largest sizes
+FULL_SCAN_LIMIT = 1_000_000
+NOTE_WORDS = ["coffee", "lunch", "taxi", "rent", "gift", "books", "cinema", "pharmacy", "parking", "hardware"]
+# Points per line after downsampling, about the plot width of the trends tab
+TREND_POINTS = 800
+# Rows touched by each bulk edit case
+BULK_ROWS = 500
+
+
+def parse_size(value):
+    multipliers = {'k': 1_000, 'm': 1_000_000}
+    suffix = value[-1].lower()
+    if suffix in multipliers:
+        return int(float(value[:-1]) * multipliers[suffix])
+    return int(value)
+
+
+def open_storage(backend, path):
+    # A fresh, migrated schema for every ledger size
+    if backend == 'sqlite':
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+    storage = create_backend(backend, db_config=BENCH_DB_CONFIG, path=path)
+    storage.open()
+    if backend == 'mysql':
+        for table in ("expense_rollup", "expenses", "budgets", "categories", "schema_version"):
+            storage.execute(f"DROP TABLE IF EXISTS {table}")
+    migrate(storage)
+    return storage
+
+
+def generate_ledger(storage, rows, categories=200, budgets=150, days=3650, skew=1.1,
+                    seed=1, chunk_size=20000):
+    # Zipf-like category mix: a handful of categories hold most expenses and
+    # a long tail holds a few each, as in a real ledger
+    rng = random.Random(seed)
+    names = [f"Category {rank:03d}" for rank in range(categories)]
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) ** skew for rank in range(categories)))
+    first = FIRST_DAY.toordinal()
+
+    with storage.transaction() as session:
+        session.executemany(f"{storage.insert_ignore} INTO categories (name) VALUES (%s)",
+                            [(name,) for name in names])
+        session.executemany("INSERT INTO budgets (category, amount) VALUES (%s, %s)",
+                            [(name, Decimal(rng.randrange(100, 5000))) for name in names[:budgets]])
+
+    for offset in range(0, rows, chunk_size):
+        count = min(chunk_size, rows - offset)
+        # About one expense in twenty has a note
+        chunk = [(date.fromordinal(first + rng.randrange(days)).isoformat(), category,
+                  Decimal(rng.randrange(100, 50000)) / 100,
+                  " ".join(rng.sample(NOTE_WORDS, 2)) if rng.random() < 0.05 else None)
+                 for category in rng.choices(names, cum_weights=cum_weights, k=count)]
+        storage.executemany("INSERT INTO expenses (date, category, amount, note) VALUES (%s, %s, %s, %s)", chunk)
+    # Bulk-loaded behind the service's back, so the rollup is built once at the end
+    rollup.rebuild(storage)
+    return names
+
+
+def headless_visualizer(service):
+    # DataVisualizer only creates its Tk canvas when it has none, so handing
+    # it an Agg one exercises the same drawing code without a display
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    visualizer = DataVisualizer(service, None)
+    visualizer.figure = Figure(figsize=(8, 6))
+    visualizer.ax = visualizer.figure.add_subplot()
+    visualizer.canvas = FigureCanvasAgg(visualizer.figure)
+    return visualizer
+
+
+def measure(fn, repeat):
+    times = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        times.append((time.perf_counter() - started) * 1000)
+    rows = len(result) if isinstance(result, list) else None
+    return {
+        'median_ms': statistics.median(times),
+        'min_ms': min(times),
+        'max_ms': max(times),
+        'repeat': repeat,
+        'rows': rows,
+    }
+
+
+def cases(service, visualizer, cache, names, size):
+    # (name, callable) pairs; "cold" cases clear the query cache first
+    first_page = service.fetch_expense_page()
+    last_key = (str(first_page[-1][1]), first_page[-1][0]) if first_page else None
+    category_totals = service.get_category_totals()
+    # The chart compares the budgets of one period
+    comparison = service.get_budget_comparison(period="month")
+
+    def cold(fn):
+        def run():
+            cache.clear()
+            return fn()
+        return run
+
+    counter = itertools.count()
+
+    def expense_cycle():
+        expense_id = service.insert_expense("2024-06-15", names[0], Decimal("12.34"))[0]
+        service.save_expense(expense_id, "2024-06-16", names[1], Decimal("43.21"))
+        service.remove_expense(expense_id)
+
+    def budget_cycle():
+        category = f"Bench budget {next(counter)}"
+        budget_id = service.insert_budget(category, Decimal("100.00"))[0]
+        service.save_budget(budget_id, category, Decimal("200.00"))
+        service.remove_budget(budget_id)
+
+    series = time_series.daily_matrix(service.get_period_totals('day', by_category=True), top=TOP_CATEGORIES)
+
+    def trend_cycle(series):
+        days, _, matrix = series
+        for freq in time_series.FREQUENCIES:
+            periods, values = time_series.resample(days, matrix, freq)
+            x = periods.astype("int64").astype(float)
+            for y in time_series.rolling_mean(values, 4):
+                time_series.lttb(x, y, TREND_POINTS)
+
+    bulk_ids = [row[0] for row in service.fetch_expense_page(limit=BULK_ROWS)]
+    bulk_rows = [("2024-06-15", "Bench bulk", Decimal("1.00"))] * BULK_ROWS
+
+    def bulk_recategorize():
+        service.recategorize_expenses(names[next(counter) % 2], ids=bulk_ids)
+
+    def bulk_adjust():
+        service.adjust_expense_amounts("+1" if next(counter) % 2 else "-1", ids=bulk_ids)
+
+    def bulk_delete():
+        service.insert_expenses(bulk_rows)
+        service.remove_expenses(filters={'category': "Bench bulk"})
+
+    def redraw_bars():
+        visualizer.current_chart = None
+        visualizer._draw_budget_comparison(comparison)
+
+    yield "load_expenses: first page", service.fetch_expense_page
+    if last_key:
+        yield "load_expenses: next page", lambda: service.fetch_expense_page(after=last_key)
+    if size <= FULL_SCAN_LIMIT:
+        yield "get_expenses", service.get_expenses
+    yield "filtered page: category", lambda: service.fetch_expense_page(category=names[3])
+    yield "filtered page: category + year", lambda: service.fetch_expense_page(
+        category=names[3], start="2020-01-01", end="2020-12-31")
+    yield "filtered page: amount range", lambda: service.fetch_expense_page(min_amount="400", max_amount="401")
+    yield "filtered page: note search", lambda: service.fetch_expense_page(text="coff")
+    yield "filtered page: category + note", lambda: service.fetch_expense_page(category=names[0], text="taxi park")
+    yield "get_budgets (cold)", cold(service.get_budgets)
+    yield "get_budgets (cached)", service.get_budgets
+    yield "category totals (cold)", cold(service.get_category_totals)
+    yield "category totals (cached)", service.get_category_totals
+    yield "category totals, one year (cold)", cold(lambda: service.get_category_totals("2020-01-01",
+                                                                                       "2020-12-31"))
+    for period in ("day", "week", "month", "year"):
+        yield f"{period} totals (cold)", cold(lambda period=period: service.get_period_totals(period))
+    yield "month totals by category (cold)", cold(lambda: service.get_period_totals('month',
+                                                                                  by_category=True))
+    yield "budget comparison (cold)", cold(service.get_budget_comparison)
+    yield "budget forecast (cold)", cold(lambda: service.get_budget_forecast('month', FORECAST_DAY))
+    yield "budget forecast (cached)", lambda: service.get_budget_forecast('month', FORECAST_DAY)
+    yield "trend series fetch (cold)", cold(lambda: time_series.daily_matrix(
+        service.get_period_totals('day', by_category=True), top=TOP_CATEGORIES))
+    yield "trend resample + rolling + downsample", lambda: trend_cycle(series)
+    yield "render expense pie", lambda: visualizer._draw_expenses(category_totals)
+    yield "render budget bars", redraw_bars
+    yield "render budget bars (update)", lambda: visualizer._draw_budget_comparison(comparison)
+    yield "budget alerts seed (cold)", cold(service.alerts.refresh)
+    yield "expense insert/update/delete", expense_cycle
+    yield "budget insert/update/delete", budget_cycle
+    yield f"bulk recategorize ({BULK_ROWS} ids)", bulk_recategorize
+    yield f"bulk adjust amounts ({BULK_ROWS} ids)", bulk_adjust
+    yield f"batch insert + bulk delete ({BULK_ROWS})", bulk_delete
+
+
+def run(backend, sizes, repeat, path):
+    results = []
+    for size in sizes:
+        storage = open_storage(backend, path)
+        try:
+            started = time.perf_counter()
+            names = generate_ledger(storage, size)
+            generated = time.perf_counter() - started
+            logger.info("Generated %d expenses in %.1f s", size, generated)
+            results.append({'size': size, 'case': "generate ledger", 'median_ms': generated * 1000,
+                            'min_ms': generated * 1000, 'max_ms': generated * 1000, 'repeat': 1,
+                            'rows': size})
+
+            cache = QueryCache()
+            service = FinanceService(storage, cache)
+            visualizer = headless_visualizer(service)
+            for name, fn in cases(service, visualizer, cache, names, size):
+                result = measure(fn, repeat)
+                result.update(size=size, case=name)
+                results.append(result)
+                logger.info("%9d  %-36s %10.2f ms", size, name, result['median_ms'])
+        finally:
+            storage.close()
+    return results
+
+
+def load_test(url, clients, requests, seed=1):
+    # Each client thread has its own connection and runs a read-heavy mix:
+    # expense pages, aggregations and the occasional 50-row batch insert
+    from concurrent.futures import ThreadPoolExecutor
+    from api_client import ApiClient
+
+    samples = {}
+    lock = threading.Lock()
+
+    def client(number):
+        api = ApiClient(url)
+        rng = random.Random(seed + number)
+        local = {}
+        for _ in range(requests):
+            roll = rng.random()
+            if roll < 0.6:
+                name, fn = "api: expense page", api.fetch_expense_page
+            elif roll < 0.75:
+                name, fn = "api: category totals", api.get_category_totals
+            elif roll < 0.85:
+                name, fn = "api: month totals", api.get_period_totals
+            elif roll < 0.95:
+                name, fn = "api: budget comparison", api.get_budget_comparison
+            else:
+                rows = [(f"2024-{rng.randrange(1, 13):02d}-15", f"Load test {rng.randrange(20)}",
+                         Decimal(rng.randrange(100, 50000)) / 100) for _ in range(50)]
+                name, fn = "api: batch insert (50 rows)", lambda rows=rows: api.insert_expenses(rows)
+            started = time.perf_counter()
+            fn()
+            local.setdefault(name, []).append((time.perf_counter() - started) * 1000)
+        api.close()
+        with lock:
+            for name, times in local.items():
+                samples.setdefault(name, []).extend(times)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        list(executor.map(client, range(clients)))
+    elapsed = time.perf_counter() - started
+    logger.info("%d requests from %d clients in %.1f s (%.0f requests/s)", clients * requests, clients, elapsed,
+                clients * requests / elapsed)
+
+    results = []
+    for name, times in sorted(samples.items()):
+        times.sort()
+        results.append({'size': clients, 'case': name, 'median_ms': statistics.median(times),
+                        'min_ms': times[0], 'max_ms': times[-1], 'repeat': len(times),
+                        'p95_ms': times[int(0.95 * (len(times) - 1))], 'rows': None})
+    return results, clients * requests / elapsed
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def format_report(report, baseline=None):
+    previous = {}
+    if baseline:
+        previous = {(row['size'], row['case']): row['median_ms'] for row in baseline['results']}
+
+    lines = [f"backend={report['backend']} revision={report['revision']} python={report['python']} "
+             f"at {report['timestamp']}"]
+    if 'requests_per_second' in report:
+        lines.append(f"{report['requests_per_second']:.0f} requests/s"
+                     + (f" (was {baseline['requests_per_second']:.0f})"
+                        if baseline and 'requests_per_second' in baseline else ""))
+    if baseline:
+        lines.append(f"compared with revision={baseline.get('revision')} at {baseline.get('timestamp')}")
+    lines.append(f"{'size':>9}  {'case':<36} {'median ms':>10} {'min ms':>10} {'rows':>8}"
+                 + (f" {'change':>8}" if baseline else ""))
+    for row in report['results']:
+        line = (f"{row['size']:>9}  {row['case']:<36} {row['median_ms']:>10.2f} {row['min_ms']:>10.2f} "
+                f"{'' if row['rows'] is None else row['rows']:>8}")
+        before = previous.get((row['size'], row['case']))
+        if before:
+            line += f" {(row['median_ms'] - before) / before:>+8.1%}"
+        lines.append(line)
+    return "\n".join(lines) + "\n"
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the finance data paths on synthetic ledgers")
+    parser.add_argument("--sizes", nargs="+", default=["10k", "100k"], type=parse_size,
+                        help="ledger sizes to generate, e.g. 10k 1M 10M (default: 10k 100k)")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per case; the median is reported")
+    parser.add_argument("--backend", default=os.environ.get('FINANCE_BACKEND', 'sqlite'),
+                        choices=("sqlite", "mysql"))
+    parser.add_argument("--db-path", default=os.path.join(tempfile.gettempdir(), "finance_bench.db"),
+                        help="SQLite file to generate ledgers into; it is overwritten")
+    parser.add_argument("--output", default="bench_output.txt",
+                        help="text report; the JSON results are written next to it")
+    parser.add_argument("--compare", metavar="JSON", help="earlier JSON results to compare against")
+    parser.add_argument("--load-test", metavar="URL", help="load-test the API server at URL instead")
+    parser.add_argument("--clients", type=int, default=16, help="concurrent clients for --load-test")
+    parser.add_argument("--requests", type=int, default=200, help="requests per client for --load-test")
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = parse_args(argv)
+    throughput = None
+    if args.load_test:
+        results, throughput = load_test(args.load_test, args.clients, args.requests)
+    else:
+        results = run(args.backend, args.sizes, args.repeat, args.db_path)
+    report = {
+        'backend': f"api {args.load_test}" if args.load_test else args.backend,
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'timestamp': datetime.now().isoformat(timespec="seconds"),
+        'results': results,
+    }
+    if throughput is not None:
+        report['requests_per_second'] = throughput
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    text = format_report(report, baseline)
+    with open(args.output, "w", encoding="utf-8") as f:
+        f.write(text)
+    with open(os.path.splitext(args.output)[0] + ".json", "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(text, end="")
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,170 @@
+import logging
+import threading
+from datetime import date
+from decimal import Decimal
+from finance_service import CENT
+from storage import StorageError
+
+# Budget threshold alerts without a query per write. Spending per category for
+# the current week, month and year is seeded from aggregate reads and then
+# moved by every expense write in O(1), so crossing a threshold is noticed on
+# the write that caused it. Writes that change many rows at once re-seed.
+# A write racing a re-seed can be counted twice or not at all until the next
+# one (at the latest the next day); alerts are advisory.
+
+logger = logging.getLogger(__name__)
+
+# Percentages of a budget that raise an alert, each at most once per period
+THRESHOLDS = (80, 100)
+
+
+class BudgetAlerts:
+    def __init__(self, load, thresholds=THRESHOLDS, today=date.today):
+        # load(day) returns (bounds, budgets, totals) for the periods holding
+        # day: bounds as {period: (start, end)} 'YYYY-MM-DD' strings, budgets
+        # as (id, category, amount, period) rows and totals as
+        # {period: {category: spent}}
+        self.load = load
+        self.thresholds = thresholds
+        self.today = today
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._day = None
+        self._bounds = {}
+        # (category, period) -> (budget id, amount), budgets being unique per
+        # category and period, and budget id -> (category, period)
+        self._budgets = {}
+        self._keys = {}
+        self._spent = {}
+        # (category, period) -> number of thresholds already announced this period
+        self._levels = {}
+
+    def add_listener(self, callback):
+        # callback(alerts) runs on the thread that made the write, with a list of
+        # {"category", "period", "threshold", "spent", "budget"} dicts
+        self._listeners.append(callback)
+
+    def refresh(self, changes=()):
+        # Re-seeds from the database. Budgets that crossed a threshold since the
+        # last seed of the same period are announced; ones already past it at
+        # startup or at the start of a new period are not. changes are writes
+        # (as for apply) already committed, so included in what is read; they
+        # are taken out to set the starting levels and announced like apply.
+        day = self.today()
+        try:
+            bounds, budgets, totals = self.load(day)
+        except StorageError as e:
+            logger.warning("Budget alerts not refreshed: %s", e)
+            return
+        fired = []
+        with self._lock:
+            old_bounds, old_budgets, old_levels = self._bounds, self._budgets, self._levels
+            self._day = day
+            self._bounds = bounds
+            self._budgets = {(category, period): (int(budget_id), Decimal(str(amount)))
+                             for budget_id, category, amount, period in budgets}
+            self._keys = {budget_id: key for key, (budget_id, _) in self._budgets.items()}
+            self._spent = {period: {category: Decimal(str(spent)) for category, spent in totals[period].items()}
+                           for period in bounds}
+            self._levels = {}
+            self._move(changes, -1)
+            for key in self._budgets:
+                same_period = key in old_budgets and old_bounds.get(key[1]) == bounds[key[1]]
+                if same_period and key in old_levels:
+                    self._levels[key] = old_levels[key]
+                    self._check(key, fired)
+                else:
+                    self._levels[key] = self._level(key)
+            for key in self._move(changes, 1):
+                self._check(key, fired)
+        self._notify(fired)
+
+    def apply(self, changes):
+        # changes are (old, new) pairs of (date, category, amount) before and
+        # after a write; old is None for inserts and new is None for deletes
+        if self._day != self.today():
+            # First use or a new day, when the week, month or year may have
+            # rolled over: the new seed already holds these changes
+            self.refresh(changes)
+            return
+        fired = []
+        with self._lock:
+            # Checked once all deltas are in, so moving an expense within a
+            # category cannot dip below a threshold and announce it again
+            for key in self._move(changes, 1):
+                self._check(key, fired)
+        self._notify(fired)
+
+    def budgets_saved(self, rows):
+        # (id, category, amount, period) rows of inserted or updated budgets
+        if self._day != self.today():
+            self.refresh()
+            return
+        fired = []
+        with self._lock:
+            for budget_id, category, amount, period in rows:
+                self._forget(int(budget_id))
+                self._budgets[(category, period)] = (int(budget_id), Decimal(str(amount)))
+                self._keys[int(budget_id)] = (category, period)
+                self._check((category, period), fired)
+        self._notify(fired)
+
+    def budgets_removed(self, budget_ids):
+        with self._lock:
+            for budget_id in budget_ids:
+                self._forget(int(budget_id))
+
+    def _forget(self, budget_id):
+        key = self._keys.pop(budget_id, None)
+        if key is not None:
+            self._budgets.pop(key, None)
+            self._levels.pop(key, None)
+
+    def _move(self, changes, direction):
+        # Applies (direction=1) or takes back (direction=-1) (old, new) changes;
+        # returns the (category, period) budgets whose spending moved
+        touched = set()
+        for old, new in changes:
+            for row, sign in ((old, -direction), (new, direction)):
+                if row is not None:
+                    touched.update(self._add(row, sign))
+        return touched
+
+    def _add(self, row, sign):
+        # Moves the category's spending in every period holding the date;
+        # returns the budgets of the category for those periods
+        day, category, amount = row
+        day = str(day)[:10]
+        amount = sign * Decimal(str(amount))
+        keys = []
+        for period, (start, end) in self._bounds.items():
+            if start <= day <= end:
+                spent = self._spent[period]
+                spent[category] = spent.get(category, Decimal(0)) + amount
+                if (category, period) in self._budgets:
+                    keys.append((category, period))
+        return keys
+
+    def _level(self, key):
+        category, period = key
+        amount = self._budgets[key][1]
+        if amount <= 0:
+            return 0
+        spent = self._spent.get(period, {}).get(category, Decimal(0))
+        return sum(1 for threshold in self.thresholds if spent * 100 >= amount * threshold)
+
+    def _check(self, key, fired):
+        # Announces the highest threshold newly crossed; dropping back below
+        # one re-arms it
+        level = self._level(key)
+        if level > self._levels.get(key, 0):
+            category, period = key
+            fired.append({"category": category, "period": period, "threshold": self.thresholds[level - 1],
+                          "spent": self._spent[period].get(category, Decimal(0)).quantize(CENT),
+                          "budget": self._budgets[key][1].quantize(CENT)})
+        self._levels[key] = level
+
+    def _notify(self, fired):
+        if fired:
+            for callback in self._listeners:
+                callback(fired)
@@ -1,32 +1,13 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
-import mysql.connector
-from mysql.connector import Error
+from storage import DuplicateKeyError
+from finance_service import validate_budget, parse_adjustment, ValidationError, BUDGET_PERIODS, budget_order
 
 class BudgetManager:
-    def __init__(self, db_config):
-        self.db_config = db_config
-        self.create_table()
-
-    def create_table(self):
-        try:
-            conn = mysql.connector.connect(**self.db_config)
-            if conn.is_connected():
-                cursor = conn.cursor()
-                cursor.execute('''
-                CREATE TABLE IF NOT EXISTS budgets (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    category VARCHAR(255) UNIQUE,
-                    amount DECIMAL(10, 2)
-                )
-                ''')
-                conn.commit()
-        except Error as e:
-            messagebox.showerror("Database Error", f"Error creating budgets table: {e}")
-        finally:
-            if conn.is_connected():
-                cursor.close()
-                conn.close()
+    def __init__(self, service, runner):
+        # service is a FinanceService or an ApiClient for a remote server
+        self.service = service
+        self.runner = runner
 
     def create_widgets(self, parent):
         self.parent = parent
@@ -39,160 +20,176 @@ class BudgetManager:
         self.amount_entry = ttk.Entry(parent)
         self.amount_entry.grid(row=1, column=1, padx=5, pady=5)
 
-        ttk.Button(parent, text="Set Budget", command=self.set_budget).grid(row=2, column=0, pady=10)
-        ttk.Button(parent, text="Update Budget", command=self.update_budget).grid(row=2, column=1, pady=10)
+        ttk.Label(parent, text="Per:").grid(row=2, column=0, padx=5, pady=5)
+        self.period = tk.StringVar(value="month")
+        ttk.Combobox(parent, textvariable=self.period, values=BUDGET_PERIODS, state="readonly",
+                     width=8).grid(row=2, column=1, padx=5, pady=5, sticky="w")
 
-        self.tree = ttk.Treeview(parent, columns=("ID", "Category", "Budget Amount"), show="headings")
+        ttk.Button(parent, text="Set Budget", command=self.set_budget).grid(row=3, column=0, pady=10)
+        ttk.Button(parent, text="Update Budget", command=self.update_budget).grid(row=3, column=1, pady=10)
+
+        self.tree = ttk.Treeview(parent, columns=("ID", "Category", "Budget Amount", "Period"), show="headings",
+                                 selectmode="extended")
         self.tree.heading("ID", text="ID")
         self.tree.heading("Category", text="Category")
         self.tree.heading("Budget Amount", text="Budget Amount")
-        self.tree.grid(row=3, column=0, columnspan=2, padx=5, pady=5)
+        self.tree.heading("Period", text="Period")
+        self.tree.grid(row=4, column=0, columnspan=2, padx=5, pady=5)
 
         self.tree.bind("<<TreeviewSelect>>", self.item_selected)
 
-        ttk.Button(parent, text="Delete Budget", command=self.delete_budget).grid(row=4, column=0, columnspan=2, pady=10)
+        # Delete and adjust act on every selected budget in one statement
+        bulk = ttk.Frame(parent)
+        bulk.grid(row=5, column=0, columnspan=2, pady=10)
+        ttk.Button(bulk, text="Delete Selected", command=self.delete_budget).grid(row=0, column=0, padx=5)
+        ttk.Label(bulk, text="Adjust by:").grid(row=0, column=1, padx=(10, 2))
+        self.adjust_entry = ttk.Entry(bulk, width=8)
+        self.adjust_entry.grid(row=0, column=2)
+        ttk.Button(bulk, text="Adjust Budgets", command=self.adjust_budgets).grid(row=0, column=3, padx=5)
 
         self.load_budgets()
 
     def set_budget(self):
-        category = self.category_entry.get()
-        amount = self.amount_entry.get()
-
-        if not category or not amount:
-            messagebox.showerror("Error", "Please fill in all fields")
-            return
-
         try:
-            amount = float(amount)
-        except ValueError:
-            messagebox.showerror("Error", "Budget amount must be a number")
+            category, amount, period = validate_budget(self.category_entry.get(), self.amount_entry.get(),
+                                                       self.period.get())
+        except ValidationError as e:
+            messagebox.showerror("Error", str(e))
             return
 
-        try:
-            conn = mysql.connector.connect(**self.db_config)
-            if conn.is_connected():
-                cursor = conn.cursor()
-                cursor.execute("INSERT INTO budgets (category, amount) VALUES (%s, %s)",
-                               (category, amount))
-                conn.commit()
-                messagebox.showinfo("Success", "Budget set successfully")
-        except Error as e:
-            if e.errno == 1062:
-                messagebox.showerror("Error", "Category already exists. Use 'Update Budget' to modify.")
-            else:
-                messagebox.showerror("Database Error", f"Error setting budget: {e}")
-        finally:
-            if conn.is_connected():
-                cursor.close()
-                conn.close()
+        self.runner.submit(self.service.insert_budget, category, amount, period,
+                           on_success=lambda row: self._row_saved(row, "Budget set successfully"),
+                           on_error=self._budget_error("setting budget"))
 
-        self.load_budgets()
-        self.clear_entries()
+    def _budget_error(self, action):
+        def show(e):
+            if isinstance(e, DuplicateKeyError):
+                messagebox.showerror("Error", "This category already has a budget for that period. "
+                                              "Select it and use 'Update Budget' to modify it.")
+            else:
+                messagebox.showerror("Database Error", f"Error {action}: {e}")
+        return show
 
     def update_budget(self):
         selected_item = self.tree.selection()
-        if not selected_item:
-            messagebox.showerror("Error", "Please select a budget to update")
+        if len(selected_item) != 1:
+            messagebox.showerror("Error", "Please select one budget to update")
             return
 
         budget_id = self.tree.item(selected_item)['values'][0]
-        category = self.category_entry.get()
-        amount = self.amount_entry.get()
+        try:
+            category, amount, period = validate_budget(self.category_entry.get(), self.amount_entry.get(),
+                                                       self.period.get())
+        except ValidationError as e:
+            messagebox.showerror("Error", str(e))
+            return
+
+        self.runner.submit(self.service.save_budget, budget_id, category, amount, period,
+                           on_success=lambda row: self._row_saved(row, "Budget updated successfully"),
+                           on_error=self._budget_error("updating budget"))
 
-        if not category or not amount:
-            messagebox.showerror("Error", "Please fill in all fields")
+    def delete_budget(self):
+        budget_ids = [int(iid) for iid in self.tree.selection()]
+        if not budget_ids:
+            messagebox.showerror("Error", "Please select one or more budgets to delete")
             return
 
+        question = f"Are you sure you want to delete {self._describe(budget_ids)}?"
+        if messagebox.askyesno("Confirm Delete", question):
+            self.runner.submit(self.service.remove_budgets, budget_ids,
+                               on_success=lambda count: self._rows_deleted(budget_ids, count),
+                               on_error=self._db_error("deleting budgets"))
+
+    def adjust_budgets(self):
+        budget_ids = [int(iid) for iid in self.tree.selection()]
+        adjustment = self.adjust_entry.get().strip()
+        if not budget_ids:
+            messagebox.showerror("Error", "Please select one or more budgets to adjust")
+            return
         try:
-            amount = float(amount)
-        except ValueError:
-            messagebox.showerror("Error", "Budget amount must be a number")
+            parse_adjustment(adjustment)
+        except ValidationError as e:
+            messagebox.showerror("Error", str(e))
             return
 
-        try:
-            conn = mysql.connector.connect(**self.db_config)
-            if conn.is_connected():
-                cursor = conn.cursor()
-                cursor.execute("UPDATE budgets SET category=%s, amount=%s WHERE id=%s",
-                               (category, amount, budget_id))
-                conn.commit()
-                messagebox.showinfo("Success", "Budget updated successfully")
-        except Error as e:
-            messagebox.showerror("Database Error", f"Error updating budget: {e}")
-        finally:
-            if conn.is_connected():
-                cursor.close()
-                conn.close()
+        if messagebox.askyesno("Confirm", f"Adjust {self._describe(budget_ids)} by {adjustment}?"):
+            self.runner.submit(self.service.adjust_budgets, adjustment, budget_ids,
+                               on_success=self._rows_adjusted,
+                               on_error=self._db_error("adjusting budgets"))
 
-        self.load_budgets()
+    def _describe(self, budget_ids):
+        return "this budget" if len(budget_ids) == 1 else f"these {len(budget_ids)} budgets"
+
+    # Mutations patch only the affected items instead of reloading the list
+    def _row_saved(self, row, message):
+        # None means the budget was deleted elsewhere in the meantime
+        if row is None:
+            self.load_budgets()
+        else:
+            self.place_row(row)
+        messagebox.showinfo("Success", message)
         self.clear_entries()
 
-    def delete_budget(self):
-        selected_item = self.tree.selection()
-        if not selected_item:
-            messagebox.showerror("Error", "Please select a budget to delete")
-            return
+    def _rows_adjusted(self, rows):
+        # Amounts only; categories and so the order are unchanged
+        for row in rows:
+            if self.tree.exists(str(row[0])):
+                self.tree.item(str(row[0]), values=row)
+        messagebox.showinfo("Success", f"{len(rows)} budget(s) adjusted")
 
-        budget_id = self.tree.item(selected_item)['values'][0]
+    def _rows_deleted(self, budget_ids, count):
+        self.tree.delete(*[str(budget_id) for budget_id in budget_ids if self.tree.exists(str(budget_id))])
+        messagebox.showinfo("Success", f"{count} budget(s) deleted")
+        self.clear_entries()
+
+    def place_row(self, row):
+        # Keeps the list in the budget_order() list_budgets returns it in
+        iid = str(row[0])
+        existing = self.tree.exists(iid)
+        if existing:
+            self.tree.detach(iid)
+
+        children = self.tree.get_children()
+        key = budget_order(row[1], row[0])
+        low, high = 0, len(children)
+        while low < high:
+            middle = (low + high) // 2
+            if budget_order(self.tree.set(children[middle], "Category"), children[middle]) < key:
+                low = middle + 1
+            else:
+                high = middle
 
-        if messagebox.askyesno("Confirm Delete", "Are you sure you want to delete this budget?"):
-            try:
-                conn = mysql.connector.connect(**self.db_config)
-                if conn.is_connected():
-                    cursor = conn.cursor()
-                    cursor.execute("DELETE FROM budgets WHERE id=%s", (budget_id,))
-                    conn.commit()
-                    messagebox.showinfo("Success", "Budget deleted successfully")
-            except Error as e:
-                messagebox.showerror("Database Error", f"Error deleting budget: {e}")
-            finally:
-                if conn.is_connected():
-                    cursor.close()
-                    conn.close()
+        if existing:
+            self.tree.item(iid, values=row)
+            self.tree.move(iid, "", low)
+        else:
+            self.tree.insert("", low, iid=iid, values=row)
 
-            self.load_budgets()
-            self.clear_entries()
+    def _db_error(self, action):
+        return lambda e: messagebox.showerror("Database Error", f"Error {action}: {e}")
 
     def load_budgets(self):
+        self.runner.submit(self.service.list_budgets,
+                           key="load_budgets",
+                           on_success=self._show_budgets,
+                           on_error=self._db_error("loading budgets"))
+
+    def _show_budgets(self, rows):
         self.tree.delete(*self.tree.get_children())
-        try:
-            conn = mysql.connector.connect(**self.db_config)
-            if conn.is_connected():
-                cursor = conn.cursor()
-                cursor.execute("SELECT id, category, amount FROM budgets ORDER BY category")
-                for row in cursor.fetchall():
-                    self.tree.insert("", "end", values=row)
-        except Error as e:
-            messagebox.showerror("Database Error", f"Error loading budgets: {e}")
-        finally:
-            if conn.is_connected():
-                cursor.close()
-                conn.close()
+        for row in rows:
+            self.tree.insert("", "end", iid=str(row[0]), values=row)
 
     def clear_entries(self):
         self.category_entry.delete(0, tk.END)
         self.amount_entry.delete(0, tk.END)
+        self.period.set("month")
 
     def item_selected(self, event):
         selected_item = self.tree.selection()
-        if selected_item:
+        if len(selected_item) == 1:
             values = self.tree.item(selected_item)['values']
             self.category_entry.delete(0, tk.END)
             self.category_entry.insert(0, values[1])
             self.amount_entry.delete(0, tk.END)
             self.amount_entry.insert(0, values[2])
-
-    def get_budgets(self):
-        try:
-            conn = mysql.connector.connect(**self.db_config)
-            if conn.is_connected():
-                cursor = conn.cursor()
-                cursor.execute("SELECT category, amount FROM budgets ORDER BY category")
-                return cursor.fetchall()
-        except Error as e:
-            messagebox.showerror("Database Error", f"Error getting budgets: {e}")
-            return []
-        finally:
-            if conn.is_connected():
-                cursor.close()
-                conn.close()
\ No newline at end of file
+            self.period.set(values[3])
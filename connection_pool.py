@@ -0,0 +1,153 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+class PoolTimeoutError(Exception):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, connect, size=5, timeout=10.0, ping_interval=30.0, ping=None, is_fatal=None):
+        # connect() opens a new DB-API connection; ping(conn) returns False for
+        # a dead handle; is_fatal(exc) tells whether an error poisoned the socket
+        self.connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+        self.ping = ping
+        self.is_fatal = is_fatal
+
+        # LIFO so the most recently used (likeliest still alive) handle goes out
+        # first. Waiters sleep on _available, which is notified whenever a
+        # handle comes back or a slot is freed, so either can serve them.
+        self._idle = []
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._open = 0
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'reconnects': 0,
+            'created': 0,
+            'discarded': 0,
+        }
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def _create(self):
+        conn = self.connect()
+        self._count('created')
+        return conn
+
+    def _release_slot(self):
+        with self._available:
+            self._open -= 1
+            self._available.notify()
+
+    def _checkout(self):
+        # An idle (conn, last_used), or None once a slot for a new connection
+        # is reserved; waits up to the timeout for either
+        deadline = None
+        with self._available:
+            while True:
+                if self._idle:
+                    return self._idle.pop()
+                if self._open < self.size:
+                    self._open += 1
+                    return None
+                if deadline is None:
+                    self._stats['waits'] += 1
+                    deadline = time.monotonic() + self.timeout
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeoutError(f"No database connection available after {self.timeout}s")
+                self._available.wait(remaining)
+
+    def acquire(self):
+        idle = self._checkout()
+        if idle is None:
+            try:
+                conn = self._create()
+            except Exception:
+                self._release_slot()
+                raise
+            last_used = time.monotonic()
+        else:
+            conn, last_used = idle
+
+        # Only handles that sat idle for a while pay for a health-check round-trip
+        if self.ping and time.monotonic() - last_used > self.ping_interval:
+            conn = self._revive(conn)
+
+        self._count('checkouts')
+        return conn
+
+    def _revive(self, conn):
+        try:
+            if self.ping(conn):
+                return conn
+        except Exception:
+            pass
+        self._count('reconnects')
+        self._close_quietly(conn)
+        try:
+            return self._create()
+        except Exception:
+            self._release_slot()
+            raise
+
+    def release(self, conn, broken=False):
+        if broken:
+            self._discard(conn)
+            return
+        try:
+            # Leave no half-finished transaction behind for the next borrower
+            if conn.in_transaction:
+                conn.rollback()
+        except Exception:
+            self._discard(conn)
+            return
+        with self._available:
+            self._idle.append((conn, time.monotonic()))
+            self._available.notify()
+
+    def _discard(self, conn):
+        self._count('discarded')
+        self._release_slot()
+        self._close_quietly(conn)
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        except BaseException as e:
+            self.release(conn, broken=bool(self.is_fatal and self.is_fatal(e)))
+            raise
+        else:
+            self.release(conn)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['open'] = self._open
+            stats['idle'] = len(self._idle)
+        return stats
+
+    def close(self):
+        with self._available:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+            self._available.notify_all()
+        for conn, _ in idle:
+            self._close_quietly(conn)
@@ -1,65 +1,211 @@
 import tkinter as tk
-from tkinter import ttk
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from collections import defaultdict
-from decimal import Decimal
+from tkinter import ttk, messagebox, filedialog
+from instrumentation import metrics
+from finance_service import BUDGET_PERIODS, period_bounds, validate_date_range, ValidationError
+from datetime import date
+import time
 
 class DataVisualizer:
-    def __init__(self, expense_tracker, budget_manager):
-        self.expense_tracker = expense_tracker
-        self.budget_manager = budget_manager
+    def __init__(self, service, runner):
+        self.service = service
+        self.runner = runner
+
+        # One Figure/canvas for the lifetime of the tab. Figures are created
+        # directly rather than through pyplot so nothing registers them with
+        # pyplot's global figure manager. matplotlib itself is the slowest
+        # import in the app, so it is only loaded once the tab is first opened.
+        self.figure = None
+        self.ax = None
+        self.canvas = None
+        self.current_chart = None
+        self.bars = None
+        self.draw_requested = None
 
     def create_widgets(self, parent):
         self.parent = parent
 
+        range_frame = ttk.Frame(parent)
+        range_frame.pack(pady=5)
+        ttk.Label(range_frame, text="From:").grid(row=0, column=0, padx=5)
+        self.start_entry = ttk.Entry(range_frame, width=12)
+        self.start_entry.grid(row=0, column=1, padx=5)
+        ttk.Label(range_frame, text="To:").grid(row=0, column=2, padx=5)
+        self.end_entry = ttk.Entry(range_frame, width=12)
+        self.end_entry.grid(row=0, column=3, padx=5)
+        ttk.Label(range_frame, text="Budgets per:").grid(row=0, column=4, padx=5)
+        self.period = tk.StringVar(value="month")
+        ttk.Combobox(range_frame, textvariable=self.period, values=BUDGET_PERIODS, state="readonly",
+                     width=8).grid(row=0, column=5, padx=5)
+
         ttk.Button(parent, text="Visualize Expenses", command=self.visualize_expenses).pack(pady=10)
-        ttk.Button(parent, text="Compare to Budget", command=self.compare_to_budget).pack(pady=10)
+        chart_frame = ttk.Frame(parent)
+        chart_frame.pack(pady=5)
+        ttk.Button(chart_frame, text="Compare to Budget", command=self.compare_to_budget).grid(row=0, column=0, padx=5)
+        ttk.Button(chart_frame, text="Forecast Period End",
+                   command=self.forecast_budgets).grid(row=0, column=1, padx=5)
+
+        export_frame = ttk.Frame(parent)
+        export_frame.pack(pady=5)
+        ttk.Button(export_frame, text="Export Expenses...", command=self.export_expenses).grid(row=0, column=0, padx=5)
+        ttk.Button(export_frame, text="Export Budget Report...",
+                   command=self.export_budget_report).grid(row=0, column=1, padx=5)
 
         self.canvas_frame = ttk.Frame(parent)
         self.canvas_frame.pack(expand=True, fill="both")
+        self._ensure_canvas()
+
+    def _date_range(self):
+        # Empty bounds mean open-ended; returns None if either bound is malformed
+        try:
+            return validate_date_range(self.start_entry.get().strip(), self.end_entry.get().strip())
+        except ValidationError as e:
+            messagebox.showerror("Error", str(e))
+            return None
+
+    def _export_path(self, title):
+        return filedialog.asksaveasfilename(
+            title=title, defaultextension=".csv",
+            filetypes=[("CSV", "*.csv"), ("Parquet", "*.parquet")])
+
+    def export_expenses(self):
+        bounds = self._date_range()
+        path = bounds is not None and self._export_path("Export expenses")
+        if not path:
+            return
+        self.runner.submit(self.service.export_expenses, path, *bounds, key="export",
+                           on_success=lambda count: messagebox.showinfo("Export Complete",
+                                                                        f"Exported {count} expenses"),
+                           on_error=self._export_error)
+
+    def export_budget_report(self):
+        bounds = self._date_range()
+        path = bounds is not None and self._export_path("Export budget report")
+        if not path:
+            return
+        self.runner.submit(self.service.export_budget_report, path, *bounds, None, self.period.get(), key="export",
+                           on_success=lambda count: messagebox.showinfo("Export Complete",
+                                                                        f"Exported {count} budget rows"),
+                           on_error=self._export_error)
+
+    def _export_error(self, e):
+        messagebox.showerror("Export Error", f"Error exporting: {e}")
+
+    def _chart_error(self, e):
+        messagebox.showerror("Database Error", f"Error loading chart data: {e}")
 
     def visualize_expenses(self):
-        expenses = self.expense_tracker.get_expenses()
-        categories = defaultdict(float)
-
-        for date, category, amount in expenses:
-            categories[category] += float(amount)
-
-        fig, ax = plt.subplots(figsize=(8, 6))
-        ax.pie(categories.values(), labels=categories.keys(), autopct='%1.1f%%')
-        ax.set_title("Expense Distribution by Category")
-
-        self.display_chart(fig)
+        bounds = self._date_range()
+        if bounds is None:
+            return
+        # Both charts share a key so a newer click supersedes a pending one
+        self.runner.submit(self.service.get_category_totals, *bounds, key="chart",
+                           on_success=self._draw_expenses, on_error=self._chart_error)
 
     def compare_to_budget(self):
-        expenses = self.expense_tracker.get_expenses()
-        budgets = dict(self.budget_manager.get_budgets())
-
-        categories = defaultdict(float)
-        for date, category, amount in expenses:
-            categories[category] += float(amount)
-
-        fig, ax = plt.subplots(figsize=(10, 6))
-        x = list(budgets.keys())
-        budget_amounts = [budgets[cat] for cat in x]
-        expense_amounts = [categories[cat] for cat in x]
-
-        ax.bar(x, budget_amounts, label="Budget")
-        ax.bar(x, expense_amounts, label="Actual Expenses")
-        ax.set_ylabel("Amount")
-        ax.set_title("Budget vs Actual Expenses by Category")
-        ax.legend()
-
-        plt.xticks(rotation=45, ha='right')
-        plt.tight_layout()
-
-        self.display_chart(fig)
-
-    def display_chart(self, figure):
-        for widget in self.canvas_frame.winfo_children():
-            widget.destroy()
-
-        canvas = FigureCanvasTkAgg(figure, master=self.canvas_frame)
-        canvas.draw()
-        canvas.get_tk_widget().pack(expand=True, fill="both")
\ No newline at end of file
+        # Budgets of the chosen period against spending in the dates given,
+        # or in the current period when both are left empty
+        bounds = self._date_range()
+        if bounds is None:
+            return
+        period = self.period.get()
+        if bounds == [None, None]:
+            bounds = [day.isoformat() for day in period_bounds(date.today(), period)]
+        self.runner.submit(self.service.get_budget_comparison, *bounds, period, key="chart",
+                           on_success=self._draw_budget_comparison, on_error=self._chart_error)
+
+    def forecast_budgets(self):
+        self.runner.submit(self.service.get_budget_forecast, self.period.get(), key="chart",
+                           on_success=self._draw_forecast, on_error=self._chart_error)
+
+    def _ensure_canvas(self):
+        if self.canvas is None:
+            from matplotlib.figure import Figure
+            from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+
+            self.figure = Figure(figsize=(8, 6))
+            self.ax = self.figure.add_subplot()
+            self.canvas = FigureCanvasTkAgg(self.figure, master=self.canvas_frame)
+            self.canvas.get_tk_widget().pack(expand=True, fill="both")
+            self.canvas.mpl_connect("draw_event", self._chart_drawn)
+
+    def _reset_axes(self, chart):
+        self._ensure_canvas()
+        self.ax.clear()
+        self.current_chart = chart
+        self.bars = None
+
+    def _draw_expenses(self, totals):
+        # Exact DECIMAL sums are only converted to float for plotting
+        self._reset_axes(("pie",))
+        self.ax.pie([float(total) for _, total in totals], labels=[category for category, _ in totals],
+                    autopct='%1.1f%%')
+        self.ax.set_title("Expense Distribution by Category")
+
+        self.display_chart()
+
+    def _draw_budget_comparison(self, rows):
+        # Budgets of one period, so each category has a single bar pair
+        x = [category for category, _, _, _ in rows]
+        budget_amounts = [float(budget) for _, _, budget, _ in rows]
+        expense_amounts = [float(spent) for _, _, _, spent in rows]
+
+        chart = ("budget", tuple(x))
+        if chart == self.current_chart:
+            # Same categories as on screen: only the bar heights change
+            for bars, heights in zip(self.bars, (budget_amounts, expense_amounts)):
+                for rect, height in zip(bars, heights):
+                    rect.set_height(height)
+            self.ax.relim()
+            self.ax.autoscale_view()
+        else:
+            self._reset_axes(chart)
+            self.bars = (self.ax.bar(x, budget_amounts, label="Budget"),
+                         self.ax.bar(x, expense_amounts, label="Actual Expenses"))
+            self.ax.set_ylabel("Amount")
+            self.ax.set_title("Budget vs Actual Expenses by Category")
+            self.ax.legend()
+            self.ax.tick_params(axis="x", labelrotation=45)
+            for label in self.ax.get_xticklabels():
+                label.set_horizontalalignment("right")
+            self.figure.tight_layout()
+
+        self.display_chart()
+
+    def _draw_forecast(self, rows):
+        # Budget, spent so far and projected period-end spend; projected
+        # overruns are drawn in red
+        x = [category for category, _, _, _ in rows]
+        budgets = [float(budget) for _, budget, _, _ in rows]
+        spent = [float(so_far) for _, _, so_far, _ in rows]
+        projected = [float(total) for _, _, _, total in rows]
+
+        self._reset_axes(("forecast", tuple(x)))
+        positions = range(len(x))
+        self.ax.bar([p - 0.27 for p in positions], budgets, width=0.27, label="Budget")
+        self.ax.bar(positions, spent, width=0.27, label="Spent so far")
+        self.ax.bar([p + 0.27 for p in positions], projected, width=0.27, label="Projected",
+                    color=["tab:red" if total > budget else "tab:gray"
+                           for total, budget in zip(projected, budgets)])
+        self.ax.set_xticks(list(positions), x)
+        self.ax.set_ylabel("Amount")
+        overruns = sum(total > budget for total, budget in zip(projected, budgets))
+        self.ax.set_title(f"Projected {self.period.get()}-end spending ({overruns} over budget)")
+        self.ax.legend()
+        self.ax.tick_params(axis="x", labelrotation=45)
+        for label in self.ax.get_xticklabels():
+            label.set_horizontalalignment("right")
+        self.figure.tight_layout()
+
+        self.display_chart()
+
+    def display_chart(self):
+        # draw_idle renders on the next idle pass; with metrics on, the time
+        # until that render finishes is recorded as the chart's latency
+        if metrics.enabled:
+            self.draw_requested = time.perf_counter()
+        self.canvas.draw_idle()
+
+    def _chart_drawn(self, event):
+        if self.draw_requested is not None:
+            metrics.record("chart: display_chart", time.perf_counter() - self.draw_requested)
+            self.draw_requested = None
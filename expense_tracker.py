@@ -1,34 +1,22 @@
 import tkinter as tk
-from tkinter import ttk, messagebox
-import mysql.connector
-from mysql.connector import Error
+from tkinter import ttk, messagebox, filedialog
+from paged_treeview import PagedTreeview
+from finance_service import (validate_expense, validate_note, validate_filters, validate_category,
+                             parse_adjustment, ValidationError)
 from datetime import datetime
+import functools
 
 class ExpenseTracker:
-    def __init__(self, db_config):
-        self.db_config = db_config
-        self.create_table()
+    PAGE_SIZE = 100
+    # Typing in the filter bar waits this long for a pause before querying
+    FILTER_DELAY_MS = 300
 
-    def create_table(self):
-        try:
-            conn = mysql.connector.connect(**self.db_config)
-            if conn.is_connected():
-                cursor = conn.cursor()
-                cursor.execute('''
-                CREATE TABLE IF NOT EXISTS expenses (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    date DATE,
-                    category VARCHAR(255),
-                    amount DECIMAL(10, 2)
-                )
-                ''')
-                conn.commit()
-        except Error as e:
-            messagebox.showerror("Database Error", f"Error creating expenses table: {e}")
-        finally:
-            if conn.is_connected():
-                cursor.close()
-                conn.close()
+    def __init__(self, service, runner):
+        # service is a FinanceService or an ApiClient for a remote server
+        self.service = service
+        self.runner = runner
+        self.filters = {}
+        self.filter_job = None
 
     def create_widgets(self, parent):
         self.parent = parent
@@ -47,148 +35,279 @@ class ExpenseTracker:
         self.amount_entry = ttk.Entry(parent)
         self.amount_entry.grid(row=2, column=1, padx=5, pady=5)
 
-        ttk.Button(parent, text="Add Expense", command=self.add_expense).grid(row=3, column=0, pady=10)
-        ttk.Button(parent, text="Update Expense", command=self.update_expense).grid(row=3, column=1, pady=10)
+        ttk.Label(parent, text="Note:").grid(row=3, column=0, padx=5, pady=5)
+        self.note_entry = ttk.Entry(parent)
+        self.note_entry.grid(row=3, column=1, padx=5, pady=5)
+
+        ttk.Button(parent, text="Add Expense", command=self.add_expense).grid(row=4, column=0, pady=10)
+        ttk.Button(parent, text="Update Expense", command=self.update_expense).grid(row=4, column=1, pady=10)
+
+        self.create_filter_bar(parent).grid(row=5, column=0, columnspan=3, padx=5, sticky="w")
 
         # Expense list
-        self.tree = ttk.Treeview(parent, columns=("ID", "Date", "Category", "Amount"), show="headings")
+        self.tree = ttk.Treeview(parent, columns=("ID", "Date", "Category", "Amount", "Note"), show="headings",
+                                 selectmode="extended")
         self.tree.heading("ID", text="ID")
         self.tree.heading("Date", text="Date")
         self.tree.heading("Category", text="Category")
         self.tree.heading("Amount", text="Amount")
-        self.tree.grid(row=4, column=0, columnspan=2, padx=5, pady=5)
+        self.tree.heading("Note", text="Note")
+        self.tree.grid(row=6, column=0, columnspan=2, padx=5, pady=5)
+        scrollbar = ttk.Scrollbar(parent, orient="vertical")
+        scrollbar.grid(row=6, column=2, sticky="ns", pady=5)
+
+        # Only a few pages around the viewport are ever held in the widget
+        self.pages = PagedTreeview(self.tree, scrollbar, self.runner, self.service.fetch_expense_page,
+                                   key_of=lambda row: (str(row[1]), row[0]), job_key="load_expenses",
+                                   page_size=self.PAGE_SIZE, on_error=self._db_error("loading expenses"))
 
         # Bind the treeview selection to populate the entry fields
         self.tree.bind("<<TreeviewSelect>>", self.item_selected)
 
-        # Delete button
-        ttk.Button(parent, text="Delete Expense", command=self.delete_expense).grid(row=5, column=0, columnspan=2, pady=10)
+        self.create_bulk_bar(parent).grid(row=7, column=0, columnspan=3, padx=5, pady=10)
+
+        # Bulk import
+        ttk.Button(parent, text="Import CSV/OFX...", command=self.import_file).grid(row=8, column=0, pady=5)
+        self.import_status = ttk.Label(parent, text="")
+        self.import_status.grid(row=8, column=1, sticky="w", padx=5)
 
         self.load_expenses()
 
-    def add_expense(self):
-        date = self.date_entry.get()
-        category = self.category_entry.get()
-        amount = self.amount_entry.get()
+    def create_filter_bar(self, parent):
+        # Every field narrows the list server-side; edits are debounced and
+        # each new query supersedes the one in flight (same runner key)
+        bar = ttk.Frame(parent)
+        self.filter_entries = {}
+        fields = (("start", "From:", 11), ("end", "To:", 11), ("category", "Category:", 14),
+                  ("min_amount", "Min:", 8), ("max_amount", "Max:", 8), ("text", "Note:", 16))
+        for column, (name, label, width) in enumerate(fields):
+            ttk.Label(bar, text=label).grid(row=0, column=2 * column, padx=(5, 2))
+            entry = ttk.Entry(bar, width=width)
+            entry.grid(row=0, column=2 * column + 1)
+            entry.bind("<KeyRelease>", self.schedule_filter)
+            entry.bind("<Return>", self.apply_filters)
+            self.filter_entries[name] = entry
+        ttk.Button(bar, text="Clear", command=self.clear_filters).grid(row=0, column=2 * len(fields), padx=5)
+        self.filter_status = ttk.Label(bar, text="")
+        self.filter_status.grid(row=1, column=0, columnspan=2 * len(fields) + 1, sticky="w", padx=5)
+        return bar
 
-        if not date or not category or not amount:
-            messagebox.showerror("Error", "Please fill in all fields")
-            return
+    def create_bulk_bar(self, parent):
+        # Delete, recategorize and adjust act on every selected row, or on
+        # every row matching the filter, as one statement on the server
+        bar = ttk.Frame(parent)
+        ttk.Button(bar, text="Delete Selected", command=self.delete_expense).grid(row=0, column=0, padx=5)
+        ttk.Button(bar, text="Set Category", command=self.recategorize_expenses).grid(row=0, column=1, padx=5)
+        ttk.Label(bar, text="Adjust by:").grid(row=0, column=2, padx=(10, 2))
+        self.adjust_entry = ttk.Entry(bar, width=8)
+        self.adjust_entry.grid(row=0, column=3)
+        ttk.Button(bar, text="Adjust Amounts", command=self.adjust_amounts).grid(row=0, column=4, padx=5)
+        self.match_filter = tk.BooleanVar(value=False)
+        ttk.Checkbutton(bar, text="All rows matching the filter",
+                        variable=self.match_filter).grid(row=0, column=5, padx=5)
+        return bar
+
+    def schedule_filter(self, event=None):
+        if self.filter_job is not None:
+            self.parent.after_cancel(self.filter_job)
+        self.filter_job = self.parent.after(self.FILTER_DELAY_MS, self.apply_filters)
 
+    def apply_filters(self, event=None):
+        if self.filter_job is not None:
+            self.parent.after_cancel(self.filter_job)
+            self.filter_job = None
+        filters = {name: entry.get().strip() for name, entry in self.filter_entries.items()}
         try:
-            amount = float(amount)
-        except ValueError:
-            messagebox.showerror("Error", "Amount must be a number")
+            # Checked here so a half-typed date or amount waits quietly instead of erroring
+            validate_filters(**filters)
+        except ValidationError as e:
+            self.filter_status.config(text=str(e))
             return
+        self.filter_status.config(text="")
+        filters = {name: value for name, value in filters.items() if value}
+        if filters != self.filters:
+            self.filters = filters
+            self.load_expenses()
 
+    def clear_filters(self):
+        for entry in self.filter_entries.values():
+            entry.delete(0, tk.END)
+        self.apply_filters()
+
+    def add_expense(self):
         try:
-            conn = mysql.connector.connect(**self.db_config)
-            if conn.is_connected():
-                cursor = conn.cursor()
-                cursor.execute("INSERT INTO expenses (date, category, amount) VALUES (%s, %s, %s)",
-                               (date, category, amount))
-                conn.commit()
-                messagebox.showinfo("Success", "Expense added successfully")
-        except Error as e:
-            messagebox.showerror("Database Error", f"Error adding expense: {e}")
-        finally:
-            if conn.is_connected():
-                cursor.close()
-                conn.close()
+            date, category, amount = validate_expense(self.date_entry.get(), self.category_entry.get(),
+                                                      self.amount_entry.get())
+            note = validate_note(self.note_entry.get())
+        except ValidationError as e:
+            messagebox.showerror("Error", str(e))
+            return
 
-        self.load_expenses()
-        self.clear_entries()
+        self.runner.submit(self.service.insert_expense, date, category, amount, note,
+                           on_success=lambda row: self._row_saved(row, "Expense added successfully"),
+                           on_error=self._db_error("adding expense"))
 
     def update_expense(self):
         selected_item = self.tree.selection()
-        if not selected_item:
-            messagebox.showerror("Error", "Please select an expense to update")
+        if len(selected_item) != 1:
+            messagebox.showerror("Error", "Please select one expense to update")
             return
 
         expense_id = self.tree.item(selected_item)['values'][0]
-        date = self.date_entry.get()
-        category = self.category_entry.get()
-        amount = self.amount_entry.get()
-
-        if not date or not category or not amount:
-            messagebox.showerror("Error", "Please fill in all fields")
+        try:
+            date, category, amount = validate_expense(self.date_entry.get(), self.category_entry.get(),
+                                                      self.amount_entry.get())
+            note = validate_note(self.note_entry.get())
+        except ValidationError as e:
+            messagebox.showerror("Error", str(e))
             return
 
+        self.runner.submit(self.service.save_expense, expense_id, date, category, amount, note,
+                           on_success=lambda row: self._row_saved(row, "Expense updated successfully"),
+                           on_error=self._db_error("updating expense"))
+
+    def delete_expense(self):
+        self._confirm_bulk("Are you sure you want to delete {}?", lambda ids, filters: self.runner.submit(
+            self.service.remove_expenses, ids, filters,
+            on_success=lambda count: self._rows_deleted(ids, count),
+            on_error=self._db_error("deleting expenses")))
+
+    def recategorize_expenses(self):
         try:
-            amount = float(amount)
-        except ValueError:
-            messagebox.showerror("Error", "Amount must be a number")
+            category = validate_category(self.category_entry.get())
+        except ValidationError as e:
+            messagebox.showerror("Error", str(e))
             return
 
+        self._confirm_bulk(f"Move {{}} to category '{category}'?", lambda ids, filters: self.runner.submit(
+            self.service.recategorize_expenses, category, ids, filters,
+            on_success=lambda result: self._rows_updated(ids, result, "recategorized"),
+            on_error=self._db_error("recategorizing expenses")))
+
+    def adjust_amounts(self):
+        adjustment = self.adjust_entry.get().strip()
         try:
-            conn = mysql.connector.connect(**self.db_config)
-            if conn.is_connected():
-                cursor = conn.cursor()
-                cursor.execute("UPDATE expenses SET date=%s, category=%s, amount=%s WHERE id=%s",
-                               (date, category, amount, expense_id))
-                conn.commit()
-                messagebox.showinfo("Success", "Expense updated successfully")
-        except Error as e:
-            messagebox.showerror("Database Error", f"Error updating expense: {e}")
-        finally:
-            if conn.is_connected():
-                cursor.close()
-                conn.close()
+            parse_adjustment(adjustment)
+        except ValidationError as e:
+            messagebox.showerror("Error", str(e))
+            return
 
-        self.load_expenses()
-        self.clear_entries()
+        question = f"Adjust the amount of {{}} by {adjustment}?"
+        self._confirm_bulk(question, lambda ids, filters: self.runner.submit(
+            self.service.adjust_expense_amounts, adjustment, ids, filters,
+            on_success=lambda result: self._rows_updated(ids, result, "adjusted"),
+            on_error=self._db_error("adjusting expenses")))
 
-    def delete_expense(self):
-        selected_item = self.tree.selection()
-        if not selected_item:
-            messagebox.showerror("Error", "Please select an expense to delete")
+    def _confirm_bulk(self, question, proceed):
+        # Asks once, with the number of rows filled into question, then calls
+        # proceed(ids, None) for the selection or proceed(None, filters) for
+        # every row matching the applied filter (counted on the server first)
+        if self.match_filter.get():
+            filters = dict(self.filters)
+            scope = "matching the filter" if filters else "in the ledger"
+
+            def confirm(count):
+                if not count:
+                    messagebox.showinfo("Bulk Edit", "No expenses match the filter")
+                elif messagebox.askyesno("Confirm", question.format(f"all {count} expenses {scope}")):
+                    proceed(None, filters)
+
+            self.runner.submit(functools.partial(self.service.count_expenses, **filters),
+                               on_success=confirm, on_error=self._db_error("counting expenses"))
             return
 
-        expense_id = self.tree.item(selected_item)['values'][0]
+        ids = [int(iid) for iid in self.tree.selection()]
+        if not ids:
+            messagebox.showerror("Error", "Please select one or more expenses")
+            return
+        if messagebox.askyesno("Confirm", question.format(
+                "this expense" if len(ids) == 1 else f"these {len(ids)} expenses")):
+            proceed(ids, None)
 
-        if messagebox.askyesno("Confirm Delete", "Are you sure you want to delete this expense?"):
-            try:
-                conn = mysql.connector.connect(**self.db_config)
-                if conn.is_connected():
-                    cursor = conn.cursor()
-                    cursor.execute("DELETE FROM expenses WHERE id=%s", (expense_id,))
-                    conn.commit()
-                    messagebox.showinfo("Success", "Expense deleted successfully")
-            except Error as e:
-                messagebox.showerror("Database Error", f"Error deleting expense: {e}")
-            finally:
-                if conn.is_connected():
-                    cursor.close()
-                    conn.close()
+    # Mutations patch only the affected items instead of reloading the list
+    def _row_saved(self, row, message):
+        # None means the expense was deleted elsewhere in the meantime; with
+        # a filter on, the server decides whether the row still belongs
+        if row is None or self.filters:
+            self.load_expenses()
+        else:
+            self.pages.upsert_row(row)
+        messagebox.showinfo("Success", message)
+        self.clear_entries()
+
+    def _rows_updated(self, ids, result, action):
+        # Edits by filter may touch rows outside the loaded pages, so those
+        # reload; so does any edit while filtering, as rows may stop matching
+        count, rows = result
+        if ids is None or self.filters:
+            self.load_expenses()
+        else:
+            self.pages.update_rows(rows)
+        messagebox.showinfo("Success", f"{count} expense(s) {action}")
 
+    def _rows_deleted(self, ids, count):
+        if ids is None:
             self.load_expenses()
-            self.clear_entries()
+        else:
+            self.pages.remove_rows(ids)
+        messagebox.showinfo("Success", f"{count} expense(s) deleted")
+        self.clear_entries()
+
+    def _db_error(self, action):
+        return lambda e: messagebox.showerror("Database Error", f"Error {action}: {e}")
+
+    def import_file(self):
+        path = filedialog.askopenfilename(
+            title="Import expenses",
+            filetypes=[("Bank exports", "*.csv *.ofx *.qfx"), ("All files", "*.*")])
+        if not path:
+            return
+
+        self.import_status.config(text="Importing...")
+        self.runner.submit(self.service.import_expenses, path, self._post_import_progress,
+                           key="import",
+                           on_success=self._import_done,
+                           on_error=self._import_failed)
+
+    def _post_import_progress(self, result, done, total):
+        # Runs on the worker thread
+        self.runner.post(self._show_import_progress, (result.imported, result.rejected, done, total))
+
+    def _show_import_progress(self, progress):
+        imported, rejected, done, total = progress
+        percent = 100 * done // total if total else 100
+        self.import_status.config(text=f"Importing... {percent}% ({imported} rows, {rejected} rejected)")
+
+    def _import_done(self, result):
+        self.import_status.config(text=f"Imported {result.imported} rows, rejected {result.rejected}")
+        message = f"Imported {result.imported} of {result.read} rows."
+        if result.rejected:
+            details = "\n".join(f"Row {number}: {reason}" for number, reason, _ in result.rejected_rows[:10])
+            message += f"\n\n{result.rejected} rows were rejected:\n{details}"
+            if result.rejected > 10:
+                message += "\n..."
+        messagebox.showinfo("Import Complete", message)
+        self.load_expenses()
+
+    def _import_failed(self, e):
+        self.import_status.config(text="Import failed")
+        messagebox.showerror("Import Error", f"Error importing expenses: {e}")
 
     def load_expenses(self):
-        self.tree.delete(*self.tree.get_children())
-        try:
-            conn = mysql.connector.connect(**self.db_config)
-            if conn.is_connected():
-                cursor = conn.cursor()
-                cursor.execute("SELECT id, date, category, amount FROM expenses ORDER BY date DESC")
-                for row in cursor.fetchall():
-                    self.tree.insert("", "end", values=row)
-        except Error as e:
-            messagebox.showerror("Database Error", f"Error loading expenses: {e}")
-        finally:
-            if conn.is_connected():
-                cursor.close()
-                conn.close()
+        # A newer load supersedes one still in flight
+        self.pages.reload(functools.partial(self.service.fetch_expense_page, **self.filters))
 
     def clear_entries(self):
         self.date_entry.delete(0, tk.END)
         self.date_entry.insert(0, datetime.now().strftime("%Y-%m-%d"))
         self.category_entry.delete(0, tk.END)
         self.amount_entry.delete(0, tk.END)
+        self.note_entry.delete(0, tk.END)
 
     def item_selected(self, event):
+        # Fills the fields for editing when exactly one row is selected
         selected_item = self.tree.selection()
-        if selected_item:
+        if len(selected_item) == 1:
             values = self.tree.item(selected_item)['values']
             self.date_entry.delete(0, tk.END)
             self.date_entry.insert(0, values[1])
@@ -196,18 +315,5 @@ class ExpenseTracker:
             self.category_entry.insert(0, values[2])
             self.amount_entry.delete(0, tk.END)
             self.amount_entry.insert(0, values[3])
-
-    def get_expenses(self):
-        try:
-            conn = mysql.connector.connect(**self.db_config)
-            if conn.is_connected():
-                cursor = conn.cursor()
-                cursor.execute("SELECT date, category, amount FROM expenses ORDER BY date")
-                return cursor.fetchall()
-        except Error as e:
-            messagebox.showerror("Database Error", f"Error getting expenses: {e}")
-            return []
-        finally:
-            if conn.is_connected():
-                cursor.close()
-                conn.close()
\ No newline at end of file
+            self.note_entry.delete(0, tk.END)
+            self.note_entry.insert(0, values[4])
@@ -0,0 +1,162 @@
+import csv
+import os
+from datetime import date
+from decimal import Decimal
+import rollup
+from finance_service import CENT
+
+# Streaming export of expenses and budget reports. Rows are pulled with
+# fetchmany from an unbuffered cursor and written chunk by chunk, so memory
+# use does not grow with the size of the ledger.
+
+EXPENSE_COLUMNS = ("id", "date", "category", "amount", "note")
+BUDGET_REPORT_COLUMNS = ("category", "period", "budget", "spent", "remaining")
+
+
+def detect_format(path):
+    return "parquet" if os.path.splitext(path)[1].lower() in (".parquet", ".pq") else "csv"
+
+
+def _filters(start=None, end=None, category=None):
+    clauses, params = [], []
+    if start:
+        clauses.append("date >= %s")
+        params.append(start)
+    if end:
+        clauses.append("date <= %s")
+        params.append(end)
+    if category:
+        clauses.append("category = %s")
+        params.append(category)
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+
+def _amount(value):
+    # Exact cents, whichever backend or the API client supplied the value
+    return None if value is None else Decimal(str(value)).quantize(CENT)
+
+
+class CsvSink:
+    def __init__(self, path, columns):
+        self.file = open(path, "w", newline="", encoding="utf-8")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(columns)
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetSink:
+    # One row group per chunk through pyarrow's incremental writer. The
+    # writer is opened with the schema, so even an export with no rows
+    # closes to a file that has its columns.
+    def __init__(self, path, columns, types):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet export requires the pyarrow package")
+        self.pa = pa
+        self.schema = pa.schema([(name, getattr(pa, kind[0])(*kind[1:])) for name, kind in zip(columns, types)])
+        self.writer = pq.ParquetWriter(path, self.schema)
+
+    def write(self, rows):
+        if not rows:
+            return
+        columns = list(zip(*rows))
+        arrays = [self.pa.array(values, type=field.type) for values, field in zip(columns, self.schema)]
+        self.writer.write_table(self.pa.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+def _open_sink(path, fmt, columns, types):
+    if (fmt or detect_format(path)) == "parquet":
+        return ParquetSink(path, columns, types)
+    return CsvSink(path, columns)
+
+
+def export_expenses(storage, path, start=None, end=None, category=None, fmt=None,
+                    chunk_size=5000, progress=None):
+    # Returns the number of rows written; progress(rows_written) runs after each chunk
+    where, params = _filters(start, end, category)
+    return write_expenses(
+        storage.stream(f"SELECT id, date, category, amount, COALESCE(note, '') FROM expenses{where} "
+                       "ORDER BY date, id",
+                       params, size=chunk_size),
+        path, fmt, progress)
+
+
+def expense_page(storage, start=None, end=None, category=None, after=None, limit=5000):
+    # One chunk of the export order, continuing past the (date, id) key
+    # 'after'; lets a remote client page through what stream() would return
+    where, params = _filters(start, end, category)
+    if after is not None:
+        where += (" AND " if where else " WHERE ") + "(date, id) > (%s, %s)"
+        params += [after[0], after[1]]
+    return storage.fetchall(f"SELECT id, date, category, amount, COALESCE(note, '') FROM expenses{where} "
+                            "ORDER BY date, id LIMIT %s", params + [limit])
+
+
+def write_expenses(chunks, path, fmt=None, progress=None):
+    # chunks yields lists of (id, date, category, amount, note) rows
+    sink = _open_sink(path, fmt, EXPENSE_COLUMNS,
+                      [("int64",), ("date32",), ("string",), ("decimal128", 10, 2), ("string",)])
+    written = 0
+    try:
+        for rows in chunks:
+            sink.write([(expense_id, _date(day), category, _amount(amount), note)
+                        for expense_id, day, category, amount, note in rows])
+            written += len(rows)
+            if progress:
+                progress(written)
+    finally:
+        sink.close()
+    return written
+
+
+def export_budget_report(storage, path, start=None, end=None, fmt=None, period=None):
+    # One row per budget: budget, spent in the date range and what is left.
+    # Spending comes from the monthly rollup plus any partial edge months.
+    # With a period, only budgets set for that period are reported.
+    source, params = rollup.monthly_source(storage, start, end)
+    where = ""
+    if period:
+        where = " WHERE b.period = %s"
+        params = params + [period]
+    return write_budget_report(
+        storage.stream(
+            f"SELECT b.category, b.period, b.amount, {storage.money('COALESCE(t.total, 0)')} FROM budgets b "
+            f"LEFT JOIN (SELECT category, SUM(amount) AS total FROM {source} "
+            f"GROUP BY category) t ON t.category = b.category{where} ORDER BY b.category, b.period",
+            params),
+        path, fmt)
+
+
+def write_budget_report(chunks, path, fmt=None):
+    # chunks yields lists of (category, period, budget, spent) rows
+    sink = _open_sink(path, fmt, BUDGET_REPORT_COLUMNS,
+                      [("string",), ("string",), ("decimal128", 10, 2), ("decimal128", 12, 2),
+                       ("decimal128", 12, 2)])
+    written = 0
+    try:
+        for rows in chunks:
+            report = []
+            for category, period, budget, spent in rows:
+                budget, spent = _amount(budget), _amount(spent)
+                report.append((category, period, budget, spent, None if budget is None else budget - spent))
+            sink.write(report)
+            written += len(report)
+    finally:
+        sink.close()
+    return written
+
+
+def _date(value):
+    if value is None or isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value))
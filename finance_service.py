@@ -0,0 +1,604 @@
+import calendar
+import re
+from datetime import date, datetime, timedelta
+from decimal import Decimal, InvalidOperation
+import rollup
+from migrations import migrate
+
+# Core expense and budget operations, free of any Tk code. The GUI calls these
+# on worker threads, api_server exposes them over HTTP, and api_client offers
+# the same methods against a remote server, so the GUI runs unchanged on either.
+# exporter, importer and budget_alerts use the amount rules defined here, so
+# they are imported where they are used rather than at the top.
+
+CENT = Decimal("0.01")
+# DECIMAL(10, 2) upper bound
+MAX_AMOUNT = Decimal("99999999.99")
+PAGE_SIZE = 100
+BUDGET_PERIODS = ("week", "month", "year")
+# Most rows one bulk edit may name by id; larger edits target a filter instead
+MAX_BULK_IDS = 10000
+
+
+class ValidationError(ValueError):
+    pass
+
+
+def parse_amount(value, message="Amount must be a number"):
+    try:
+        amount = Decimal(str(value).strip()).quantize(CENT)
+    except (InvalidOperation, ValueError):
+        raise ValidationError(message)
+    if not amount.is_finite() or abs(amount) > MAX_AMOUNT:
+        raise ValidationError(message)
+    return amount
+
+
+def validate_category(category):
+    category = str(category).strip()
+    if not category:
+        raise ValidationError("Please fill in all fields")
+    if len(category) > 255:
+        raise ValidationError("Category must be at most 255 characters")
+    return category
+
+
+def validate_expense(date, category, amount):
+    # Returns (date, category, amount) normalised the way they are stored;
+    # dates as 'YYYY-MM-DD' so new rows sort correctly against loaded ones
+    if not date or not category or amount in (None, ""):
+        raise ValidationError("Please fill in all fields")
+    amount = parse_amount(amount)
+    try:
+        date = datetime.strptime(str(date), "%Y-%m-%d").strftime("%Y-%m-%d")
+    except ValueError:
+        raise ValidationError("Date must be in YYYY-MM-DD format")
+    return date, validate_category(category), amount
+
+
+def validate_note(note):
+    # Optional free text; blank is stored as NULL
+    note = str(note).strip() if note is not None else ""
+    if len(note) > 255:
+        raise ValidationError("Note must be at most 255 characters")
+    return note or None
+
+
+def validate_date_range(start, end):
+    # Optional inclusive bounds, normalised to 'YYYY-MM-DD'
+    bounds = []
+    for value in (start, end):
+        if value:
+            try:
+                value = datetime.strptime(str(value), "%Y-%m-%d").strftime("%Y-%m-%d")
+            except ValueError:
+                raise ValidationError("Dates must be in YYYY-MM-DD format")
+        bounds.append(value or None)
+    return bounds
+
+
+def validate_filters(start=None, end=None, category=None, min_amount=None, max_amount=None, text=None):
+    # Normalised expense list filters; blank values mean "any". The note
+    # search is split into words, each matched as a word prefix.
+    start, end = validate_date_range(start, end)
+    category = str(category).strip() if category is not None else ""
+    bounds = []
+    for value, message in ((min_amount, "Minimum amount must be a number"),
+                           (max_amount, "Maximum amount must be a number")):
+        bounds.append(parse_amount(value, message) if value not in (None, "") else None)
+    return {'start': start, 'end': end, 'category': category or None,
+            'min_amount': bounds[0], 'max_amount': bounds[1],
+            'words': tuple(re.findall(r"\w+", text or ""))}
+
+
+def validate_budget(category, amount, period="month"):
+    if not category or amount in (None, ""):
+        raise ValidationError("Please fill in all fields")
+    if period not in BUDGET_PERIODS:
+        raise ValidationError("Budget period must be week, month or year")
+    return validate_category(category), parse_amount(amount, "Budget amount must be a number"), period
+
+
+def validate_period(period):
+    if period is not None and period not in BUDGET_PERIODS:
+        raise ValidationError("Budget period must be week, month or year")
+    return period
+
+
+def budget_order(category, budget_id):
+    # Sort key of the budget list: category ignoring case, then id. Applied in
+    # Python rather than ORDER BY so rows placed into the list later compare
+    # the same way whatever the database's collation.
+    return str(category).casefold(), str(category), int(budget_id)
+
+
+def period_bounds(day, period):
+    # First and last date of the week (from Monday), month or year holding day
+    if period == "week":
+        start = day - timedelta(days=day.weekday())
+        return start, start + timedelta(days=6)
+    if period == "month":
+        return day.replace(day=1), day.replace(day=calendar.monthrange(day.year, day.month)[1])
+    if period == "year":
+        return day.replace(month=1, day=1), day.replace(month=12, day=31)
+    raise ValidationError("Budget period must be week, month or year")
+
+
+def validate_ids(ids):
+    # Distinct integer ids for a bulk edit, in the order given
+    try:
+        ids = list(dict.fromkeys(int(value) for value in ids))
+    except (TypeError, ValueError):
+        raise ValidationError("Ids must be integers")
+    if not ids:
+        raise ValidationError("Please select at least one row")
+    if len(ids) > MAX_BULK_IDS:
+        raise ValidationError(f"At most {MAX_BULK_IDS} rows can be changed at once")
+    return ids
+
+
+def id_list_sql(ids):
+    # "id IN (...)" and its parameters. The list is padded to a power of two
+    # by repeating the last id, so statements (and the per-statement caches of
+    # the drivers and SQLiteBackend.translate) come in a few sizes only.
+    size = 1 << (len(ids) - 1).bit_length()
+    return "id IN (" + ", ".join(["%s"] * size) + ")", list(ids) + [ids[-1]] * (size - len(ids))
+
+
+def adjusted_amount_sql(storage, factor, delta):
+    # SQL for the amount after parse_adjustment()'s (factor, delta), rounded to
+    # cents, and its parameters. The factor goes in as text: it is not money.
+    return (storage.round_money("amount * CAST(%s AS DECIMAL(12, 6)) + CAST(%s AS DECIMAL(12, 2))"),
+            [str(factor), delta])
+
+
+def parse_adjustment(value):
+    # (factor, delta) for a bulk amount change: "+5" or "-2.50" add to each
+    # amount, "+10%" or "-10%" scale it
+    text = str(value).strip().replace(" ", "")
+    message = "Adjustment must be an amount such as +5 or -2.50, or a percentage such as -10%"
+    if text.endswith("%"):
+        try:
+            percent = Decimal(text[:-1])
+        except InvalidOperation:
+            raise ValidationError(message)
+        if not percent.is_finite() or not -100 <= percent <= 1000:
+            raise ValidationError("Percentage must be between -100% and +1000%")
+        return (1 + percent / 100).quantize(Decimal("0.000001")), Decimal(0)
+    if not text:
+        raise ValidationError(message)
+    return Decimal(1), parse_amount(text, message)
+
+
+class FinanceService:
+    def __init__(self, storage, cache):
+        self.storage = storage
+        self.cache = cache
+        from budget_alerts import BudgetAlerts
+        self.alerts = BudgetAlerts(self._alert_seed)
+
+    def open(self):
+        # Returns the schema migrations applied
+        self.storage.open()
+        applied = migrate(self.storage)
+        self.alerts.refresh()
+        return applied
+
+    def close(self):
+        self.storage.close()
+
+    def stats(self):
+        return {'pool': self.storage.stats(), 'cache': self.cache.stats()}
+
+    def add_alert_listener(self, callback):
+        # callback(alerts) for budget thresholds crossed by writes; see BudgetAlerts
+        self.alerts.add_listener(callback)
+
+    def _alert_seed(self, day):
+        # This week, month and year, every budget and the spending per
+        # category in each period, read through the rollup-backed cache
+        bounds = {period: tuple(bound.isoformat() for bound in period_bounds(day, period))
+                  for period in BUDGET_PERIODS}
+        totals = {period: dict(self.get_category_totals(start, end)) for period, (start, end) in bounds.items()}
+        return bounds, self.list_budgets(), totals
+
+    # Write paths validate their input, keep expense_rollup in step inside the
+    # same transaction, invalidate cached aggregates once it has committed and
+    # then update the budget alerts
+
+    def insert_expense(self, date, category, amount, note=None):
+        # Returns the stored row
+        date, category, amount = validate_expense(date, category, amount)
+        note = validate_note(note)
+        with self.storage.transaction() as session:
+            self.storage.ensure_category(session, category)
+            expense_id = session.insert(
+                "INSERT INTO expenses (date, category, amount, note) VALUES (%s, %s, %s, %s)",
+                (date, category, amount, note))
+            rollup.apply(self.storage, session, [(date, category, amount)])
+        self.cache.invalidate("expenses")
+        self.alerts.apply([(None, (date, category, amount))])
+        return expense_id, date, category, amount, note or ""
+
+    def insert_expenses(self, rows):
+        # Batch insert of (date, category, amount) rows in one transaction;
+        # nothing is written unless every row is valid
+        checked = []
+        for number, row in enumerate(rows, start=1):
+            try:
+                checked.append(validate_expense(*row))
+            except (ValidationError, TypeError) as e:
+                raise ValidationError(f"Row {number}: {e}")
+        if checked:
+            import importer
+            importer.write_chunk(self.storage, checked)
+            self.cache.invalidate("expenses")
+            self.alerts.apply([(None, row) for row in checked])
+        return len(checked)
+
+    def save_expense(self, expense_id, date, category, amount, note=None):
+        # Returns the stored row, or None if there is no such expense
+        date, category, amount = validate_expense(date, category, amount)
+        note = validate_note(note)
+        with self.storage.transaction() as session:
+            self.storage.ensure_category(session, category)
+            old = session.fetchone("SELECT date, category, amount FROM expenses WHERE id=%s"
+                                   + self.storage.for_update, (expense_id,))
+            if old is None:
+                return None
+            session.execute("UPDATE expenses SET date=%s, category=%s, amount=%s, note=%s WHERE id=%s",
+                            (date, category, amount, note, expense_id))
+            rollup.apply(self.storage, session, [old], sign=-1)
+            rollup.apply(self.storage, session, [(date, category, amount)])
+        self.cache.invalidate("expenses")
+        self.alerts.apply([(old, (date, category, amount))])
+        return int(expense_id), date, category, amount, note or ""
+
+    def remove_expense(self, expense_id):
+        with self.storage.transaction() as session:
+            old = session.fetchone("SELECT date, category, amount FROM expenses WHERE id=%s"
+                                   + self.storage.for_update, (expense_id,))
+            if old is None:
+                return 0
+            count = session.execute("DELETE FROM expenses WHERE id=%s", (expense_id,))
+            rollup.apply(self.storage, session, [old], sign=-1)
+        self.cache.invalidate("expenses")
+        self.alerts.apply([(old, None)])
+        return count
+
+    # Bulk edits target either a list of ids or every expense matching the
+    # list filters (validate_filters() arguments). Each runs as one set-based
+    # statement in one transaction; the rollup is adjusted from a grouped
+    # read of the affected rows taken just before the write.
+
+    def _bulk_target(self, ids, filters):
+        # (where, params) for the rows a bulk edit changes
+        if ids is not None:
+            return id_list_sql(validate_ids(ids))
+        if filters is None:
+            raise ValidationError("Please select at least one row")
+        clauses, params = self._expense_filter(**validate_filters(**filters))
+        return " AND ".join(clauses) or "1 = 1", params
+
+    def _bulk_rows(self, session, ids):
+        # Stored rows of a bulk edit by id, to update the list in place
+        if ids is None:
+            return []
+        where, params = id_list_sql(validate_ids(ids))
+        return session.fetchall(
+            f"SELECT id, date, category, amount, COALESCE(note, '') FROM expenses WHERE {where}", params)
+
+    def count_expenses(self, **filters):
+        # Number of expenses a filter-targeted bulk edit would change
+        clauses, params = self._expense_filter(**validate_filters(**filters))
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+        return self.storage.fetchone(f"SELECT COUNT(*) FROM expenses{where}", params)[0]
+
+    def recategorize_expenses(self, category, ids=None, filters=None):
+        # Moves the targeted expenses to category. Returns (count, rows), rows
+        # being the updated (id, date, category, amount, note) when targeted by id.
+        category = validate_category(category)
+        where, params = self._bulk_target(ids, filters)
+        with self.storage.transaction() as session:
+            self.storage.ensure_category(session, category)
+            groups = rollup.grouped(self.storage, session, where, params)
+            count = session.execute(f"UPDATE expenses SET category = %s WHERE {where}", [category] + params)
+            rollup.apply_groups(self.storage, session, groups, sign=-1)
+            rollup.apply_groups(self.storage, session,
+                                [(month, category, total, number) for month, _, total, number in groups])
+            rows = self._bulk_rows(session, ids)
+        self.cache.invalidate("expenses")
+        self.alerts.refresh()
+        return count, rows
+
+    def adjust_expense_amounts(self, adjustment, ids=None, filters=None):
+        # Adds to or scales the targeted amounts (see parse_adjustment),
+        # rounded to cents. Nothing is written if any result would not fit.
+        # Returns (count, rows) like recategorize_expenses.
+        adjusted, adjusted_params = adjusted_amount_sql(self.storage, *parse_adjustment(adjustment))
+        where, params = self._bulk_target(ids, filters)
+        with self.storage.transaction() as session:
+            overflow = session.fetchone(
+                f"SELECT COUNT(*) FROM expenses WHERE ({where}) "
+                f"AND ABS({adjusted}) > CAST(%s AS DECIMAL(12, 2))",
+                params + adjusted_params + [MAX_AMOUNT])[0]
+            if overflow:
+                raise ValidationError(f"{overflow} adjusted amounts would be out of range")
+            # Both groupings are read first: an amount filter may no longer
+            # match the rows once they have changed
+            old = rollup.grouped(self.storage, session, where, params)
+            new = rollup.grouped(self.storage, session, where, params, adjusted, adjusted_params)
+            count = session.execute(f"UPDATE expenses SET amount = {adjusted} WHERE {where}",
+                                    adjusted_params + params)
+            rollup.apply_groups(self.storage, session, old, sign=-1)
+            rollup.apply_groups(self.storage, session, new)
+            rows = self._bulk_rows(session, ids)
+        self.cache.invalidate("expenses")
+        self.alerts.refresh()
+        return count, rows
+
+    def remove_expenses(self, ids=None, filters=None):
+        # Returns the number of expenses deleted
+        where, params = self._bulk_target(ids, filters)
+        with self.storage.transaction() as session:
+            groups = rollup.grouped(self.storage, session, where, params)
+            count = session.execute(f"DELETE FROM expenses WHERE {where}", params)
+            rollup.apply_groups(self.storage, session, groups, sign=-1)
+        self.cache.invalidate("expenses")
+        self.alerts.refresh()
+        return count
+
+    def rebuild_rollup(self):
+        # Returns the number of (month, category) rows
+        try:
+            return rollup.rebuild(self.storage)
+        finally:
+            self.cache.invalidate("expenses")
+
+    def import_expenses(self, path, progress=None):
+        import importer
+        try:
+            return importer.import_expenses(self.storage, path, 5000, progress)
+        finally:
+            # Chunks commit independently, so even a failed import may have written rows
+            self.cache.invalidate("expenses")
+            self.alerts.refresh()
+
+    def export_expenses(self, path, start=None, end=None, category=None, fmt=None, progress=None):
+        import exporter
+        start, end = validate_date_range(start, end)
+        return exporter.export_expenses(self.storage, path, start, end, category, fmt, progress=progress)
+
+    def export_budget_report(self, path, start=None, end=None, fmt=None, period=None):
+        import exporter
+        start, end = validate_date_range(start, end)
+        return exporter.export_budget_report(self.storage, path, start, end, fmt, validate_period(period))
+
+    def export_page(self, start=None, end=None, category=None, after=None, limit=5000):
+        import exporter
+        start, end = validate_date_range(start, end)
+        return exporter.expense_page(self.storage, start, end, category, after, limit)
+
+    def fetch_expense_page(self, after=None, before=None, limit=PAGE_SIZE, **filters):
+        # (id, date, category, amount, note) rows, note '' when there is none.
+        # Keyset pagination on (date, id), newest first. 'after' continues past
+        # the last row of a page, 'before' walks back towards the newest rows.
+        # filters are validate_filters() arguments; category and date filters
+        # walk idx_expenses_category_date or idx_expenses_date_id in order, the
+        # note search comes from the full-text index and amounts are checked
+        # on the rows those return.
+        clauses, params = self._expense_filter(**validate_filters(**filters))
+        order = "DESC"
+        if after is not None:
+            clauses.append("(date, id) < (%s, %s)")
+            params += [after[0], after[1]]
+        elif before is not None:
+            clauses.append("(date, id) > (%s, %s)")
+            params += [before[0], before[1]]
+            order = "ASC"
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+        rows = self.storage.fetchall(
+            f"SELECT id, date, category, amount, COALESCE(note, '') FROM expenses{where} "
+            f"ORDER BY date {order}, id {order} LIMIT %s",
+            params + [limit])
+        if before is not None:
+            rows.reverse()
+        return rows
+
+    def _expense_filter(self, start, end, category, min_amount, max_amount, words):
+        clauses, params = [], []
+        if category:
+            clauses.append("category = %s")
+            params.append(category)
+        where, range_params = self._date_range(start, end)
+        if where:
+            clauses.append(where)
+            params += range_params
+        if min_amount is not None:
+            clauses.append("amount >= %s")
+            params.append(min_amount)
+        if max_amount is not None:
+            clauses.append("amount <= %s")
+            params.append(max_amount)
+        if words:
+            match, match_params = self.storage.note_match_sql(words)
+            clauses.append(match)
+            params += match_params
+        return clauses, params
+
+    def get_expenses(self):
+        return self.storage.fetchall("SELECT date, category, amount FROM expenses ORDER BY date")
+
+    # Aggregations run in the database so charts transfer one row per group
+    # rather than one per expense. start/end are inclusive 'YYYY-MM-DD' bounds.
+    # Category, month and year totals read whole months from expense_rollup;
+    # day and week buckets need the raw rows.
+
+    def _date_range(self, start, end, column='date'):
+        clauses, params = [], []
+        if start:
+            clauses.append(f"{column} >= %s")
+            params.append(start)
+        if end:
+            clauses.append(f"{column} <= %s")
+            params.append(end)
+        return " AND ".join(clauses), params
+
+    def get_category_totals(self, start=None, end=None):
+        start, end = validate_date_range(start, end)
+        return self.cache.get_or_load(("category_totals", start, end), ("expenses",),
+                                      lambda: self._query_category_totals(start, end))
+
+    def _query_category_totals(self, start, end):
+        source, params = rollup.monthly_source(self.storage, start, end)
+        return self.storage.fetchall(
+            f"SELECT category, {self.storage.money('SUM(amount)')} FROM {source} GROUP BY category ORDER BY category",
+            params)
+
+    def get_period_totals(self, period='month', start=None, end=None, by_category=False):
+        start, end = validate_date_range(start, end)
+        return self.cache.get_or_load(("period_totals", period, start, end, by_category), ("expenses",),
+                                      lambda: self._query_period_totals(period, start, end, by_category))
+
+    def _query_period_totals(self, period, start, end, by_category):
+        if period in ('month', 'year'):
+            source, params = rollup.monthly_source(self.storage, start, end)
+            bucket = "month" if period == 'month' else "SUBSTR(month, 1, 4)"
+        else:
+            where, params = self._date_range(start, end)
+            source = "expenses" + (f" WHERE {where}" if where else "")
+            source = f"(SELECT {self.storage.period_sql(period)} AS bucket, category, amount FROM {source}) ledger"
+            bucket = "bucket"
+        group = f"{bucket}, category" if by_category else bucket
+        return self.storage.fetchall(
+            f"SELECT {group}, {self.storage.money('SUM(amount)')} FROM {source} GROUP BY {group} ORDER BY {group}",
+            params)
+
+    def get_budget_comparison(self, start=None, end=None, period=None):
+        # Budget vs actual in one statement: (category, period, budget, spent).
+        # With a period, only budgets set for that period are compared.
+        start, end = validate_date_range(start, end)
+        period = validate_period(period)
+        return self.cache.get_or_load(("budget_comparison", start, end, period), ("expenses", "budgets"),
+                                      lambda: self._query_budget_comparison(start, end, period))
+
+    def _query_budget_comparison(self, start, end, period):
+        source, params = rollup.monthly_source(self.storage, start, end)
+        where = ""
+        if period:
+            where = " WHERE b.period = %s"
+            params = params + [period]
+        return self.storage.fetchall(
+            f"SELECT b.category, b.period, b.amount, {self.storage.money('COALESCE(t.total, 0)')} FROM budgets b "
+            f"LEFT JOIN (SELECT category, SUM(amount) AS total FROM {source} GROUP BY category) t "
+            f"ON t.category = b.category{where} ORDER BY b.category, b.period",
+            params)
+
+    def get_budget_forecast(self, period="month", on=None):
+        # (category, budget, spent, projected) for every budget of the period:
+        # spending so far in the period holding `on` (default today) and the
+        # projected total at period end. Cached per period and day until the
+        # next expense or budget write.
+        period = validate_period(period) or "month"
+        on = validate_date_range(on, None)[0] or date.today().isoformat()
+        return self.cache.get_or_load(("budget_forecast", period, on), ("expenses", "budgets"),
+                                      lambda: self._query_budget_forecast(period, on))
+
+    def _query_budget_forecast(self, period, on):
+        import forecast
+        import time_series
+
+        budgets = self.storage.fetchall(
+            "SELECT category, amount FROM budgets WHERE period = %s ORDER BY category", (period,))
+        if not budgets:
+            return []
+        first = str(forecast.history_start(on, period))
+        rows = self.storage.fetchall(
+            f"SELECT date, category, {self.storage.money('SUM(amount)')} FROM expenses "
+            "WHERE date >= %s AND date <= %s AND category IN (SELECT category FROM budgets WHERE period = %s) "
+            "GROUP BY date, category",
+            (first, on, period))
+        days, categories, matrix = time_series.daily_matrix(rows, start=first, end=on)
+        spent, projected, _ = forecast.project(days, matrix, period, on)
+        index = {category: row for row, category in enumerate(categories)}
+        result = []
+        for category, amount in budgets:
+            row = index.get(category)
+            so_far, total = (0.0, 0.0) if row is None else (float(spent[row]), float(projected[row]))
+            result.append((category, amount, Decimal(so_far).quantize(CENT), Decimal(total).quantize(CENT)))
+        return result
+
+    # Budgets
+
+    def insert_budget(self, category, amount, period="month"):
+        # Returns the stored row; raises DuplicateKeyError if the category has
+        # one for the period already
+        category, amount, period = validate_budget(category, amount, period)
+        with self.storage.transaction() as session:
+            self.storage.ensure_category(session, category)
+            budget_id = session.insert("INSERT INTO budgets (category, amount, period) VALUES (%s, %s, %s)",
+                                       (category, amount, period))
+        self.cache.invalidate("budgets")
+        self.alerts.budgets_saved([(budget_id, category, amount, period)])
+        return budget_id, category, amount, period
+
+    def save_budget(self, budget_id, category, amount, period=None):
+        # Without a period the budget keeps the one it has
+        category, amount, _ = validate_budget(category, amount)
+        period = validate_period(period)
+        with self.storage.transaction() as session:
+            self.storage.ensure_category(session, category)
+            if period is None:
+                row = session.fetchone("SELECT period FROM budgets WHERE id=%s" + self.storage.for_update,
+                                       (budget_id,))
+                if row is None:
+                    return None
+                period = row[0]
+            count = session.execute("UPDATE budgets SET category=%s, amount=%s, period=%s WHERE id=%s",
+                                    (category, amount, period, budget_id))
+        self.cache.invalidate("budgets")
+        if not count:
+            return None
+        self.alerts.budgets_saved([(budget_id, category, amount, period)])
+        return int(budget_id), category, amount, period
+
+    def remove_budget(self, budget_id):
+        count = self.storage.execute("DELETE FROM budgets WHERE id=%s", (budget_id,))
+        self.cache.invalidate("budgets")
+        self.alerts.budgets_removed([budget_id])
+        return count
+
+    def adjust_budgets(self, adjustment, ids):
+        # Adds to or scales the amounts of the given budgets; returns the
+        # updated (id, category, amount, period) rows
+        adjusted, adjusted_params = adjusted_amount_sql(self.storage, *parse_adjustment(adjustment))
+        where, params = id_list_sql(validate_ids(ids))
+        with self.storage.transaction() as session:
+            overflow = session.fetchone(
+                f"SELECT COUNT(*) FROM budgets WHERE ({where}) "
+                f"AND ABS({adjusted}) > CAST(%s AS DECIMAL(12, 2))",
+                params + adjusted_params + [MAX_AMOUNT])[0]
+            if overflow:
+                raise ValidationError(f"{overflow} adjusted budgets would be out of range")
+            session.execute(f"UPDATE budgets SET amount = {adjusted} WHERE {where}",
+                            adjusted_params + params)
+            rows = session.fetchall(f"SELECT id, category, amount, period FROM budgets WHERE {where}", params)
+        self.cache.invalidate("budgets")
+        self.alerts.budgets_saved(rows)
+        return rows
+
+    def remove_budgets(self, ids):
+        where, params = id_list_sql(validate_ids(ids))
+        count = self.storage.execute(f"DELETE FROM budgets WHERE {where}", params)
+        self.cache.invalidate("budgets")
+        self.alerts.budgets_removed(params)
+        return count
+
+    def list_budgets(self):
+        # (id, category, amount, period) rows for the budget list, in budget_order()
+        return sorted(self.storage.fetchall("SELECT id, category, amount, period FROM budgets"),
+                      key=lambda row: budget_order(row[1], row[0]))
+
+    def get_budgets(self):
+        return self.cache.get_or_load(("budgets",), ("budgets",), lambda: self.storage.fetchall(
+            "SELECT category, amount, period FROM budgets ORDER BY category"))
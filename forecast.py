@@ -0,0 +1,94 @@
+import numpy as np
+
+# Period-end spending projections for every category at once. History is a
+# categories x days matrix of daily totals (time_series.daily_matrix) ending
+# on the day of the forecast; each model is a handful of whole-matrix NumPy
+# operations, so the cost grows with days of history, not with categories.
+#
+#   seasonal   spent so far plus what was spent over the rest of the period
+#              in earlier periods (e.g. the 19th to month-end of past months)
+#   smoothing  spent so far plus the exponentially smoothed daily spend
+#              times the days remaining
+#
+# seasonal is used for a category once it has MIN_SEASONS earlier periods of
+# history, smoothing before that.
+
+# Earlier periods looked at by the seasonal model and fetched as history
+HISTORY = {"week": 12, "month": 12, "year": 3}
+MIN_SEASONS = 2
+# Daily smoothing factor; about the last 40 days carry most of the weight
+ALPHA = 0.05
+
+
+def period_ranges(day, period, back):
+    # (starts, ends) of the period holding `day` and the `back` periods before
+    # it, newest first, as datetime64[D] arrays with inclusive ends
+    day = np.datetime64(day, "D")
+    steps = np.arange(back + 1)
+    if period == "week":
+        starts = day - (day.astype(np.int64) + 3) % 7 - 7 * steps
+        return starts, starts + 6
+    unit = {"month": "M", "year": "Y"}.get(period)
+    if unit is None:
+        raise ValueError(f"Unsupported period: {period}")
+    current = day.astype(f"datetime64[{unit}]")
+    starts = (current - steps).astype("datetime64[D]")
+    return starts, (current - steps + 1).astype("datetime64[D]") - 1
+
+
+def history_start(day, period):
+    starts, _ = period_ranges(day, period, HISTORY[period])
+    return starts[-1]
+
+
+def smoothed_level(matrix, lengths, alpha=ALPHA):
+    # Exponentially smoothed daily spend of each row, in closed form: the
+    # level is a geometric weighting of the observations, so one
+    # matrix-vector product replaces the day-by-day recursion. Weights are
+    # normalised over each row's own history (`lengths` days, counted back
+    # from the last column) so a category that started spending recently is
+    # not pulled towards zero by the days before it existed.
+    days = matrix.shape[1]
+    weights = alpha * (1 - alpha) ** np.arange(days - 1, -1, -1)
+    coverage = 1 - (1 - alpha) ** np.minimum(lengths, days)
+    return (matrix @ weights) / np.maximum(coverage, alpha)
+
+
+def project(days, matrix, period, day=None):
+    # Returns (spent, projected, seasonal) arrays over the rows of `matrix`:
+    # spending in the current period up to and including `day` (default: the
+    # last day of `days`), the projected total at period end, and whether the
+    # seasonal model made the projection
+    count = matrix.shape[0]
+    if not len(days):
+        return np.zeros(count), np.zeros(count), np.zeros(count, dtype=bool)
+    day = days[-1] if day is None else np.datetime64(day, "D")
+    starts, ends = period_ranges(day, period, HISTORY[period])
+    first = days[0]
+
+    def column(dates):
+        return np.clip((dates - first).astype(np.int64), 0, len(days))
+
+    # sums[:, i] is the total before column i, so any day range is one subtraction
+    sums = np.zeros((count, len(days) + 1))
+    np.cumsum(matrix, axis=1, out=sums[:, 1:])
+    today = column(day) + 1
+    spent = sums[:, today] - sums[:, column(starts[0])]
+
+    # Same offset into each earlier period through to its end, clipped to
+    # shorter periods (a 31-day month's tail after a 28-day February)
+    elapsed = day - starts[0] + 1
+    tail_start = np.minimum(starts[1:] + elapsed, ends[1:] + 1)
+    tails = sums[:, column(ends[1:] + 1)] - sums[:, column(tail_start)]
+    # Only periods after a category's first spending count as its history
+    spending = matrix > 0
+    began = np.where(spending.any(axis=1), first + spending.argmax(axis=1), np.datetime64("NaT"))
+    seen = (starts[1:][None, :] >= began[:, None]) & (starts[1:][None, :] >= first)
+    seasons = seen.sum(axis=1)
+    seasonal_rest = np.where(seen, tails, 0).sum(axis=1) / np.maximum(seasons, 1)
+
+    remaining = (ends[0] - day).astype(np.int64)
+    history = np.where(spending.any(axis=1), today - spending.argmax(axis=1), 0)
+    smoothed_rest = smoothed_level(matrix[:, :today], history) * remaining
+    use_seasonal = seasons >= MIN_SEASONS
+    return spent, spent + np.where(use_seasonal, seasonal_rest, smoothed_rest), use_seasonal
@@ -0,0 +1,174 @@
+import csv
+import os
+import re
+import rollup
+from datetime import date, datetime
+from finance_service import parse_amount as parse_decimal
+
+# Streaming import of bank exports. Files are read incrementally and written
+# in chunks, one executemany per chunk inside a single transaction, so memory
+# stays bounded by chunk_size no matter how large the file is.
+
+DATE_FORMATS = ("%m/%d/%Y", "%d.%m.%Y", "%Y/%m/%d")
+MAX_REJECTED_DETAILS = 1000
+
+_OFX_FIELD = re.compile(r"<(\w+)>([^<\r\n]*)")
+
+
+class ImportResult:
+    def __init__(self):
+        self.read = 0
+        self.imported = 0
+        self.rejected = 0
+        # (row number, reason, raw row) for the first MAX_REJECTED_DETAILS rejects
+        self.rejected_rows = []
+
+    def reject(self, number, reason, raw):
+        self.rejected += 1
+        if len(self.rejected_rows) < MAX_REJECTED_DETAILS:
+            self.rejected_rows.append((number, reason, raw))
+
+
+def parse_date(value):
+    value = value.strip()
+    try:
+        # Fast path for ISO dates, the common case for exports
+        return date.fromisoformat(value).isoformat()
+    except ValueError:
+        pass
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date().isoformat()
+        except ValueError:
+            continue
+    raise ValueError(f"invalid date {value!r}")
+
+
+def parse_amount(value):
+    # Bank exports may group thousands and carry a currency sign
+    return parse_decimal(value.strip().replace(",", "").replace("$", ""), f"invalid amount {value!r}")
+
+
+def read_csv(f):
+    # Yields (row number, {'date', 'category', 'amount'}) using the header row
+    reader = csv.reader(f)
+    header = [column.strip().lower() for column in next(reader, [])]
+    missing = {"date", "category", "amount"} - set(header)
+    if missing:
+        raise ValueError(f"CSV header is missing column(s): {', '.join(sorted(missing))}")
+    positions = {name: header.index(name) for name in ("date", "category", "amount")}
+    for number, row in enumerate(reader, start=2):
+        if not row:
+            continue
+        try:
+            yield number, {name: row[index] for name, index in positions.items()}
+        except IndexError:
+            yield number, {"raw": row}
+
+
+def read_ofx(f, default_category="Uncategorized"):
+    # OFX 1.x (SGML) and 2.x (XML) both wrap each transaction in
+    # <STMTTRN>...</STMTTRN>; scan for those blocks a buffer at a time.
+    buffer = ""
+    number = 0
+    while True:
+        chunk = f.read(65536)
+        if not chunk:
+            break
+        buffer += chunk
+        while True:
+            start = buffer.find("<STMTTRN>")
+            if start == -1:
+                buffer = buffer[-len("<STMTTRN>"):]
+                break
+            end = buffer.find("</STMTTRN>", start)
+            if end == -1:
+                buffer = buffer[start:]
+                break
+            block = buffer[start + len("<STMTTRN>"):end]
+            buffer = buffer[end + len("</STMTTRN>"):]
+            number += 1
+            fields = {tag.upper(): value.strip() for tag, value in _OFX_FIELD.findall(block)}
+            yield number, _ofx_row(fields, default_category)
+
+
+def _ofx_row(fields, default_category):
+    amount = fields.get("TRNAMT", "")
+    posted = fields.get("DTPOSTED", "")[:8]
+    row = {"date": f"{posted[:4]}-{posted[4:6]}-{posted[6:8]}" if len(posted) == 8 else posted,
+           "category": default_category,
+           "amount": amount}
+    # Debits are negative in OFX; only those are expenses
+    if amount.strip().startswith("-"):
+        row["amount"] = amount.strip()[1:]
+    elif amount:
+        row["credit"] = True
+    return row
+
+
+def validate(row):
+    if "raw" in row:
+        raise ValueError("wrong number of columns")
+    if row.get("credit"):
+        raise ValueError("credit transaction, not an expense")
+    category = row["category"].strip()
+    if not category:
+        raise ValueError("missing category")
+    if len(category) > 255:
+        raise ValueError("category longer than 255 characters")
+    amount = parse_amount(row["amount"])
+    if amount < 0:
+        raise ValueError("negative amount")
+    return parse_date(row["date"]), category, amount
+
+
+def detect_format(path):
+    return "ofx" if os.path.splitext(path)[1].lower() in (".ofx", ".qfx") else "csv"
+
+
+def import_expenses(storage, path, chunk_size=5000, progress=None, fmt=None):
+    # progress(result, bytes_done, bytes_total) is called after every chunk.
+    # Each chunk commits on its own, so a failure part-way keeps earlier chunks.
+    return import_file(path, lambda chunk: write_chunk(storage, chunk), chunk_size, progress, fmt)
+
+
+def import_file(path, write, chunk_size=5000, progress=None, fmt=None):
+    # Parses and validates path, handing each chunk of (date, category, amount)
+    # rows to write(); import_expenses writes them to a backend, the API client
+    # posts them to the server
+    fmt = fmt or detect_format(path)
+    total_bytes = os.path.getsize(path)
+    result = ImportResult()
+
+    with open(path, newline="", encoding="utf-8-sig", errors="replace") as f:
+        rows = read_ofx(f) if fmt == "ofx" else read_csv(f)
+        chunk = []
+        for number, row in rows:
+            result.read += 1
+            try:
+                chunk.append(validate(row))
+            except ValueError as e:
+                result.reject(number, str(e), row)
+                continue
+            if len(chunk) >= chunk_size:
+                write(chunk)
+                result.imported += len(chunk)
+                chunk = []
+                if progress:
+                    # Offset of the underlying byte stream, at most one read-ahead block ahead
+                    progress(result, f.buffer.tell(), total_bytes)
+        if chunk:
+            write(chunk)
+            result.imported += len(chunk)
+    if progress:
+        progress(result, total_bytes, total_bytes)
+    return result
+
+
+def write_chunk(storage, chunk):
+    categories = {category for _, category, _ in chunk}
+    with storage.transaction() as session:
+        session.executemany(f"{storage.insert_ignore} INTO categories (name) VALUES (%s)",
+                            [(category,) for category in categories])
+        session.executemany("INSERT INTO expenses (date, category, amount) VALUES (%s, %s, %s)", chunk)
+        rollup.apply(storage, session, chunk)
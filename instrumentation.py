@@ -0,0 +1,226 @@
+import bisect
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Opt-in latency metrics for the hot paths: every storage call (connect, pool
+# checkout, query, fetch), every Tk callback, every TaskRunner result handler
+# and chart redraws. Call sites check `metrics.enabled` before taking a
+# timestamp and the Tk hook is only installed while enabled, so the disabled
+# cost is one attribute lookup per call.
+
+logger = logging.getLogger(__name__)
+slow_query_logger = logging.getLogger("finance.slow_queries")
+
+# Histogram bucket upper bounds in milliseconds
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, float("inf"))
+
+# Before 3.12 cProfile only hooks the thread that enables it. From 3.12 it
+# runs on sys.monitoring, which sees every thread but allows one active
+# profiler: a second Profile().enable() raises ValueError.
+PROFILE_PER_THREAD = sys.version_info < (3, 12)
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS_MS)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+
+    def record(self, ms, rows=None):
+        self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        if rows:
+            self.rows += rows
+
+    def percentile(self, fraction):
+        # Upper bound of the bucket holding the given fraction of samples
+        target = fraction * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS_MS, self.counts):
+            seen += count
+            if count and seen >= target:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'total_ms': round(self.total_ms, 3),
+            'mean_ms': round(self.total_ms / self.count, 3) if self.count else 0.0,
+            'p50_ms': self.percentile(0.5),
+            'p95_ms': self.percentile(0.95),
+            'p99_ms': self.percentile(0.99),
+            'max_ms': round(self.max_ms, 3),
+            'rows': self.rows,
+        }
+
+
+class Instrumentation:
+    def __init__(self):
+        self.enabled = False
+        self.profiling = False
+        self.slow_query_ms = 100.0
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._original_tk_call = None
+        self._profiler = None
+        self._worker_profiles = []
+
+    def configure(self, enabled=None, slow_query_ms=None, slow_query_log=None):
+        if slow_query_ms is not None:
+            self.slow_query_ms = float(slow_query_ms)
+        if slow_query_log:
+            handler = logging.FileHandler(slow_query_log, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            slow_query_logger.addHandler(handler)
+        if enabled is True:
+            self.enable()
+        elif enabled is False:
+            self.disable()
+
+    def configure_from_env(self, environ=os.environ):
+        # FINANCE_METRICS=1 turns collection on; FINANCE_SLOW_QUERY_MS sets the
+        # slow-query threshold and FINANCE_SLOW_QUERY_LOG adds a log file for them
+        self.configure(enabled=True if environ.get('FINANCE_METRICS', '') not in ('', '0') else None,
+                       slow_query_ms=environ.get('FINANCE_SLOW_QUERY_MS'),
+                       slow_query_log=environ.get('FINANCE_SLOW_QUERY_LOG'))
+
+    def enable(self):
+        self.enabled = True
+        self._install_tk_hook()
+
+    def disable(self):
+        self.enabled = False
+        self._remove_tk_hook()
+
+    def record(self, name, seconds, rows=None):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.record(seconds * 1000, rows)
+
+    @contextmanager
+    def timer(self, name):
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def record_query(self, operation, query, params, seconds, rows=None):
+        # Per operation ("db.fetchall") and per statement text, which is a
+        # small set since every statement is written with %s placeholders
+        self.record(operation, seconds, rows)
+        self.record("sql: " + " ".join(query.split()), seconds, rows)
+        ms = seconds * 1000
+        if ms >= self.slow_query_ms:
+            slow_query_logger.warning("%.1f ms %s rows=%s %s params=%r", ms, operation, rows,
+                                      " ".join(query.split()), params)
+
+    def snapshot(self):
+        with self._lock:
+            return {name: histogram.summary() for name, histogram in self._histograms.items()}
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def report(self, limit=40):
+        # Busiest entries first, by total time
+        rows = sorted(self.snapshot().items(), key=lambda item: item[1]['total_ms'], reverse=True)[:limit]
+        lines = [f"{'total ms':>10} {'count':>7} {'p50':>8} {'p95':>8} {'max':>9} {'rows':>9}  name"]
+        for name, s in rows:
+            lines.append(f"{s['total_ms']:>10.1f} {s['count']:>7} {s['p50_ms']:>8.2f} {s['p95_ms']:>8.2f} "
+                         f"{s['max_ms']:>9.2f} {s['rows']:>9}  {name[:100]}")
+        return "\n".join(lines)
+
+    # Tk callbacks: tkinter routes every command=, bind() and after() callback
+    # through CallWrapper, so timing its __call__ covers all of them
+
+    def _install_tk_hook(self):
+        import tkinter
+        if self._original_tk_call is not None:
+            return
+        original = self._original_tk_call = tkinter.CallWrapper.__call__
+        instrumentation = self
+
+        def timed_call(wrapper, *args):
+            started = time.perf_counter()
+            try:
+                return original(wrapper, *args)
+            finally:
+                instrumentation.record("tk: " + callback_name(wrapper.func), time.perf_counter() - started)
+
+        tkinter.CallWrapper.__call__ = timed_call
+
+    def _remove_tk_hook(self):
+        import tkinter
+        if self._original_tk_call is not None:
+            tkinter.CallWrapper.__call__ = self._original_tk_call
+            self._original_tk_call = None
+
+    # On-demand profiling. The Tk thread runs under one profiler. Where that
+    # profiler only sees its own thread, jobs on worker threads each get their
+    # own and are merged into the same stats when profiling stops; otherwise
+    # it already covers the jobs and they run as is.
+
+    def start_profile(self):
+        if self.profiling:
+            return
+        self._worker_profiles = []
+        self._profiler = cProfile.Profile()
+        self.profiling = True
+        self._profiler.enable()
+
+    def profile_call(self, fn, *args):
+        if not PROFILE_PER_THREAD:
+            return fn(*args)
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(fn, *args)
+        finally:
+            with self._lock:
+                self._worker_profiles.append(profiler)
+
+    def stop_profile(self, path=None, limit=25):
+        # Writes a pstats file (if path is given) and returns the top entries by cumulative time
+        if not self.profiling:
+            return ""
+        self._profiler.disable()
+        self.profiling = False
+        stats = pstats.Stats(self._profiler, stream=io.StringIO())
+        with self._lock:
+            profiles, self._worker_profiles = self._worker_profiles, []
+        for profiler in profiles:
+            stats.add(profiler)
+        self._profiler = None
+        if path:
+            stats.dump_stats(path)
+        stats.sort_stats("cumulative").print_stats(limit)
+        return stats.stream.getvalue()
+
+
+def callback_name(fn):
+    name = getattr(fn, '__qualname__', None) or type(fn).__name__
+    if name.endswith("after.<locals>.callit"):
+        # after() wraps the real callback but keeps its __name__
+        return "after " + fn.__name__
+    return name
+
+
+metrics = Instrumentation()
@@ -3,68 +3,308 @@ from tkinter import ttk, messagebox
 from expense_tracker import ExpenseTracker
 from budget_manager import BudgetManager
 from data_visualizer import DataVisualizer
-import mysql.connector
-from mysql.connector import Error
+from spending_trends import SpendingTrends
+from storage import create_backend, StorageError
+from task_runner import TaskRunner
+from query_cache import QueryCache
+from finance_service import FinanceService, BUDGET_PERIODS
+from instrumentation import metrics
+import argparse
+import logging
+import os
+import sys
+import time
+
+STARTED = time.perf_counter()
+
+logger = logging.getLogger(__name__)
+
+# Time from the start of main.py to the first window being mapped. Check it
+# with `python -X importtime main.py --startup-check`, which logs the
+# measurement, exits non-zero above the target and prints per-module import
+# times to stderr.
+STARTUP_TARGET_MS = 400
+BUDGET_PERIOD_NAMES = {"week": "weekly", "month": "monthly", "year": "yearly"}
+
+DB_CONFIG = {
+    'host': 'localhost',
+    'user': 'root',
+    'password': '0000',
+    'database': 'personal_finance'
+}
+
+
+def create_storage():
+    # FINANCE_BACKEND=sqlite runs against the embedded database file instead of a MySQL server
+    return create_backend(
+        os.environ.get('FINANCE_BACKEND', 'mysql'),
+        db_config=DB_CONFIG,
+        path=os.environ.get('FINANCE_DB_PATH', 'finance.db')
+    )
+
+
+def create_service(api_url=None):
+    # With an API URL (or FINANCE_API_URL) the app is a client of a shared
+    # `main.py --serve` backend instead of opening the database itself
+    api_url = api_url or os.environ.get('FINANCE_API_URL')
+    if api_url:
+        from api_client import ApiClient
+        return ApiClient(api_url)
+    return FinanceService(create_storage(), QueryCache())
+
 
 class PersonalFinanceManager(tk.Tk):
-    def __init__(self):
+    def __init__(self, startup_check=False, api_url=None):
         super().__init__()
 
         self.title("Personal Finance Manager")
         self.geometry("800x600")
 
-        self.db_config = {
-            'host': 'localhost',
-            'user': 'root',
-            'password': '0000',
-            'database': 'personal_finance'
-        }
+        self.service = create_service(api_url)
 
-        if self.create_database():
-            self.budget_manager = BudgetManager(self.db_config)
-            self.expense_tracker = ExpenseTracker(self.db_config)
-            self.data_visualizer = DataVisualizer(self.expense_tracker, self.budget_manager)
-            self.create_widgets()
-        else:
-            self.show_error_and_exit()
+        self.runner = TaskRunner(self)
+        # Budget alerts fire on the worker that made the write and are shown on the Tk thread
+        self.service.add_alert_listener(lambda alerts: self.runner.post(self.show_budget_alerts, alerts))
+        self.database_ready = False
+        self.first_window_ms = None
+        self.startup_check = startup_check
+
+        self.budget_manager = BudgetManager(self.service, self.runner)
+        self.expense_tracker = ExpenseTracker(self.service, self.runner)
+        self.data_visualizer = DataVisualizer(self.service, self.runner)
+        self.spending_trends = SpendingTrends(self.service, self.runner)
+        self.create_widgets()
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.bind("<Map>", self.on_first_map)
+        # Ctrl+Shift+P starts and stops a profile, Ctrl+Shift+M logs the metrics collected so far
+        self.bind_all("<Control-P>", self.toggle_profile)
+        self.bind_all("<Control-M>", self.log_metrics)
+
+        # The window comes up straight away; the driver import, connection and
+        # migrations (or the API server check) run on a worker and the visible
+        # tab is built once they finish
+        self.runner.submit(self.create_database, key="bootstrap",
+                           on_success=self.on_database_ready, on_error=self.on_database_failed)
 
     def create_database(self):
-        try:
-            conn = mysql.connector.connect(
-                host=self.db_config['host'],
-                user=self.db_config['user'],
-                password=self.db_config['password']
-            )
-            if conn.is_connected():
-                cursor = conn.cursor()
-                cursor.execute(f"CREATE DATABASE IF NOT EXISTS {self.db_config['database']}")
-                cursor.close()
-                conn.close()
-                return True
-        except Error as e:
-            messagebox.showerror("Database Error", f"Error creating database: {e}")
-            return False
+        applied = self.service.open()
+        if applied:
+            logger.info("Applied schema migrations: %s", applied)
+        return applied
+
+    def on_database_ready(self, applied):
+        self.database_ready = True
+        self.on_tab_changed()
+
+    def on_database_failed(self, e):
+        self.show_error_and_exit(f"Unable to open the database: {e}")
+
+    def on_first_map(self, event):
+        # <Map> on the root's bindtag also fires for every child widget
+        if event.widget is not self or self.first_window_ms is not None:
+            return
+        self.first_window_ms = (time.perf_counter() - STARTED) * 1000
+        logger.info("First window after %.0f ms (target %d ms)", self.first_window_ms, STARTUP_TARGET_MS)
+        if self.first_window_ms > STARTUP_TARGET_MS:
+            logger.warning("Startup is over the %d ms target", STARTUP_TARGET_MS)
+        if self.startup_check:
+            self.after_idle(self.on_close)
 
     def create_widgets(self):
-        notebook = ttk.Notebook(self)
-        notebook.pack(expand=True, fill="both")
+        self.create_status_bar()
+
+        self.notebook = ttk.Notebook(self)
+        self.notebook.pack(expand=True, fill="both")
+
+        budget_frame = ttk.Frame(self.notebook)
+        expense_frame = ttk.Frame(self.notebook)
+        visualize_frame = ttk.Frame(self.notebook)
+        trends_frame = ttk.Frame(self.notebook)
 
-        budget_frame = ttk.Frame(notebook)
-        expense_frame = ttk.Frame(notebook)
-        visualize_frame = ttk.Frame(notebook)
+        self.notebook.add(budget_frame, text="Budget Manager")
+        self.notebook.add(expense_frame, text="Expense Tracker")
+        self.notebook.add(visualize_frame, text="Visualize Data")
+        self.notebook.add(trends_frame, text="Spending Trends")
+
+        # Tabs are filled in, and run their first query, the first time they are shown
+        self.tabs = {
+            str(budget_frame): (self.budget_manager, budget_frame),
+            str(expense_frame): (self.expense_tracker, expense_frame),
+            str(visualize_frame): (self.data_visualizer, visualize_frame),
+            str(trends_frame): (self.spending_trends, trends_frame),
+        }
+        self.built_tabs = set()
+        self.notebook.bind("<<NotebookTabChanged>>", self.on_tab_changed)
 
-        notebook.add(budget_frame, text="Budget Manager")
-        notebook.add(expense_frame, text="Expense Tracker")
-        notebook.add(visualize_frame, text="Visualize Data")
+    def on_tab_changed(self, event=None):
+        if not self.database_ready:
+            return
+        tab = str(self.notebook.select())
+        if tab in self.tabs and tab not in self.built_tabs:
+            self.built_tabs.add(tab)
+            component, frame = self.tabs[tab]
+            component.create_widgets(frame)
 
-        self.budget_manager.create_widgets(budget_frame)
-        self.expense_tracker.create_widgets(expense_frame)
-        self.data_visualizer.create_widgets(visualize_frame)
+    def create_status_bar(self):
+        status_bar = ttk.Frame(self)
+        status_bar.pack(side="bottom", fill="x")
 
-    def show_error_and_exit(self):
-        messagebox.showerror("Fatal Error", "Unable to connect to the database. The application will now exit.")
+        self.status_label = ttk.Label(status_bar, text="Ready")
+        self.status_label.pack(side="left", padx=5)
+        self.busy_indicator = ttk.Progressbar(status_bar, mode="indeterminate", length=120)
+
+        self.runner.add_busy_listener(self.show_busy)
+
+    def show_busy(self, busy):
+        if busy:
+            self.status_label.config(text="Working...")
+            self.busy_indicator.pack(side="right", padx=5, pady=2)
+            self.busy_indicator.start(15)
+        else:
+            self.status_label.config(text="Ready")
+            self.busy_indicator.stop()
+            self.busy_indicator.pack_forget()
+
+    def show_budget_alerts(self, alerts):
+        lines = []
+        for alert in alerts:
+            category, period = alert['category'], BUDGET_PERIOD_NAMES.get(alert['period'], alert['period'])
+            amounts = f"{alert['spent']:.2f} of {alert['budget']:.2f}"
+            if alert['threshold'] >= 100:
+                lines.append(f"{category} is over its {period} budget: {amounts}")
+            else:
+                lines.append(f"{category} has used {alert['threshold']}% of its {period} budget: {amounts}")
+        messagebox.showwarning("Budget Alert", "\n".join(lines))
+
+    def toggle_profile(self, event=None):
+        if not metrics.profiling:
+            metrics.start_profile()
+            logger.info("Profiling started")
+            return
+        path = f"finance-{time.strftime('%Y%m%d-%H%M%S')}.pstats"
+        logger.info("Profile written to %s\n%s", path, metrics.stop_profile(path))
+
+    def log_metrics(self, event=None):
+        if metrics.enabled:
+            logger.info("Metrics:\n%s", metrics.report())
+        else:
+            logger.info("Metrics are disabled; start with --metrics or FINANCE_METRICS=1")
+
+    def on_close(self):
+        try:
+            stats = self.service.stats()
+            logger.info("Connection pool stats: %s", stats['pool'])
+            logger.info("Query cache stats: %s", stats['cache'])
+        except StorageError as e:
+            logger.warning("Could not read backend stats: %s", e)
+        if metrics.profiling:
+            self.toggle_profile()
+        if metrics.enabled:
+            self.log_metrics()
+        self.runner.shutdown()
+        self.service.close()
+        self.destroy()
+
+    def show_error_and_exit(self, message):
+        # One dialog, then exit: nothing works without the database
+        messagebox.showerror("Database Error", f"{message}\n\nThe application will now exit.")
+        self.runner.shutdown()
         self.destroy()
 
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Personal Finance Manager")
+    parser.add_argument("--export", metavar="PATH",
+                        help="write expenses to PATH (.csv or .parquet) without starting the GUI")
+    parser.add_argument("--budget-report", metavar="PATH",
+                        help="write budget vs. actual per category to PATH (.csv or .parquet)")
+    parser.add_argument("--from", dest="start", metavar="YYYY-MM-DD", help="first date to include")
+    parser.add_argument("--to", dest="end", metavar="YYYY-MM-DD", help="last date to include")
+    parser.add_argument("--category", help="only export expenses in this category")
+    parser.add_argument("--period", choices=BUDGET_PERIODS, help="only report budgets set for this period")
+    parser.add_argument("--rebuild-rollup", action="store_true",
+                        help="recompute the monthly expense rollup from the expenses table and exit")
+    parser.add_argument("--serve", metavar="[HOST:]PORT",
+                        help="run the JSON API server instead of the GUI (default host 127.0.0.1)")
+    parser.add_argument("--api", metavar="URL",
+                        help="use the API server at URL instead of the database (also FINANCE_API_URL)")
+    parser.add_argument("--metrics", action="store_true",
+                        help="record latency metrics for queries and UI callbacks and log them on exit")
+    parser.add_argument("--slow-query-ms", type=float, metavar="MS",
+                        help="log queries slower than MS milliseconds (default 100, needs --metrics)")
+    parser.add_argument("--startup-check", action="store_true",
+                        help=f"open the window, log the time to first window and exit non-zero "
+                             f"if it is over {STARTUP_TARGET_MS} ms")
+    return parser.parse_args(argv)
+
+
+def run_export(args):
+    service = create_service(args.api)
+    try:
+        service.open()
+        if args.export:
+            count = service.export_expenses(args.export, args.start, args.end, args.category)
+            logger.info("Exported %d expenses to %s", count, args.export)
+        if args.budget_report:
+            count = service.export_budget_report(args.budget_report, args.start, args.end, period=args.period)
+            logger.info("Exported %d budget rows to %s", count, args.budget_report)
+    except (StorageError, ValueError, RuntimeError, OSError) as e:
+        logger.error("Export failed: %s", e)
+        return 1
+    finally:
+        service.close()
+    return 0
+
+
+def run_rebuild_rollup(args):
+    service = create_service(args.api)
+    try:
+        service.open()
+        count = service.rebuild_rollup()
+        logger.info("Rebuilt the expense rollup: %d (month, category) rows", count)
+    except StorageError as e:
+        logger.error("Rollup rebuild failed: %s", e)
+        return 1
+    finally:
+        service.close()
+    return 0
+
+
+def run_server(args):
+    import api_server
+
+    host, _, port = args.serve.rpartition(":")
+    service = FinanceService(create_storage(), QueryCache())
+    try:
+        applied = service.open()
+        if applied:
+            logger.info("Applied schema migrations: %s", applied)
+        api_server.serve(service, host or "127.0.0.1", int(port))
+    except StorageError as e:
+        logger.error("Could not open the database: %s", e)
+        return 1
+    finally:
+        service.close()
+    return 0
+
+
 if __name__ == "__main__":
-    app = PersonalFinanceManager()
-    app.mainloop()
\ No newline at end of file
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args(sys.argv[1:])
+    metrics.configure_from_env()
+    metrics.configure(enabled=True if args.metrics else None, slow_query_ms=args.slow_query_ms)
+    if args.serve:
+        status = run_server(args)
+        if metrics.enabled:
+            logger.info("Metrics:\n%s", metrics.report())
+        sys.exit(status)
+    if args.rebuild_rollup:
+        sys.exit(run_rebuild_rollup(args))
+    if args.export or args.budget_report:
+        status = run_export(args)
+        if metrics.enabled:
+            logger.info("Metrics:\n%s", metrics.report())
+        sys.exit(status)
+    app = PersonalFinanceManager(startup_check=args.startup_check, api_url=args.api)
+    app.mainloop()
+    if args.startup_check:
+        sys.exit(0 if app.first_window_ms is not None and app.first_window_ms <= STARTUP_TARGET_MS else 1)
\ No newline at end of file
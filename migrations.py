@@ -0,0 +1,287 @@
+from decimal import Decimal
+import rollup
+
+# Versioned schema changes, applied in order at startup. Each migration runs
+# once per database and is recorded in schema_version; never edit one that has
+# shipped, add a new version instead.
+#
+# MySQL commits every DDL statement on its own, so a migration that fails part
+# way keeps its earlier statements and is rerun from the top on the next start.
+# Migrations with several DDL statements therefore skip what already exists.
+
+
+def _exists(session, storage, kind, table, name):
+    # Whether table already has the named 'index', 'column' or 'constraint'
+    # (constraints are only looked up on MySQL)
+    if storage.name == 'mysql':
+        view, column = {'index': ('STATISTICS', 'INDEX_NAME'), 'column': ('COLUMNS', 'COLUMN_NAME'),
+                        'constraint': ('TABLE_CONSTRAINTS', 'CONSTRAINT_NAME')}[kind]
+        query = (f"SELECT COUNT(*) FROM information_schema.{view} "
+                 f"WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND {column} = %s")
+    elif kind == 'index':
+        query = "SELECT COUNT(*) FROM sqlite_master WHERE type = 'index' AND tbl_name = %s AND name = %s"
+    else:
+        query = "SELECT COUNT(*) FROM pragma_table_info(%s) WHERE name = %s"
+    return session.fetchone(query, (table, name))[0] > 0
+
+
+def _create_index(session, storage, name, table, columns):
+    if not _exists(session, storage, 'index', table, name):
+        session.execute(f"CREATE INDEX {name} ON {table} ({columns})")
+
+
+def _create_tables(session, storage):
+    session.execute(f'''
+        CREATE TABLE IF NOT EXISTS expenses (
+            id {storage.auto_id},
+            date DATE,
+            category VARCHAR(255),
+            amount DECIMAL(10, 2)
+        )
+        ''')
+    session.execute(f'''
+        CREATE TABLE IF NOT EXISTS budgets (
+            id {storage.auto_id},
+            category VARCHAR(255) UNIQUE,
+            amount DECIMAL(10, 2)
+        )
+        ''')
+
+
+def _add_expense_indexes(session, storage):
+    # (date, id) backs the newest-first keyset pagination of the expense list,
+    # (category, date) the per-category aggregations with a date range
+    _create_index(session, storage, "idx_expenses_date_id", "expenses", "date, id")
+    _create_index(session, storage, "idx_expenses_category_date", "expenses", "category, date")
+
+
+def _normalize_categories(session, storage):
+    session.execute(f'''
+        CREATE TABLE IF NOT EXISTS categories (
+            id {storage.auto_id},
+            name VARCHAR(255) NOT NULL UNIQUE
+        )
+        ''')
+    session.execute(
+        f"{storage.insert_ignore} INTO categories (name) "
+        "SELECT DISTINCT category FROM expenses WHERE category IS NOT NULL "
+        "UNION SELECT category FROM budgets WHERE category IS NOT NULL")
+
+    if storage.name == 'mysql':
+        for table, constraint in (("expenses", "fk_expenses_category"), ("budgets", "fk_budgets_category")):
+            if not _exists(session, storage, 'constraint', table, constraint):
+                session.execute(
+                    f"ALTER TABLE {table} ADD CONSTRAINT {constraint} "
+                    "FOREIGN KEY (category) REFERENCES categories (name) ON UPDATE CASCADE")
+        return
+
+    # SQLite cannot add a constraint to an existing table, so rebuild both
+    session.execute(f'''
+        CREATE TABLE expenses_new (
+            id {storage.auto_id},
+            date DATE,
+            category VARCHAR(255) REFERENCES categories (name) ON UPDATE CASCADE,
+            amount DECIMAL(10, 2)
+        )
+        ''')
+    session.execute("INSERT INTO expenses_new (id, date, category, amount) "
+                    "SELECT id, date, category, amount FROM expenses")
+    session.execute("DROP TABLE expenses")
+    session.execute("ALTER TABLE expenses_new RENAME TO expenses")
+    _add_expense_indexes(session, storage)
+
+    session.execute(f'''
+        CREATE TABLE budgets_new (
+            id {storage.auto_id},
+            category VARCHAR(255) UNIQUE REFERENCES categories (name) ON UPDATE CASCADE,
+            amount DECIMAL(10, 2)
+        )
+        ''')
+    session.execute("INSERT INTO budgets_new (id, category, amount) "
+                    "SELECT id, category, amount FROM budgets")
+    session.execute("DROP TABLE budgets")
+    session.execute("ALTER TABLE budgets_new RENAME TO budgets")
+
+
+def _add_expense_rollup(session, storage):
+    session.execute('''
+        CREATE TABLE IF NOT EXISTS expense_rollup (
+            month CHAR(7) NOT NULL,
+            category VARCHAR(255) NOT NULL,
+            total DECIMAL(14, 2) NOT NULL,
+            expense_count INT NOT NULL,
+            PRIMARY KEY (month, category)
+        )
+        ''')
+    rollup.populate(session, storage)
+
+
+def _add_budget_period(session, storage):
+    # Existing budgets were implicitly monthly
+    session.execute("ALTER TABLE budgets ADD COLUMN period VARCHAR(10) NOT NULL DEFAULT 'month'")
+
+
+def _add_expense_filters(session, storage):
+    # Backs the expense list filters: amount ranges and note search
+    _create_index(session, storage, "idx_expenses_amount", "expenses", "amount")
+    if not _exists(session, storage, 'column', "expenses", "note"):
+        session.execute("ALTER TABLE expenses ADD COLUMN note VARCHAR(255)")
+    if storage.name == 'mysql':
+        if not _exists(session, storage, 'index', "expenses", "ft_expenses_note"):
+            session.execute("ALTER TABLE expenses ADD FULLTEXT INDEX ft_expenses_note (note)")
+        return
+
+    # SQLite: an external-content FTS5 table over the note column, kept in
+    # step by triggers. No rows have notes yet, so there is nothing to index.
+    session.execute("CREATE VIRTUAL TABLE expense_notes USING fts5(note, content='expenses', content_rowid='id')")
+    session.execute('''
+        CREATE TRIGGER expense_notes_insert AFTER INSERT ON expenses WHEN new.note IS NOT NULL BEGIN
+            INSERT INTO expense_notes (rowid, note) VALUES (new.id, new.note);
+        END
+        ''')
+    session.execute('''
+        CREATE TRIGGER expense_notes_delete AFTER DELETE ON expenses WHEN old.note IS NOT NULL BEGIN
+            INSERT INTO expense_notes (expense_notes, rowid, note) VALUES ('delete', old.id, old.note);
+        END
+        ''')
+    session.execute('''
+        CREATE TRIGGER expense_notes_update AFTER UPDATE OF note ON expenses BEGIN
+            INSERT INTO expense_notes (expense_notes, rowid, note)
+                SELECT 'delete', old.id, old.note WHERE old.note IS NOT NULL;
+            INSERT INTO expense_notes (rowid, note) SELECT new.id, new.note WHERE new.note IS NOT NULL;
+        END
+        ''')
+    # Without statistics SQLite guesses that category = ? is more selective
+    # than a note match and scans the whole category instead
+    session.execute("ANALYZE")
+
+
+def _store_cents(session, storage):
+    # SQLite only: DECIMAL columns have NUMERIC affinity there, so amounts
+    # were held as binary floats; they become integer cents (see storage.py).
+    # The rollup is rebuilt rather than converted, its float totals having
+    # drifted from the expenses they sum.
+    if storage.name != 'sqlite':
+        return
+    for table in ("expenses", "budgets"):
+        session.execute(f"UPDATE {table} SET amount = CAST(ROUND(amount * 100) AS INTEGER) WHERE amount IS NOT NULL")
+    session.execute(f"DELETE FROM {rollup.TABLE}")
+    rollup.populate(session, storage)
+
+
+def _unique_budget_period(session, storage):
+    # A category may have one budget per period rather than one in all
+    if storage.name == 'mysql':
+        # The compound key takes over backing the category foreign key
+        if not _exists(session, storage, 'index', "budgets", "uq_budgets_category_period"):
+            session.execute("ALTER TABLE budgets ADD UNIQUE KEY uq_budgets_category_period (category, period)")
+        if _exists(session, storage, 'index', "budgets", "category"):
+            session.execute("ALTER TABLE budgets DROP INDEX category")
+        return
+
+    # SQLite cannot drop a column constraint, so rebuild the table
+    session.execute(f'''
+        CREATE TABLE budgets_new (
+            id {storage.auto_id},
+            category VARCHAR(255) REFERENCES categories (name) ON UPDATE CASCADE,
+            amount DECIMAL(10, 2),
+            period VARCHAR(10) NOT NULL DEFAULT 'month',
+            UNIQUE (category, period)
+        )
+        ''')
+    session.execute("INSERT INTO budgets_new (id, category, amount, period) "
+                    "SELECT id, category, amount, period FROM budgets")
+    session.execute("DROP TABLE budgets")
+    session.execute("ALTER TABLE budgets_new RENAME TO budgets")
+
+
+MIGRATIONS = [
+    (1, "create expenses and budgets tables", _create_tables),
+    (2, "index expenses on (date, id) and (category, date)", _add_expense_indexes),
+    (3, "categories lookup table referenced by expenses and budgets", _normalize_categories),
+    (4, "monthly (month, category) rollup of expense totals", _add_expense_rollup),
+    (5, "budget period (week, month or year), monthly by default", _add_budget_period),
+    (6, "index expense amounts; expense notes with a full-text index", _add_expense_filters),
+    (7, "SQLite amounts as integer cents", _store_cents),
+    (8, "budgets unique per category and period", _unique_budget_period),
+]
+
+
+def current_version(session):
+    row = session.fetchone("SELECT MAX(version) FROM schema_version")
+    return row[0] or 0
+
+
+def migrate(storage):
+    # Brings the schema up to date over a single connection; returns the
+    # versions applied. Safe to call on every start.
+    applied = []
+    with storage.read() as session:
+        session.execute('''
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INT PRIMARY KEY,
+                description VARCHAR(255)
+            )
+            ''')
+        storage.lock_schema(session)
+        try:
+            for version, description, upgrade in MIGRATIONS:
+                if version <= current_version(session):
+                    continue
+                session.begin()
+                try:
+                    # Re-checked inside the transaction in case another process got here first
+                    if version <= current_version(session):
+                        session.rollback()
+                        continue
+                    upgrade(session, storage)
+                    session.execute("INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+                                    (version, description))
+                    session.commit()
+                except Exception:
+                    session.rollback()
+                    raise
+                applied.append(version)
+        finally:
+            storage.unlock_schema(session)
+    return applied
+
+
+# Hot queries, the indexes each one may use and whether it may read its index
+# whole (in order, stopping at the LIMIT). Any other full scan of a table or
+# index fails the check.
+PLAN_CHECKS = [
+    ("expense page",
+     "SELECT id, date, category, amount FROM expenses ORDER BY date DESC, id DESC LIMIT 100",
+     (), ("idx_expenses_date_id",), True),
+    ("expense page after key",
+     "SELECT id, date, category, amount FROM expenses "
+     "WHERE (date, id) < (%s, %s) ORDER BY date DESC, id DESC LIMIT 100",
+     ('2024-01-01', 1), ("idx_expenses_date_id",), False),
+    ("expense page in category",
+     "SELECT id, date, category, amount FROM expenses WHERE category = %s ORDER BY date DESC, id DESC LIMIT 100",
+     ('Groceries',), ("idx_expenses_category_date",), False),
+    ("expenses in amount range",
+     "SELECT id, date, category, amount FROM expenses WHERE amount >= %s AND amount <= %s "
+     "ORDER BY date DESC, id DESC LIMIT 100",
+     (Decimal(400), Decimal(401)), ("idx_expenses_amount",), False),
+    # Either a skip scan of (category, date) or a date range of (date, id)
+    ("category totals in range",
+     "SELECT category, SUM(amount) FROM expenses WHERE date >= %s AND date <= %s GROUP BY category",
+     ('2024-01-01', '2024-12-31'), ("idx_expenses_category_date", "idx_expenses_date_id"), False),
+]
+
+
+def check_query_plans(storage):
+    # Returns (name, plan, ok) for each hot query; ok means every table read
+    # goes through one of the expected indexes and nothing is scanned whole
+    # unless the check allows it
+    results = []
+    for name, query, params, indexes, ordered in PLAN_CHECKS:
+        plan = storage.explain(query, params)
+        text = " | ".join(" ".join(str(value) for value in step.values()) for step in plan)
+        accesses = storage.plan_accesses(plan)
+        ok = bool(accesses) and all(index in indexes and (ordered or not whole)
+                                    for index, whole in accesses)
+        results.append((name, text, ok))
+    return results
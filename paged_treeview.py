@@ -0,0 +1,229 @@
+from collections import deque
+
+
+class PagedTreeview:
+    # Keeps only a sliding window of pages in a ttk.Treeview. Pages are fetched
+    # with keyset pagination: fetch_page(after=key, before=key, limit=n) returns
+    # rows in display order strictly after/before the given sort key, and
+    # key_of(row) extracts that key. Scrolling near either edge of the window
+    # loads the neighbouring page and drops the one furthest away, so the
+    # number of items in the widget never exceeds page_size * max_pages.
+
+    def __init__(self, tree, scrollbar, runner, fetch_page, key_of, job_key,
+                 page_size=100, max_pages=4, on_error=None, threshold=0.15):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.runner = runner
+        self.fetch_page = fetch_page
+        self.key_of = key_of
+        self.job_key = job_key
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.on_error = on_error
+        self.threshold = threshold
+
+        # Each page is [iids, first_key, last_key]; keys maps iid -> sort key
+        self.pages = deque()
+        self.keys = {}
+        self.has_more_after = False
+        self.has_more_before = False
+        self._loading = False
+
+        self.tree.configure(yscrollcommand=self._on_scroll)
+        self.scrollbar.configure(command=self.tree.yview)
+
+    def reload(self, fetch_page=None):
+        # A new fetch_page (e.g. with different filters) applies to this and
+        # every later page; the job key makes pages of the old one stale
+        if fetch_page is not None:
+            self.fetch_page = fetch_page
+        self._loading = True
+        self.runner.submit(self.fetch_page, None, None, self.page_size, key=self.job_key,
+                           on_success=self._show_first_page, on_error=self._failed)
+
+    def _show_first_page(self, rows):
+        self._loading = False
+        self.tree.delete(*self.tree.get_children())
+        self.pages.clear()
+        self.keys.clear()
+        self.has_more_before = False
+        self.has_more_after = len(rows) == self.page_size
+        if rows:
+            self.pages.append(self._insert_rows(rows, "end"))
+        self.tree.yview_moveto(0)
+
+    def _failed(self, e):
+        self._loading = False
+        if self.on_error:
+            self.on_error(e)
+
+    def _insert_rows(self, rows, index):
+        iids = set()
+        offset = 0
+        for row in rows:
+            # Already shown (placed by upsert_row before its page loaded)
+            if self.tree.exists(str(row[0])):
+                continue
+            position = index if index == "end" else index + offset
+            iid = self.tree.insert("", position, iid=str(row[0]), values=row)
+            self.keys[iid] = self.key_of(row)
+            iids.add(iid)
+            offset += 1
+        return [iids, self.key_of(rows[0]), self.key_of(rows[-1])]
+
+    def _drop_page(self, page):
+        self.tree.delete(*page[0])
+        for iid in page[0]:
+            del self.keys[iid]
+
+    def upsert_row(self, row):
+        # Patch a single inserted or edited row into the window at its sort
+        # position; rows that fall outside the loaded pages are left to be
+        # fetched when the user scrolls there.
+        iid = str(row[0])
+        key = self.key_of(row)
+        existing = self.tree.exists(iid)
+        if existing:
+            self._forget(iid)
+
+        page = self._page_for(key)
+        if page is None:
+            if existing:
+                self.tree.delete(iid)
+            return
+
+        if existing:
+            # Detached first so the index is computed against the other rows only
+            self.tree.detach(iid)
+        index = self._index_for(key)
+        if existing:
+            self.tree.item(iid, values=row)
+            self.tree.move(iid, "", index)
+        else:
+            self.tree.insert("", index, iid=iid, values=row)
+        self.keys[iid] = key
+        page[0].add(iid)
+
+    def remove_row(self, row_id):
+        iid = str(row_id)
+        if self.tree.exists(iid):
+            self._forget(iid)
+            self.tree.delete(iid)
+
+    def update_rows(self, rows):
+        # Bulk edits: rows whose sort key is unchanged are rewritten in place,
+        # anything else goes through upsert_row
+        for row in rows:
+            iid = str(row[0])
+            if self.tree.exists(iid) and self.keys.get(iid) == self.key_of(row):
+                self.tree.item(iid, values=row)
+            else:
+                self.upsert_row(row)
+
+    def remove_rows(self, row_ids):
+        iids = [str(row_id) for row_id in row_ids if self.tree.exists(str(row_id))]
+        for iid in iids:
+            self._forget(iid)
+        if iids:
+            self.tree.delete(*iids)
+
+    def _forget(self, iid):
+        self.keys.pop(iid, None)
+        for page in self.pages:
+            page[0].discard(iid)
+
+    def _page_for(self, key):
+        # Display order is descending by key
+        if not self.pages:
+            if self.has_more_after:
+                return None
+            self.pages.append([set(), key, key])
+            return self.pages[0]
+        first_page, last_page = self.pages[0], self.pages[-1]
+        if key > first_page[1]:
+            if self.has_more_before:
+                return None
+            first_page[1] = key
+            return first_page
+        if key < last_page[2]:
+            if self.has_more_after:
+                return None
+            last_page[2] = key
+            return last_page
+        for page in self.pages:
+            if key >= page[2]:
+                # The key may fall in the gap between this page and the one
+                # before it; the page's range has to grow to cover it, or
+                # loading the page before would fetch the row a second time
+                page[1] = max(page[1], key)
+                return page
+        return last_page
+
+    def _index_for(self, key):
+        children = self.tree.get_children()
+        low, high = 0, len(children)
+        while low < high:
+            middle = (low + high) // 2
+            if self.keys[children[middle]] > key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        if self._loading or not self.pages:
+            return
+        if float(last) >= 1.0 - self.threshold and self.has_more_after:
+            self._load_after()
+        elif float(first) <= self.threshold and self.has_more_before:
+            self._load_before()
+
+    def _load_after(self):
+        self._loading = True
+        self.runner.submit(self.fetch_page, self.pages[-1][2], None, self.page_size, key=self.job_key,
+                           on_success=self._append_page, on_error=self._failed)
+
+    def _load_before(self):
+        self._loading = True
+        self.runner.submit(self.fetch_page, None, self.pages[0][1], self.page_size, key=self.job_key,
+                           on_success=self._prepend_page, on_error=self._failed)
+
+    def _append_page(self, rows):
+        self._loading = False
+        self.has_more_after = len(rows) == self.page_size
+        if not rows:
+            return
+        anchor = self._top_item()
+        self.pages.append(self._insert_rows(rows, "end"))
+        if len(self.pages) > self.max_pages:
+            self._drop_page(self.pages.popleft())
+            self.has_more_before = True
+        self._restore_top(anchor)
+
+    def _prepend_page(self, rows):
+        self._loading = False
+        if not rows:
+            self.has_more_before = False
+            return
+        anchor = self._top_item()
+        self.pages.appendleft(self._insert_rows(rows, 0))
+        self.has_more_before = len(rows) == self.page_size
+        if len(self.pages) > self.max_pages:
+            self._drop_page(self.pages.pop())
+            self.has_more_after = True
+        self._restore_top(anchor)
+
+    def _top_item(self):
+        children = self.tree.get_children()
+        if not children:
+            return None
+        index = int(float(self.tree.yview()[0]) * len(children))
+        return children[min(index, len(children) - 1)]
+
+    def _restore_top(self, anchor):
+        # Inserting or trimming rows shifts the viewport; put the row the
+        # user was looking at back at the top
+        if anchor and self.tree.exists(anchor):
+            total = len(self.tree.get_children())
+            self.tree.yview_moveto(self.tree.index(anchor) / total)
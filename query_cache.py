@@ -0,0 +1,60 @@
+import threading
+from collections import OrderedDict
+
+
+class QueryCache:
+    # Size-bounded LRU of query results. Every entry is tagged with the tables
+    # it was computed from, and mutations invalidate by tag. A per-tag
+    # generation counter stops a load that raced with a write from storing
+    # its (possibly stale) result.
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get_or_load(self, key, tags, loader):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][1]
+            self.misses += 1
+            generations = [self._generations.get(tag, 0) for tag in tags]
+
+        value = loader()
+
+        with self._lock:
+            if generations == [self._generations.get(tag, 0) for tag in tags]:
+                self._entries[key] = (tags, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, *tags):
+        with self._lock:
+            self.invalidations += 1
+            for tag in tags:
+                self._generations[tag] = self._generations.get(tag, 0) + 1
+            stale = [key for key, (entry_tags, _) in self._entries.items()
+                     if any(tag in entry_tags for tag in tags)]
+            for key in stale:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'entries': len(self._entries),
+            }
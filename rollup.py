@@ -0,0 +1,132 @@
+import calendar
+from decimal import Decimal
+
+# expense_rollup holds SUM(amount) and COUNT(*) as total and expense_count
+# per (month, category). Every write to expenses applies its delta inside the
+# same transaction, so trend and budget queries over whole months read
+# O(months x categories) rows rather than every expense. Only the partial
+# months at the edges of a date range still come from the expenses table.
+# Totals are exact (DECIMAL on MySQL, integer cents on SQLite), so a total
+# kept up to date by deltas always equals one rebuilt from scratch.
+
+TABLE = "expense_rollup"
+
+
+def apply(storage, session, rows, sign=1):
+    # Adds (sign=1) or removes (sign=-1) (date, category, amount) rows from the
+    # rollup. Rows are summed per group first, so a batch costs one upsert per
+    # (month, category) it touches.
+    deltas = {}
+    for day, category, amount in rows:
+        if day is None or category is None or amount is None:
+            continue
+        key = (str(day)[:7], category)
+        total, count = deltas.get(key, (Decimal(0), 0))
+        deltas[key] = (total + Decimal(str(amount)), count + 1)
+    apply_groups(storage, session, [(month, category, total, count)
+                                    for (month, category), (total, count) in deltas.items()], sign)
+
+
+def apply_groups(storage, session, groups, sign=1):
+    # Same as apply() for rows already summed into (month, category, total, count)
+    if not groups:
+        return
+    session.executemany(storage.upsert_add_sql(TABLE, ["month", "category"], ["total", "expense_count"]),
+                        [(month, category, sign * Decimal(str(total)), sign * count)
+                         for month, category, total, count in groups])
+    if sign < 0:
+        session.executemany(f"DELETE FROM {TABLE} WHERE month = %s AND category = %s AND expense_count <= 0",
+                            [(month, category) for month, category, _, _ in groups])
+
+
+def grouped(storage, session, where, params, amount_sql="amount", amount_params=()):
+    # (month, category, total, count) of the expenses matching `where`, for
+    # set-based writes to adjust the rollup without reading every row.
+    # amount_sql replaces the amount, to total the values an UPDATE will write.
+    # The rows stay locked until the write commits.
+    month = storage.period_sql('month')
+    return session.fetchall(
+        f"SELECT {month}, category, {storage.money(f'SUM({amount_sql})')}, COUNT(*) FROM expenses "
+        f"WHERE date IS NOT NULL AND category IS NOT NULL AND amount IS NOT NULL AND ({where}) "
+        f"GROUP BY {month}, category" + storage.for_update,
+        list(amount_params) + list(params))
+
+
+def populate(session, storage):
+    session.execute(
+        f"INSERT INTO {TABLE} (month, category, total, expense_count) "
+        f"SELECT {storage.period_sql('month')}, category, SUM(amount), COUNT(*) FROM expenses "
+        "WHERE date IS NOT NULL AND category IS NOT NULL AND amount IS NOT NULL "
+        f"GROUP BY {storage.period_sql('month')}, category")
+
+
+def rebuild(storage):
+    # Recomputes the whole rollup from expenses, for repair after writes that
+    # bypassed the service (manual SQL, restores)
+    with storage.transaction() as session:
+        session.execute(f"DELETE FROM {TABLE}")
+        populate(session, storage)
+        row = session.fetchone(f"SELECT COUNT(*) FROM {TABLE}")
+    return row[0]
+
+
+def month_start(day):
+    return day[:8] + "01"
+
+
+def month_end(day):
+    return f"{day[:8]}{calendar.monthrange(int(day[:4]), int(day[5:7]))[1]:02d}"
+
+
+def shift_month(month, step):
+    year, index = divmod(int(month[:4]) * 12 + int(month[5:7]) - 1 + step, 12)
+    return f"{year:04d}-{index + 1:02d}"
+
+
+def split_range(start, end):
+    # Splits inclusive 'YYYY-MM-DD' bounds (None = open) into the whole months
+    # the rollup can answer, as (first, last) or None, and the raw date ranges
+    # of partial months at either edge
+    if start and end and start > end:
+        return None, []
+    first = last = None
+    raw = []
+    if start:
+        first = start[:7]
+        if start != month_start(start):
+            first = shift_month(first, 1)
+            raw.append((start, min(month_end(start), end) if end else month_end(start)))
+    if end:
+        last = end[:7]
+        if end != month_end(end):
+            last = shift_month(last, -1)
+            edge = (max(month_start(end), start) if start else month_start(end), end)
+            if edge not in raw:
+                raw.append(edge)
+    if first and last and first > last:
+        return None, raw
+    return (first, last), raw
+
+
+def monthly_source(storage, start=None, end=None):
+    # SQL for a derived table of (month, category, amount) covering the range,
+    # and its parameters; sum amount over it for totals
+    months, raw = split_range(start, end)
+    parts, params = [], []
+    if months is not None:
+        clauses = []
+        if months[0]:
+            clauses.append("month >= %s")
+            params.append(months[0])
+        if months[1]:
+            clauses.append("month <= %s")
+            params.append(months[1])
+        parts.append(f"SELECT month, category, total AS amount FROM {TABLE}"
+                     + (" WHERE " + " AND ".join(clauses) if clauses else ""))
+    for low, high in raw:
+        parts.append(f"SELECT {storage.period_sql('month')} AS month, category, amount FROM expenses "
+                     "WHERE date >= %s AND date <= %s")
+        params += [low, high]
+    if not parts:
+        parts.append(f"SELECT month, category, total AS amount FROM {TABLE} WHERE 1 = 0")
+    return "(" + " UNION ALL ".join(parts) + ") ledger", params
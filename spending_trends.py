@@ -0,0 +1,167 @@
+import tkinter as tk
+from tkinter import ttk, messagebox
+from finance_service import validate_date_range, ValidationError
+from instrumentation import metrics
+import time
+
+# Spending over time per category: daily, weekly or monthly totals, a rolling
+# average or cumulative spend. Daily totals are fetched once per date range
+# and everything else is recomputed from them with NumPy, so switching views
+# does not go back to the database. Lines are downsampled to the plot's pixel
+# width and re-sampled from the full series whenever the view is panned or
+# zoomed, so the number of drawn points stays bounded at any ledger size.
+
+VIEWS = ("Totals", "Rolling average", "Cumulative")
+TITLES = {"Totals": "Spending per {}", "Rolling average": "Rolling average of spending per {}",
+          "Cumulative": "Cumulative spending by {}"}
+DEFAULT_WINDOWS = {"day": 7, "week": 4, "month": 3}
+TOP_CATEGORIES = 8
+
+
+class SpendingTrends:
+    def __init__(self, service, runner):
+        self.service = service
+        self.runner = runner
+
+        # Created on first view, like DataVisualizer's
+        self.figure = None
+        self.ax = None
+        self.canvas = None
+        self.series = None
+        self.lines = []
+        self.resample_pending = False
+
+    def create_widgets(self, parent):
+        self.parent = parent
+
+        controls = ttk.Frame(parent)
+        controls.pack(pady=5)
+        ttk.Label(controls, text="From:").grid(row=0, column=0, padx=5)
+        self.start_entry = ttk.Entry(controls, width=12)
+        self.start_entry.grid(row=0, column=1, padx=5)
+        ttk.Label(controls, text="To:").grid(row=0, column=2, padx=5)
+        self.end_entry = ttk.Entry(controls, width=12)
+        self.end_entry.grid(row=0, column=3, padx=5)
+        ttk.Button(controls, text="Load", command=self.load_series).grid(row=0, column=4, padx=5)
+
+        self.frequency = tk.StringVar(value="week")
+        self.view = tk.StringVar(value=VIEWS[0])
+        self.window = tk.IntVar(value=DEFAULT_WINDOWS["week"])
+        ttk.Label(controls, text="Per:").grid(row=1, column=0, padx=5)
+        frequency_box = ttk.Combobox(controls, textvariable=self.frequency, values=("day", "week", "month"),
+                                     state="readonly", width=8)
+        frequency_box.grid(row=1, column=1, padx=5)
+        frequency_box.bind("<<ComboboxSelected>>", self.frequency_changed)
+        view_box = ttk.Combobox(controls, textvariable=self.view, values=VIEWS, state="readonly", width=16)
+        view_box.grid(row=1, column=2, columnspan=2, padx=5)
+        view_box.bind("<<ComboboxSelected>>", lambda event: self.plot())
+        ttk.Label(controls, text="Window:").grid(row=1, column=4, padx=5)
+        ttk.Spinbox(controls, from_=1, to=365, textvariable=self.window, width=5,
+                    command=self.plot).grid(row=1, column=5, padx=5)
+
+        self.canvas_frame = ttk.Frame(parent)
+        self.canvas_frame.pack(expand=True, fill="both")
+        self._ensure_canvas()
+        self.load_series()
+
+    def _ensure_canvas(self):
+        if self.canvas is None:
+            from matplotlib.figure import Figure
+            from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
+
+            self.figure = Figure(figsize=(8, 6))
+            self.ax = self.figure.add_subplot()
+            self.canvas = FigureCanvasTkAgg(self.figure, master=self.canvas_frame)
+            # The toolbar's pan and zoom fire xlim_changed, which re-samples the visible range
+            NavigationToolbar2Tk(self.canvas, self.canvas_frame).update()
+            self.canvas.get_tk_widget().pack(expand=True, fill="both")
+
+    def load_series(self):
+        try:
+            start, end = validate_date_range(self.start_entry.get().strip(), self.end_entry.get().strip())
+        except ValidationError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        self.runner.submit(self._fetch, start, end, key="trends",
+                           on_success=self._series_loaded, on_error=self._load_error)
+
+    def _fetch(self, start, end):
+        # Runs on a worker: one row per (day, category) with spending, as
+        # arrays ready for the UI thread to plot
+        import time_series
+        return time_series.daily_matrix(self.service.get_period_totals('day', start, end, by_category=True),
+                                        top=TOP_CATEGORIES)
+
+    def _load_error(self, e):
+        messagebox.showerror("Database Error", f"Error loading spending trends: {e}")
+
+    def _series_loaded(self, series):
+        self.series = series
+        self.plot()
+
+    def frequency_changed(self, event=None):
+        self.window.set(DEFAULT_WINDOWS[self.frequency.get()])
+        self.plot()
+
+    def plot(self):
+        import time_series
+
+        if self.series is None:
+            return
+        started = metrics.enabled and time.perf_counter()
+        days, categories, matrix = self.series
+        periods, values = time_series.resample(days, matrix, self.frequency.get())
+        view = self.view.get()
+        if view == "Rolling average":
+            try:
+                window = self.window.get()
+            except tk.TclError:
+                window = DEFAULT_WINDOWS[self.frequency.get()]
+            values = time_series.rolling_mean(values, window)
+        elif view == "Cumulative":
+            values = time_series.cumulative(values)
+
+        self.ax.clear()
+        # clear() drops axis callbacks, so the pan/zoom hook is reconnected for every plot
+        self.ax.callbacks.connect("xlim_changed", self._view_changed)
+        self.resample_pending = True
+        # Full-resolution series, kept for re-sampling on pan and zoom
+        self.x = periods
+        self.x_days = periods.astype("int64").astype(float)
+        self.lines = []
+        for category, y in zip(categories, values):
+            line, = self.ax.plot(periods[:1], y[:1], label=category)
+            self.lines.append((line, y))
+        self.ax.set_title(TITLES[view].format(self.frequency.get()))
+        self.ax.set_ylabel("Amount")
+        if self.lines:
+            self.ax.legend(loc="upper left", fontsize="small")
+            self.ax.set_xlim(periods[0], periods[-1])
+            self.ax.set_ylim(min(0.0, float(values.min())), float(values.max()) * 1.05 or 1.0)
+        self.figure.autofmt_xdate()
+        self._resample_visible()
+        if started:
+            metrics.record("chart: trends plot", time.perf_counter() - started)
+
+    def _view_changed(self, ax):
+        # xlim_changed fires for every mouse move while panning; coalesce into one re-sample per idle pass
+        if not self.resample_pending and self.lines:
+            self.resample_pending = True
+            self.parent.after_idle(self._resample_visible)
+
+    def _resample_visible(self):
+        import time_series
+
+        self.resample_pending = False
+        if not self.lines:
+            self.canvas.draw_idle()
+            return
+        low, high = self.ax.get_xlim()
+        start, stop = time_series.visible_slice(self.x_days, low, high)
+        # At most about one point per horizontal pixel
+        width = max(int(self.ax.get_window_extent().width), 100)
+        x = self.x_days[start:stop]
+        for line, y in self.lines:
+            picked = time_series.lttb(x, y[start:stop], width) + start
+            line.set_data(self.x[picked], y[picked])
+        self.canvas.draw_idle()
@@ -0,0 +1,460 @@
+import re
+import sqlite3
+import time
+from contextlib import contextmanager
+from decimal import Decimal, ROUND_HALF_UP
+from connection_pool import ConnectionPool, PoolTimeoutError
+from instrumentation import metrics
+
+
+class StorageError(Exception):
+    def __init__(self, msg, errno=None):
+        super().__init__(msg)
+        self.errno = errno
+
+
+class DuplicateKeyError(StorageError):
+    pass
+
+
+class Session:
+    # Thin cursor wrapper handed out by StorageBackend.transaction()/read().
+    # Queries are always written with %s placeholders; the backend rewrites
+    # them for its driver.
+    def __init__(self, backend, conn, cursor):
+        self.backend = backend
+        self.conn = conn
+        self.cursor = cursor
+
+    def begin(self):
+        self.backend._begin(self.conn)
+
+    def commit(self):
+        self.conn.commit()
+
+    def rollback(self):
+        self.conn.rollback()
+
+    # With metrics enabled every statement is timed and its row count
+    # recorded; fetches are also timed apart from executing the query
+
+    def execute(self, query, params=()):
+        started = metrics.enabled and time.perf_counter()
+        self.cursor.execute(self.backend.translate(query), params)
+        if started:
+            metrics.record_query("db.execute", query, params, time.perf_counter() - started, self.cursor.rowcount)
+        return self.cursor.rowcount
+
+    def insert(self, query, params=()):
+        started = metrics.enabled and time.perf_counter()
+        self.cursor.execute(self.backend.translate(query), params)
+        if started:
+            metrics.record_query("db.insert", query, params, time.perf_counter() - started, 1)
+        return self.cursor.lastrowid
+
+    def executemany(self, query, seq_of_params):
+        started = metrics.enabled and time.perf_counter()
+        self.cursor.executemany(self.backend.translate(query), seq_of_params)
+        if started:
+            metrics.record_query("db.executemany", query, (), time.perf_counter() - started,
+                                 self.cursor.rowcount)
+        return self.cursor.rowcount
+
+    def fetchall(self, query, params=()):
+        started = metrics.enabled and time.perf_counter()
+        self.cursor.execute(self.backend.translate(query), params)
+        if not started:
+            return self.cursor.fetchall()
+        executed = time.perf_counter()
+        rows = self.cursor.fetchall()
+        finished = time.perf_counter()
+        metrics.record("db.fetch", finished - executed, len(rows))
+        metrics.record_query("db.fetchall", query, params, finished - started, len(rows))
+        return rows
+
+    def fetchone(self, query, params=()):
+        started = metrics.enabled and time.perf_counter()
+        self.cursor.execute(self.backend.translate(query), params)
+        row = self.cursor.fetchone()
+        if started:
+            metrics.record_query("db.fetchone", query, params, time.perf_counter() - started,
+                                 0 if row is None else 1)
+        return row
+
+
+class StorageBackend:
+    name = None
+    # Column definition for an auto-incrementing integer primary key
+    auto_id = None
+    # Insert that silently skips rows violating a unique key
+    insert_ignore = None
+    # Appended to a SELECT inside a transaction to lock the rows it reads
+    for_update = ''
+    driver_error = Exception
+
+    def __init__(self, pool_size=4):
+        self.pool_size = pool_size
+        self.pool = None
+        self._translated = {}
+
+    def _connect(self):
+        raise NotImplementedError
+
+    def _ping(self, conn):
+        return True
+
+    def _is_fatal(self, exc):
+        return False
+
+    def _begin(self, conn):
+        raise NotImplementedError
+
+    def _translate_error(self, exc):
+        return StorageError(str(exc))
+
+    def lock_schema(self, session):
+        pass
+
+    def unlock_schema(self, session):
+        pass
+
+    def explain(self, query, params=()):
+        raise NotImplementedError
+
+    def plan_accesses(self, plan):
+        # (index or None, whole) for each table read in an explain() plan;
+        # whole means the entire table or index is read
+        raise NotImplementedError
+
+    def ensure_category(self, session, name):
+        # expenses.category and budgets.category reference categories.name
+        session.execute(f"{self.insert_ignore} INTO categories (name) VALUES (%s)", (name,))
+
+    def upsert_add_sql(self, table, keys, columns):
+        # INSERT of keys + columns that, when the key row exists, adds the
+        # values to its columns instead
+        raise NotImplementedError
+
+    def note_match_sql(self, words):
+        # Condition on expenses, and its parameters, matching rows whose note
+        # has a word starting with each of `words`, answered from the
+        # full-text index on expenses.note. Words contain only \w characters.
+        raise NotImplementedError
+
+    def money(self, expr):
+        # Select-list entry for a computed money value (SUM, COALESCE, ...),
+        # so it reads back as a Decimal like a stored DECIMAL column does
+        return expr
+
+    def round_money(self, expr):
+        # expr rounded to whole cents, as stored in a DECIMAL column
+        return f"ROUND({expr}, 2)"
+
+    def open(self):
+        # No connection is opened here; the first session (normally the
+        # schema migration at startup) opens the first pooled connection
+        self.pool = ConnectionPool(self._timed_connect, size=self.pool_size,
+                                   ping=self._ping, is_fatal=self._is_fatal)
+
+    def _timed_connect(self):
+        with metrics.timer("db.connect"):
+            return self._connect()
+
+    def close(self):
+        if self.pool:
+            self.pool.close()
+
+    def stats(self):
+        return self.pool.stats() if self.pool else {}
+
+    def translate(self, query):
+        return query
+
+    def period_sql(self, period, column='date'):
+        # SQL expression bucketing a DATE column into a sortable text label.
+        # Written without '%' so it is safe inside parameterised queries.
+        if period == 'day':
+            return f"CAST({column} AS CHAR)"
+        if period == 'month':
+            return f"SUBSTR(CAST({column} AS CHAR), 1, 7)"
+        if period == 'year':
+            return f"SUBSTR(CAST({column} AS CHAR), 1, 4)"
+        raise ValueError(f"Unsupported period: {period}")
+
+    @contextmanager
+    def _session(self, write):
+        try:
+            started = metrics.enabled and time.perf_counter()
+            with self.pool.connection() as conn:
+                if started:
+                    metrics.record("db.checkout", time.perf_counter() - started)
+                cursor = conn.cursor()
+                try:
+                    if write:
+                        self._begin(conn)
+                    yield Session(self, conn, cursor)
+                    if write:
+                        with metrics.timer("db.commit"):
+                            conn.commit()
+                finally:
+                    cursor.close()
+        except self.driver_error as e:
+            raise self._translate_error(e) from e
+        except PoolTimeoutError as e:
+            raise StorageError(str(e)) from e
+
+    def transaction(self):
+        return self._session(write=True)
+
+    def read(self):
+        return self._session(write=False)
+
+    def execute(self, query, params=()):
+        with self.transaction() as session:
+            return session.execute(query, params)
+
+    def insert(self, query, params=()):
+        with self.transaction() as session:
+            return session.insert(query, params)
+
+    def executemany(self, query, seq_of_params):
+        with self.transaction() as session:
+            return session.executemany(query, seq_of_params)
+
+    def fetchall(self, query, params=()):
+        with self.read() as session:
+            return session.fetchall(query, params)
+
+    def fetchone(self, query, params=()):
+        with self.read() as session:
+            return session.fetchone(query, params)
+
+    def stream(self, query, params=(), size=1000):
+        # Yields lists of at most `size` rows from an unbuffered cursor, so the
+        # full result never sits in memory. Holds a pooled connection until the
+        # generator is exhausted or closed.
+        with self.read() as session:
+            started = metrics.enabled and time.perf_counter()
+            session.cursor.execute(self.translate(query), params)
+            if started:
+                metrics.record_query("db.stream", query, params, time.perf_counter() - started)
+            while True:
+                started = metrics.enabled and time.perf_counter()
+                rows = session.cursor.fetchmany(size)
+                if started:
+                    metrics.record("db.fetch", time.perf_counter() - started, len(rows))
+                if not rows:
+                    break
+                yield rows
+
+
+class MySQLBackend(StorageBackend):
+    name = 'mysql'
+    auto_id = 'INT AUTO_INCREMENT PRIMARY KEY'
+    insert_ignore = 'INSERT IGNORE'
+    for_update = ' FOR UPDATE'
+    # InnoDB's default innodb_ft_min_token_size: shorter words are never
+    # indexed, so MATCH ... AGAINST cannot find them
+    ft_min_token_size = 3
+
+    def __init__(self, db_config, pool_size=4):
+        super().__init__(pool_size)
+        self.db_config = db_config
+
+    def open(self):
+        # Imported here so SQLite-only installs never need the MySQL driver,
+        # and so the import runs with the rest of the startup bootstrap
+        import mysql.connector
+        self.connector = mysql.connector
+        self.driver_error = mysql.connector.Error
+        super().open()
+
+    def _create_database(self):
+        try:
+            conn = self.connector.connect(
+                host=self.db_config['host'],
+                user=self.db_config['user'],
+                password=self.db_config['password']
+            )
+            try:
+                cursor = conn.cursor()
+                cursor.execute(f"CREATE DATABASE IF NOT EXISTS {self.db_config['database']}")
+                cursor.close()
+            finally:
+                conn.close()
+        except self.driver_error as e:
+            raise self._translate_error(e) from e
+
+    def _connect(self):
+        # Default cursors are unbuffered, which stream() relies on.
+        # Autocommit keeps plain reads from pinning a stale snapshot on a
+        # pooled connection; writes open an explicit transaction instead.
+        try:
+            return self.connector.connect(autocommit=True, **self.db_config)
+        except self.driver_error as e:
+            # 1049 unknown database: only the very first start pays for the
+            # extra server-level connection that creates it
+            if e.errno != 1049:
+                raise
+        self._create_database()
+        return self.connector.connect(autocommit=True, **self.db_config)
+
+    def _ping(self, conn):
+        return conn.is_connected()
+
+    def _is_fatal(self, exc):
+        # Client-side errors (2000+) mean the socket itself is suspect
+        errno = getattr(exc, 'errno', None)
+        return isinstance(exc, self.driver_error) and (errno is None or errno >= 2000)
+
+    def _begin(self, conn):
+        conn.start_transaction()
+
+    def upsert_add_sql(self, table, keys, columns):
+        names = ", ".join(keys + columns)
+        placeholders = ", ".join(["%s"] * (len(keys) + len(columns)))
+        updates = ", ".join(f"{column} = {column} + VALUES({column})" for column in columns)
+        return f"INSERT INTO {table} ({names}) VALUES ({placeholders}) ON DUPLICATE KEY UPDATE {updates}"
+
+    def note_match_sql(self, words):
+        # Boolean mode: every word required (+), as a prefix (*). Words too
+        # short for the full-text index fall back to a word-start REGEXP,
+        # which scans the rows the other conditions leave.
+        indexed = [word for word in words if len(word) >= self.ft_min_token_size]
+        short = [word for word in words if len(word) < self.ft_min_token_size]
+        clauses, params = [], []
+        if indexed:
+            clauses.append("MATCH (note) AGAINST (%s IN BOOLEAN MODE)")
+            params.append(" ".join(f"+{word}*" for word in indexed))
+        for word in short:
+            clauses.append("note REGEXP %s")
+            params.append(rf"\b{word}")
+        return " AND ".join(clauses), params
+
+    def lock_schema(self, session):
+        # DDL is not transactional in MySQL, so concurrent starts serialise on a named lock
+        session.fetchone("SELECT GET_LOCK('finance_schema', 60)")
+
+    def unlock_schema(self, session):
+        session.fetchone("SELECT RELEASE_LOCK('finance_schema')")
+
+    def explain(self, query, params=()):
+        # One row per table access; 'key' is the index used, if any
+        with self.read() as session:
+            session.cursor.execute("EXPLAIN " + self.translate(query), params)
+            columns = [column[0] for column in session.cursor.description]
+            return [dict(zip(columns, row)) for row in session.cursor.fetchall()]
+
+    def plan_accesses(self, plan):
+        # type ALL reads the whole table, index the whole of an index
+        return [(step['key'], step['type'] in ('ALL', 'index')) for step in plan if step.get('table')]
+
+    def period_sql(self, period, column='date'):
+        if period == 'week':
+            # Monday of the ISO week
+            return f"CAST(DATE_SUB({column}, INTERVAL WEEKDAY({column}) DAY) AS CHAR)"
+        return super().period_sql(period, column)
+
+    def _translate_error(self, exc):
+        if exc.errno == 1062:
+            return DuplicateKeyError(str(exc), errno=exc.errno)
+        return StorageError(str(exc), errno=exc.errno)
+
+
+class SQLiteBackend(StorageBackend):
+    name = 'sqlite'
+    auto_id = 'INTEGER PRIMARY KEY AUTOINCREMENT'
+    insert_ignore = 'INSERT OR IGNORE'
+    driver_error = sqlite3.Error
+
+    def __init__(self, path, pool_size=4):
+        # Every connection to ':memory:' is its own database, so never pool more than one
+        super().__init__(1 if path == ':memory:' else pool_size)
+        self.path = path
+
+    def _connect(self):
+        # isolation_level=None leaves transaction control to _begin();
+        # the statement cache keeps hot queries prepared between calls.
+        # detect_types applies the DECIMAL converter registered below.
+        conn = sqlite3.connect(self.path, check_same_thread=False,
+                               isolation_level=None, cached_statements=256,
+                               detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    def _begin(self, conn):
+        # IMMEDIATE takes the write lock up front: a deferred transaction that
+        # reads before writing can fail outright if another writer commits first
+        conn.execute("BEGIN IMMEDIATE")
+
+    def upsert_add_sql(self, table, keys, columns):
+        names = ", ".join(keys + columns)
+        placeholders = ", ".join(["%s"] * (len(keys) + len(columns)))
+        updates = ", ".join(f"{column} = {column} + excluded.{column}" for column in columns)
+        return (f"INSERT INTO {table} ({names}) VALUES ({placeholders}) "
+                f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {updates}")
+
+    def note_match_sql(self, words):
+        # expense_notes is an FTS5 index over expenses.note keyed by expense id
+        return ("id IN (SELECT rowid FROM expense_notes WHERE expense_notes MATCH %s)",
+                [" ".join(f'"{word}"*' for word in words)])
+
+    def money(self, expr):
+        # Computed columns have no declared type; the column name gives one
+        return f'{expr} AS "amount [DECIMAL]"'
+
+    def round_money(self, expr):
+        # Amounts are integer cents here
+        return f"CAST(ROUND({expr}) AS INTEGER)"
+
+    def explain(self, query, params=()):
+        with self.read() as session:
+            rows = session.fetchall("EXPLAIN QUERY PLAN " + query, params)
+            return [{'detail': row[-1]} for row in rows]
+
+    def plan_accesses(self, plan):
+        # SCAN reads a whole table or index, SEARCH a range of one
+        accesses = []
+        for step in plan:
+            match = re.match(r"(SCAN|SEARCH)(?: TABLE)? \S+(?: USING (?:COVERING )?INDEX (\w+))?", step['detail'])
+            if match:
+                accesses.append((match.group(2), match.group(1) == 'SCAN'))
+        return accesses
+
+    def period_sql(self, period, column='date'):
+        if period == 'week':
+            # Monday of the ISO week
+            return f"date({column}, '-6 days', 'weekday 1')"
+        return super().period_sql(period, column)
+
+    def translate(self, query):
+        translated = self._translated.get(query)
+        if translated is None:
+            translated = self._translated[query] = query.replace('%s', '?')
+        return translated
+
+    def _translate_error(self, exc):
+        if isinstance(exc, sqlite3.IntegrityError) and 'UNIQUE' in str(exc):
+            return DuplicateKeyError(str(exc))
+        return StorageError(str(exc))
+
+
+# SQLite gives DECIMAL columns NUMERIC affinity, which turns decimal text into
+# a binary float that SUM() drifts on. Money is stored as integer cents
+# instead: Decimals are written as cents and DECIMAL columns (or money()
+# aliases) read back as Decimals. DATE columns stay 'YYYY-MM-DD' text rather
+# than going through the sqlite3 module's default date converter.
+sqlite3.register_adapter(Decimal, lambda value: int(value.scaleb(2).quantize(Decimal(1), ROUND_HALF_UP)))
+sqlite3.register_converter("DECIMAL", lambda value: Decimal(round(Decimal(value.decode()))).scaleb(-2))
+sqlite3.register_converter("DATE", bytes.decode)
+
+
+def create_backend(kind, db_config=None, path=None, pool_size=4):
+    if kind == 'mysql':
+        return MySQLBackend(db_config, pool_size=pool_size)
+    if kind == 'sqlite':
+        return SQLiteBackend(path, pool_size=pool_size)
+    raise ValueError(f"Unknown storage backend: {kind}")
@@ -0,0 +1,135 @@
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from instrumentation import metrics, callback_name
+
+
+class TaskRunner:
+    # Runs database and aggregation jobs off the Tk thread. Workers never touch
+    # widgets: finished jobs are queued and drained on the mainloop via after().
+
+    def __init__(self, root, max_workers=4, poll_interval=20):
+        self.root = root
+        self.poll_interval = poll_interval
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="finance-worker")
+
+        self._done = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._generations = {}
+        self._futures = {}
+        self._pending = 0
+        self._polling = False
+        self._busy_listeners = []
+
+    def add_busy_listener(self, callback):
+        self._busy_listeners.append(callback)
+
+    def is_busy(self):
+        return self._pending > 0
+
+    def submit(self, fn, *args, key=None, on_success=None, on_error=None):
+        # Jobs sharing a key supersede each other: an older job that has not
+        # started yet is cancelled, one already running has its result dropped.
+        generation = None
+        if key is not None:
+            with self._lock:
+                generation = self._generations.get(key, 0) + 1
+                self._generations[key] = generation
+                previous = self._futures.pop(key, None)
+            if previous is not None and previous.cancel():
+                self._finish_one()
+
+        self._start_one()
+        future = self.executor.submit(self._run, fn, args, key, generation, on_success, on_error)
+        if key is not None:
+            with self._lock:
+                self._futures[key] = future
+        return future
+
+    def cancel(self, key):
+        with self._lock:
+            self._generations[key] = self._generations.get(key, 0) + 1
+            future = self._futures.pop(key, None)
+        if future is not None and future.cancel():
+            self._finish_one()
+
+    def post(self, callback, value):
+        # Lets a running job hand intermediate results (e.g. progress) to the
+        # Tk thread; delivered on the next poll while the job is still pending
+        self._done.put((None, None, callback, value, False))
+
+    def _run(self, fn, args, key, generation, on_success, on_error):
+        # Job wall time is also kept while profiling, since a job may not get
+        # a profiler of its own (see PROFILE_PER_THREAD)
+        started = (metrics.enabled or metrics.profiling) and time.perf_counter()
+        try:
+            result = metrics.profile_call(fn, *args) if metrics.profiling else fn(*args)
+        except Exception as e:
+            self._done.put((key, generation, on_error, e, True))
+        else:
+            self._done.put((key, generation, on_success, result, True))
+        finally:
+            if started:
+                metrics.record("job: " + callback_name(fn), time.perf_counter() - started)
+
+    def _is_current(self, key, generation):
+        if key is None:
+            return True
+        with self._lock:
+            current = self._generations.get(key) == generation
+            if current:
+                self._futures.pop(key, None)
+            return current
+
+    def _start_one(self):
+        self._pending += 1
+        if self._pending == 1:
+            self._notify_busy(True)
+        if not self._polling:
+            self._polling = True
+            self.root.after(self.poll_interval, self._poll)
+
+    def _finish_one(self):
+        self._pending -= 1
+        if self._pending == 0:
+            self._notify_busy(False)
+
+    def _notify_busy(self, busy):
+        for callback in self._busy_listeners:
+            callback(busy)
+
+    def _poll(self):
+        try:
+            while True:
+                try:
+                    key, generation, callback, value, finished = self._done.get_nowait()
+                except queue.Empty:
+                    break
+                if finished:
+                    self._finish_one()
+                if callback is not None and self._is_current(key, generation):
+                    self._deliver(callback, value)
+        finally:
+            # Rescheduled even if something above fails, or no later result would ever be delivered
+            if self._pending > 0:
+                self.root.after(self.poll_interval, self._poll)
+            else:
+                self._polling = False
+
+    def _deliver(self, callback, value):
+        # Result handlers are where rows land in Treeviews and charts. One
+        # that raises is reported like any Tk callback error and does not
+        # stop the results queued behind it.
+        started = metrics.enabled and time.perf_counter()
+        try:
+            callback(value)
+        except Exception:
+            self.root.report_callback_exception(*sys.exc_info())
+        finally:
+            if started:
+                metrics.record("ui: " + callback_name(callback), time.perf_counter() - started)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,47 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from finance_service import FinanceService
+from migrations import migrate
+from query_cache import QueryCache
+from storage import create_backend
+
+# Tests taking `storage` or `service` run once per backend, so both pass the
+# same behavioural checks. SQLite gets a fresh file per test; MySQL runs only
+# with FINANCE_TEST_MYSQL=1 against TEST_DB_CONFIG, whose tables are dropped
+# first.
+
+TEST_DB_CONFIG = {
+    'host': os.environ.get('FINANCE_TEST_MYSQL_HOST', 'localhost'),
+    'user': 'root',
+    'password': '0000',
+    'database': 'personal_finance_test'
+}
+
+
+@pytest.fixture(params=["sqlite", "mysql"])
+def storage(request, tmp_path):
+    if request.param == "mysql":
+        if not os.environ.get("FINANCE_TEST_MYSQL"):
+            pytest.skip("set FINANCE_TEST_MYSQL=1 to run against a MySQL server")
+        pytest.importorskip("mysql.connector")
+    storage = create_backend(request.param, db_config=TEST_DB_CONFIG, path=str(tmp_path / "finance.db"))
+    storage.open()
+    if request.param == "mysql":
+        for table in ("expense_rollup", "expenses", "budgets", "categories", "schema_version"):
+            storage.execute(f"DROP TABLE IF EXISTS {table}")
+    migrate(storage)
+    yield storage
+    storage.close()
+
+
+@pytest.fixture
+def service(storage):
+    # FinanceService.open() minus opening and migrating the storage again
+    service = FinanceService(storage, QueryCache())
+    service.alerts.refresh()
+    return service
@@ -0,0 +1,92 @@
+import json
+import select
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from api_client import ApiClient
+from storage import StorageError
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    # Drops the connection without answering the requests listed in
+    # server.drops, then answers {"count": 3} to the rest
+    protocol_version = "HTTP/1.1"
+
+    def handle_one_request(self):
+        super().handle_one_request()
+        if self.server.close_after_reply:
+            self.close_connection = True
+
+    def _serve(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        self.server.seen.append(self.command)
+        if self.server.drops and self.server.drops[0] == self.command:
+            self.server.drops.pop(0)
+            self.close_connection = True
+            return
+        body = json.dumps({"count": 3}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = _serve
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FlakyHandler)
+    server.seen, server.drops, server.close_after_reply = [], [], False
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def client_for(server):
+    return ApiClient(f"http://127.0.0.1:{server.server_address[1]}")
+
+
+def test_reads_are_retried_after_a_dropped_connection(server):
+    server.drops = ["GET"]
+    assert client_for(server).count_expenses() == 3
+    assert server.seen == ["GET", "GET"]
+
+
+def test_writes_are_not_repeated_after_a_dropped_connection(server):
+    server.drops = ["POST"]
+    with pytest.raises(StorageError):
+        client_for(server).request("POST", "/expenses", body={})
+    assert server.seen == ["POST"]
+
+
+def test_writes_use_a_fresh_connection_once_the_server_closed_it(server):
+    server.close_after_reply = True
+    client = client_for(server)
+    assert client.count_expenses() == 3
+    server.close_after_reply = False
+    # Until the server's close has reached the client
+    select.select([client._local.conn.sock], [], [], 5)
+    assert client.request("POST", "/expenses", body={}) == {"count": 3}
+    assert server.seen == ["GET", "POST"]
+
+
+def test_close_closes_every_threads_connection(server):
+    client = client_for(server)
+    threads = [threading.Thread(target=client.count_expenses) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    connections = list(client._connections)
+    assert len(connections) == 3 and all(conn.sock is not None for conn in connections)
+    client.close()
+    assert all(conn.sock is None for conn in connections)
+    assert client.count_expenses() == 3
@@ -0,0 +1,132 @@
+import asyncio
+import csv
+import functools
+import http.client
+import json
+import threading
+from decimal import Decimal
+
+import pytest
+
+import benchmark
+import exporter
+from api_client import ApiClient
+from api_server import ApiServer
+from finance_service import ValidationError
+
+
+@pytest.fixture
+def api(service):
+    # The real server on its own event loop thread, over the test database
+    server = ApiServer(service, port=0)
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+
+    def run():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(server.start())
+        started.set()
+        loop.run_forever()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    assert started.wait(5)
+    client = ApiClient(f"http://127.0.0.1:{server.port}")
+    yield client
+    client.close()
+
+    async def stop():
+        # Open keep-alive connections are cancelled so their handlers close them
+        server.close()
+        handlers = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in handlers:
+            task.cancel()
+        await asyncio.gather(*handlers, return_exceptions=True)
+
+    asyncio.run_coroutine_threadsafe(stop(), loop).result(5)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+    loop.close()
+
+
+def raw(api, request):
+    # Sends bytes as they are and returns (status, payload)
+    conn = http.client.HTTPConnection(api.host, api.port, timeout=5)
+    try:
+        conn.connect()
+        conn.sock.sendall(request)
+        response = http.client.HTTPResponse(conn.sock, method="POST")
+        response.begin()
+        return response.status, json.loads(response.read())
+    finally:
+        conn.close()
+
+
+def test_expense_round_trip(api):
+    expense_id, day, category, amount, note = api.insert_expense("2024-03-05", "Groceries", "10.10", "weekly shop")
+    assert (day, category, amount, note) == ("2024-03-05", "Groceries", Decimal("10.10"), "weekly shop")
+    assert api.save_expense(expense_id, "2024-03-06", "Groceries", "20.19") == \
+        (expense_id, "2024-03-06", "Groceries", Decimal("20.19"), "")
+    assert [row[:4] for row in api.fetch_expense_page()] == [(expense_id, "2024-03-06", "Groceries", Decimal("20.19"))]
+    assert api.get_category_totals() == [("Groceries", Decimal("20.19"))]
+    assert api.remove_expense(expense_id) == 1
+    assert api.fetch_expense_page() == []
+
+
+def test_export_pages_through_the_server(api, tmp_path):
+    for day in range(1, 8):
+        api.insert_expense(f"2024-03-{day:02d}", "Groceries", f"{day}.05", f"day {day}")
+    api.export_page = functools.partial(type(api).export_page, api, limit=3)
+    path = tmp_path / "expenses.csv"
+    assert api.export_expenses(str(path)) == 7
+    with open(path, newline="", encoding="utf-8") as exported:
+        rows = list(csv.reader(exported))
+    assert rows[0] == list(exporter.EXPENSE_COLUMNS)
+    assert [row[1:] for row in rows[1:3]] == [["2024-03-01", "Groceries", "1.05", "day 1"],
+                                              ["2024-03-02", "Groceries", "2.05", "day 2"]]
+    assert len(rows) == 8
+
+
+def test_budget_update_keeps_its_period(api):
+    budget_id = api.insert_budget("Groceries", "100", "week")[0]
+    assert api.save_budget(budget_id, "Groceries", "120") == (budget_id, "Groceries", Decimal("120.00"), "week")
+    assert api.save_budget(budget_id, "Groceries", "400", "month")[3] == "month"
+    assert api.list_budgets() == [(budget_id, "Groceries", Decimal("400.00"), "month")]
+    assert api.remove_budget(budget_id) == 1
+    assert api.list_budgets() == []
+
+
+def test_missing_rows_are_not_found(api):
+    assert api.save_expense(999999, "2024-03-05", "Groceries", "1") is None
+    assert api.remove_expense(999999) == 0
+    assert api.save_budget(999999, "Groceries", "1") is None
+    assert api.remove_budget(999999) == 0
+    assert raw(api, b"GET /nowhere HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n")[0] == 404
+    assert raw(api, b"DELETE /budgets HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n")[0] == 405
+
+
+def test_bad_requests_are_rejected(api):
+    with pytest.raises(ValidationError):
+        api.insert_expense("2024-13-01", "Groceries", "1")
+    with pytest.raises(ValidationError):
+        api.insert_budget("Groceries", "1", "fortnight")
+    assert raw(api, b"POST /expenses HTTP/1.1\r\nContent-Length: 3\r\n\r\n{x}")[0] == 400
+    for length in (b"abc", b"-5", b"1_0"):
+        status, payload = raw(api, b"POST /expenses HTTP/1.1\r\nContent-Length: " + length + b"\r\n\r\n{}")
+        assert status == 400, length
+        assert "Content-Length" in payload["error"]
+    # The server is still serving after the rejected requests
+    assert api.count_expenses() == 0
+
+
+def test_concurrent_clients_at_pool_size(api, service):
+    # More clients than pooled connections, so requests queue on the pool
+    clients = service.storage.pool_size * 2
+    benchmark.load_test(f"http://{api.host}:{api.port}", clients, 40)
+    pool = service.stats()["pool"]
+    assert pool["open"] <= service.storage.pool_size
+    count = api.count_expenses()
+    assert count % 50 == 0
+    totals = api.get_category_totals()
+    assert sum(total for _, total in totals) == \
+        service.storage.fetchone(f"SELECT {service.storage.money('SUM(amount)')} FROM expenses")[0] or Decimal(0)
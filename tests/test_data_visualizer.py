@@ -0,0 +1,56 @@
+import gc
+import resource
+import sys
+from decimal import Decimal
+
+import pytest
+
+pytest.importorskip("matplotlib")
+
+from benchmark import headless_visualizer
+
+REFRESHES = 2000
+# Refreshes between renders through the Agg canvas; the others skip drawing,
+# which only reads the state a refresh leaves behind
+RENDER_EVERY = 50
+CATEGORIES = [f"Category {index}" for index in range(6)]
+
+
+def peak_rss():
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def refresh(visualizer, step):
+    # Mostly budget bars redrawn in place; every tenth refresh shows other
+    # categories (a rebuild) and every fiftieth switches to the pie
+    totals = [(category, Decimal(step % 97 + index)) for index, category in enumerate(CATEGORIES)]
+    if step % 50 == 0:
+        visualizer._draw_expenses(totals)
+    else:
+        shown = totals if step % 10 else totals[:-1]
+        visualizer._draw_budget_comparison([(category, "month", Decimal(500), total)
+                                                for category, total in shown])
+
+
+def test_chart_refreshes_do_not_grow_memory():
+    import matplotlib.pyplot as plt
+
+    visualizer = headless_visualizer(None)
+    render = visualizer.canvas.draw_idle
+    visualizer.canvas.draw_idle = lambda: None
+    for step in range(100):
+        refresh(visualizer, step)
+        render()
+    gc.collect()
+    baseline = peak_rss()
+    for step in range(REFRESHES):
+        refresh(visualizer, step)
+        if step % RENDER_EVERY == 0:
+            render()
+    gc.collect()
+    growth = peak_rss() - baseline
+    assert growth < 16 * 1024 * 1024, f"peak RSS grew {growth} bytes over {REFRESHES} refreshes"
+    assert len(visualizer.figure.axes) == 1 and len(visualizer.ax.containers) == 2
+    assert plt.get_fignums() == []
@@ -0,0 +1,41 @@
+import csv
+from decimal import Decimal
+
+import pytest
+
+import exporter
+
+pq = pytest.importorskip("pyarrow.parquet")
+
+
+def test_empty_parquet_export_keeps_its_schema(service, tmp_path):
+    path = tmp_path / "report.parquet"
+    assert exporter.write_budget_report([[], []], str(path)) == 0
+    assert service.export_budget_report(str(path)) == 0
+    table = pq.read_table(path)
+    assert table.num_rows == 0
+    assert table.schema.names == list(exporter.BUDGET_REPORT_COLUMNS)
+
+
+def test_parquet_expense_export_is_exact(service, tmp_path):
+    service.insert_expense("2024-03-05", "Groceries", "10.10", "weekly shop")
+    service.insert_expense("2024-03-06", "Groceries", "0.09")
+    path = tmp_path / "expenses.parquet"
+    assert service.export_expenses(str(path)) == 2
+    table = pq.read_table(path)
+    assert table.schema.names == list(exporter.EXPENSE_COLUMNS)
+    assert table.column("amount").to_pylist() == [Decimal("10.10"), Decimal("0.09")]
+    assert table.column("note").to_pylist() == ["weekly shop", ""]
+
+
+def test_csv_expense_export_has_notes(service, tmp_path):
+    first = service.insert_expense("2024-03-05", "Groceries", "10.10", "weekly shop")[0]
+    second = service.insert_expense("2024-03-06", "Rent", "900")[0]
+    path = tmp_path / "expenses.csv"
+    assert service.export_expenses(str(path)) == 2
+    with open(path, newline="", encoding="utf-8") as exported:
+        assert list(csv.reader(exported)) == [
+            list(exporter.EXPENSE_COLUMNS),
+            [str(first), "2024-03-05", "Groceries", "10.10", "weekly shop"],
+            [str(second), "2024-03-06", "Rent", "900.00", ""],
+        ]
@@ -0,0 +1,168 @@
+import csv
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+import migrations
+from finance_service import ValidationError, budget_order
+from storage import DuplicateKeyError
+
+AMOUNTS = ["0.01", "0.10", "0.20", "10.10", "10.09", "20.19", "99999999.99", "-5.10"]
+
+
+def test_amounts_round_trip_as_decimal(service):
+    for amount in AMOUNTS:
+        service.insert_expense("2024-03-05", "Groceries", amount)
+    stored = [row[2] for row in service.get_expenses()]
+    assert sorted(stored) == sorted(Decimal(amount) for amount in AMOUNTS)
+    assert all(isinstance(amount, Decimal) for amount in stored)
+    page = service.fetch_expense_page()
+    assert sorted(row[3] for row in page) == sorted(Decimal(amount) for amount in AMOUNTS)
+
+
+def test_totals_are_exact(service):
+    amounts = ["0.10"] * 97 + ["10.10", "10.09", "0.07"]
+    for index, amount in enumerate(amounts):
+        service.insert_expense(f"2024-03-{index % 28 + 1:02d}", "Groceries", amount)
+    expected = sum(Decimal(amount) for amount in amounts)
+    assert service.get_category_totals() == [("Groceries", expected)]
+    assert service.get_category_totals("2024-03-02", "2024-03-31") == [
+        ("Groceries", expected - sum(Decimal(amount) for amount in amounts[::28]))]
+    assert service.get_period_totals("month") == [("2024-03", expected)]
+    assert sum(total for _, total in service.get_period_totals("day")) == expected
+
+
+def test_budget_comparison_is_exact(service):
+    service.insert_budget("Groceries", "20.19")
+    service.insert_budget("Rent", "900")
+    service.insert_expense("2024-03-05", "Groceries", "10.10")
+    service.insert_expense("2024-03-06", "Groceries", "10.09")
+    assert service.get_budget_comparison() == [
+        ("Groceries", "month", Decimal("20.19"), Decimal("20.19")),
+        ("Rent", "month", Decimal("900.00"), Decimal("0.00")),
+    ]
+
+
+def test_amount_filter_bounds_are_inclusive(service):
+    for amount in ("10.08", "10.09", "10.10", "10.11"):
+        service.insert_expense("2024-03-05", "Groceries", amount)
+    page = service.fetch_expense_page(min_amount="10.09", max_amount="10.10")
+    assert sorted(row[3] for row in page) == [Decimal("10.09"), Decimal("10.10")]
+
+
+def test_adjustments_round_to_cents(service):
+    expense_id = service.insert_expense("2024-03-05", "Groceries", "20.19")[0]
+    budget_id = service.insert_budget("Groceries", "20.19")[0]
+    assert service.adjust_expense_amounts("+3.3%", ids=[expense_id])[1][0][3] == Decimal("20.86")
+    assert service.adjust_expense_amounts("-0.05", ids=[expense_id])[1][0][3] == Decimal("20.81")
+    assert service.adjust_budgets("-10%", [budget_id])[0][2] == Decimal("18.17")
+    assert service.get_category_totals() == [("Groceries", Decimal("20.81"))]
+
+
+def test_forecast_amounts_are_decimal(service):
+    service.insert_budget("Groceries", "300")
+    service.insert_expense("2024-03-05", "Groceries", "10.10")
+    (category, budget, spent, projected), = service.get_budget_forecast(on="2024-03-10")
+    assert (category, budget, spent) == ("Groceries", Decimal("300.00"), Decimal("10.10"))
+    assert isinstance(projected, Decimal)
+
+
+def test_sqlite_float_amounts_become_cents(tmp_path, monkeypatch):
+    # Databases from before migration 7 hold amounts as binary floats
+    from storage import create_backend
+    storage = create_backend("sqlite", path=str(tmp_path / "legacy.db"))
+    storage.open()
+    monkeypatch.setattr(migrations, "MIGRATIONS", migrations.MIGRATIONS[:6])
+    migrations.migrate(storage)
+    with storage.transaction() as session:
+        session.execute("INSERT INTO categories (name) VALUES ('Groceries')")
+        session.executemany("INSERT INTO expenses (date, category, amount) VALUES ('2024-03-05', 'Groceries', %s)",
+                            [(10.1,), (10.09,), (12,)])
+        session.execute("INSERT INTO budgets (category, amount) VALUES ('Groceries', 20.19)")
+    monkeypatch.undo()
+    assert migrations.migrate(storage) == [
+        version for version, _, _ in migrations.MIGRATIONS if version > 6]
+    assert storage.fetchall("SELECT amount FROM expenses ORDER BY amount") == [
+        (Decimal("10.09"),), (Decimal("10.10"),), (Decimal("12.00"),)]
+    assert storage.fetchall("SELECT total FROM expense_rollup") == [(Decimal("32.19"),)]
+    assert storage.fetchall("SELECT amount FROM budgets") == [(Decimal("20.19"),)]
+    storage.close()
+
+
+def test_exports_validate_dates(service, tmp_path):
+    for call in (lambda: service.export_page(start="garbage"),
+                 lambda: service.export_expenses(str(tmp_path / "out.csv"), end="2024-13-01")):
+        with pytest.raises(ValidationError):
+            call()
+
+
+def test_budgets_are_unique_per_category_and_period(service):
+    service.insert_budget("Groceries", "100", "week")
+    service.insert_budget("Groceries", "400", "month")
+    with pytest.raises(DuplicateKeyError):
+        service.insert_budget("Groceries", "450", "month")
+    assert sorted(row[1:] for row in service.list_budgets()) == [
+        ("Groceries", Decimal("100.00"), "week"), ("Groceries", Decimal("400.00"), "month")]
+
+
+def test_budget_report_filters_by_period(service, tmp_path):
+    service.insert_budget("Groceries", "100", "week")
+    service.insert_budget("Groceries", "400", "month")
+    service.insert_budget("Rent", "900", "month")
+    path = tmp_path / "report.csv"
+    assert service.export_budget_report(str(path), period="month") == 2
+    assert service.export_budget_report(str(path), period="week") == 1
+    assert service.export_budget_report(str(path)) == 3
+    with open(path, newline="") as report:
+        assert list(csv.reader(report)) == [
+            ["category", "period", "budget", "spent", "remaining"],
+            ["Groceries", "month", "400.00", "0.00", "400.00"],
+            ["Groceries", "week", "100.00", "0.00", "100.00"],
+            ["Rent", "month", "900.00", "0.00", "900.00"],
+        ]
+
+
+def test_budget_comparison_tells_periods_apart(service):
+    service.insert_budget("Groceries", "400", "month")
+    service.insert_budget("Groceries", "100", "week")
+    service.insert_expense("2024-03-05", "Groceries", "12.50")
+    assert service.get_budget_comparison("2024-03-01", "2024-03-31") == [
+        ("Groceries", "month", Decimal("400.00"), Decimal("12.50")),
+        ("Groceries", "week", Decimal("100.00"), Decimal("12.50")),
+    ]
+    assert service.get_budget_comparison("2024-03-01", "2024-03-31", "week") == [
+        ("Groceries", "week", Decimal("100.00"), Decimal("12.50")),
+    ]
+
+
+def test_alerts_follow_each_period_budget(service):
+    today = date.today().isoformat()
+    service.insert_budget("Groceries", "100", "week")
+    service.insert_budget("Groceries", "1000", "year")
+    fired = []
+    service.add_alert_listener(fired.extend)
+    service.insert_expense(today, "Groceries", "85")
+    assert [(alert["period"], alert["threshold"]) for alert in fired] == [("week", 80)]
+    fired.clear()
+    service.insert_expense(today, "Groceries", "720")
+    assert sorted((alert["period"], alert["threshold"]) for alert in fired) == [("week", 100), ("year", 80)]
+
+
+def test_budget_list_order_matches_budget_order(service):
+    for category in ("banana", "Apple", "cherry", "apple", "Éclair", "Banana"):
+        service.insert_budget(category, "10")
+    rows = service.list_budgets()
+    assert [row[1] for row in rows] == ["Apple", "apple", "Banana", "banana", "cherry", "Éclair"]
+    assert rows == sorted(rows, key=lambda row: budget_order(row[1], row[0]))
+
+
+def test_note_search_finds_short_words(service):
+    # Shorter than MySQL's full-text token size, so not in its index
+    matched = service.insert_expense("2024-03-05", "Travel", "12.00", "Taxi to the ab testing day")[0]
+    service.insert_expense("2024-03-06", "Travel", "30.00", "Cab back")
+    service.insert_expense("2024-03-07", "Groceries", "4.20")
+    for text in ("ab", "AB test", "taxi ab", "to"):
+        assert [row[0] for row in service.fetch_expense_page(text=text)] == [matched], text
+    assert service.count_expenses(text="ab") == 1
+    assert service.fetch_expense_page(text="ab missing") == []
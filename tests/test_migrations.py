@@ -0,0 +1,77 @@
+import random
+from decimal import Decimal
+
+import pytest
+
+import migrations
+import rollup
+from storage import StorageError
+
+
+def fill(storage, rows=5000):
+    # A ledger with statistics, so the planner sees realistic selectivities
+    rng = random.Random(3)
+    categories = [f"Category {index:02d}" for index in range(40)]
+    with storage.transaction() as session:
+        session.executemany(f"{storage.insert_ignore} INTO categories (name) VALUES (%s)",
+                            [(name,) for name in categories])
+        session.executemany(
+            "INSERT INTO expenses (date, category, amount) VALUES (%s, %s, %s)",
+            [(f"{rng.randint(2015, 2024)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+              rng.choice(categories), Decimal(rng.randrange(100, 50000)) / 100) for _ in range(rows)])
+    rollup.rebuild(storage)
+    storage.execute("ANALYZE TABLE expenses" if storage.name == 'mysql' else "ANALYZE")
+
+
+def test_migrate_is_a_no_op_once_current(storage):
+    latest = migrations.MIGRATIONS[-1][0]
+    assert migrations.migrate(storage) == []
+    with storage.read() as session:
+        assert migrations.current_version(session) == latest
+
+
+def test_hot_queries_use_their_index(storage):
+    fill(storage)
+    for name, plan, ok in migrations.check_query_plans(storage):
+        assert ok, f"{name}: {plan}"
+
+
+def test_plan_check_rejects_a_full_scan(storage):
+    fill(storage)
+    storage.execute("DROP INDEX idx_expenses_amount" + (" ON expenses" if storage.name == 'mysql' else ""))
+    results = {name: ok for name, _, ok in migrations.check_query_plans(storage)}
+    assert not results["expenses in amount range"]
+
+
+def test_expenses_reference_known_categories(storage):
+    storage.execute("INSERT INTO categories (name) VALUES (%s)", ("Food",))
+    storage.execute("INSERT INTO expenses (date, category, amount) VALUES (%s, %s, %s)",
+                    ("2024-01-01", "Food", Decimal("1.00")))
+    with pytest.raises(StorageError):
+        storage.execute("INSERT INTO expenses (date, category, amount) VALUES (%s, %s, %s)",
+                        ("2024-01-01", "Unknown", Decimal("1.00")))
+
+
+def migrate_to(storage, monkeypatch, version):
+    # A fresh schema at the given version
+    for table in ("expense_notes", "expense_rollup", "expenses", "budgets", "categories", "schema_version"):
+        if table != "expense_notes" or storage.name == 'sqlite':
+            storage.execute(f"DROP TABLE IF EXISTS {table}")
+    with monkeypatch.context() as patch:
+        patch.setattr(migrations, "MIGRATIONS", [m for m in migrations.MIGRATIONS if m[0] <= version])
+        migrations.migrate(storage)
+
+
+def test_migrations_rerun_after_failing_part_way(storage, monkeypatch):
+    # MySQL keeps the DDL statements of a migration that failed part way
+    migrate_to(storage, monkeypatch, 2)
+    storage.execute("CREATE TABLE categories (id INT PRIMARY KEY, name VARCHAR(255) NOT NULL UNIQUE)")
+    if storage.name == 'mysql':
+        storage.execute("ALTER TABLE expenses ADD CONSTRAINT fk_expenses_category "
+                        "FOREIGN KEY (category) REFERENCES categories (name) ON UPDATE CASCADE")
+    assert migrations.migrate(storage)[0] == 3
+
+    migrate_to(storage, monkeypatch, 5)
+    storage.execute("CREATE INDEX idx_expenses_amount ON expenses (amount)")
+    storage.execute("ALTER TABLE expenses ADD COLUMN note VARCHAR(255)")
+    assert migrations.migrate(storage)[0] == 6
@@ -0,0 +1,45 @@
+import random
+
+import rollup
+
+CATEGORIES = ["Groceries", "Rent", "Travel", "Books"]
+
+
+def snapshot(storage):
+    return storage.fetchall(f"SELECT month, category, total, expense_count FROM {rollup.TABLE} "
+                            "ORDER BY month, category")
+
+
+def test_incremental_rollup_matches_rebuild(service):
+    # Random single-row and bulk writes; the rollup kept in step by each write
+    # must equal one recomputed from the expenses table
+    rng = random.Random(7)
+    ids = []
+
+    def day():
+        return f"2024-{rng.randint(1, 6):02d}-{rng.randint(1, 28):02d}"
+
+    def amount():
+        return f"{rng.randint(1, 99999) / 100:.2f}"
+
+    for _ in range(600):
+        op = rng.random()
+        if op < 0.5 or not ids:
+            ids.append(service.insert_expense(day(), rng.choice(CATEGORIES), amount())[0])
+        elif op < 0.7:
+            service.save_expense(rng.choice(ids), day(), rng.choice(CATEGORIES), amount())
+        elif op < 0.8:
+            service.remove_expense(ids.pop(rng.randrange(len(ids))))
+        elif op < 0.87:
+            service.recategorize_expenses(rng.choice(CATEGORIES), ids=rng.sample(ids, min(5, len(ids))))
+        elif op < 0.94:
+            service.adjust_expense_amounts(rng.choice(["+0.07", "-0.03", "+3.3%", "-7%"]),
+                                           filters={"category": rng.choice(CATEGORIES)})
+        else:
+            gone = rng.sample(ids, min(3, len(ids)))
+            service.remove_expenses(ids=gone)
+            ids = [expense_id for expense_id in ids if expense_id not in gone]
+
+    incremental = snapshot(service.storage)
+    rollup.rebuild(service.storage)
+    assert incremental == snapshot(service.storage)
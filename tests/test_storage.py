@@ -0,0 +1,67 @@
+import threading
+
+import pytest
+
+from storage import DuplicateKeyError, StorageError
+
+
+@pytest.fixture
+def probe(storage):
+    # A scratch table of its own, so these checks do not depend on the schema
+    storage.execute("DROP TABLE IF EXISTS probe")
+    storage.execute(f"CREATE TABLE probe (id {storage.auto_id}, name VARCHAR(50) UNIQUE, hits INT)")
+    yield storage
+    storage.execute("DROP TABLE probe")
+
+
+def test_insert_returns_the_new_id(probe):
+    first = probe.insert("INSERT INTO probe (name, hits) VALUES (%s, %s)", ("a", 1))
+    second = probe.insert("INSERT INTO probe (name, hits) VALUES (%s, %s)", ("b", 2))
+    assert second > first
+    assert probe.fetchone("SELECT name, hits FROM probe WHERE id = %s", (second,)) == ("b", 2)
+
+
+def test_execute_returns_the_affected_row_count(probe):
+    probe.executemany("INSERT INTO probe (name, hits) VALUES (%s, %s)", [("a", 1), ("b", 2), ("c", 3)])
+    assert probe.execute("UPDATE probe SET hits = hits + 1 WHERE hits >= %s", (2,)) == 2
+    assert [tuple(row) for row in probe.fetchall("SELECT name, hits FROM probe ORDER BY name")] == \
+        [("a", 1), ("b", 3), ("c", 4)]
+
+
+def test_failed_transaction_rolls_back(probe):
+    with pytest.raises(RuntimeError):
+        with probe.transaction() as session:
+            session.execute("INSERT INTO probe (name, hits) VALUES (%s, %s)", ("a", 1))
+            raise RuntimeError("abort")
+    assert probe.fetchone("SELECT COUNT(*) FROM probe")[0] == 0
+
+
+def test_duplicate_key_is_translated(probe):
+    probe.execute("INSERT INTO probe (name, hits) VALUES (%s, %s)", ("a", 1))
+    with pytest.raises(DuplicateKeyError):
+        probe.execute("INSERT INTO probe (name, hits) VALUES (%s, %s)", ("a", 2))
+    assert probe.fetchone("SELECT COUNT(*) FROM probe")[0] == 1
+
+
+def test_driver_errors_become_storage_errors(probe):
+    with pytest.raises(StorageError):
+        probe.fetchall("SELECT missing_column FROM probe")
+
+
+def test_concurrent_writers_share_the_pool(probe):
+    errors = []
+
+    def write(worker):
+        try:
+            for index in range(20):
+                probe.execute("INSERT INTO probe (name, hits) VALUES (%s, %s)", (f"{worker}-{index}", index))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write, args=(worker,)) for worker in range(probe.pool_size * 2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert probe.fetchone("SELECT COUNT(*) FROM probe")[0] == probe.pool_size * 2 * 20
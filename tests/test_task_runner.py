@@ -0,0 +1,80 @@
+import sys
+import threading
+import time
+
+import pytest
+
+import instrumentation
+from instrumentation import metrics
+from task_runner import TaskRunner
+
+
+class FakeRoot:
+    # Just enough of a Tk root for TaskRunner: after() callbacks are queued
+    # and run by drain() instead of a mainloop
+    def __init__(self):
+        self.scheduled = []
+
+    def after(self, ms, callback):
+        self.scheduled.append(callback)
+
+    def report_callback_exception(self, exc_type, exc, tb):
+        raise exc
+
+
+def drain(runner, root, timeout=5):
+    deadline = time.monotonic() + timeout
+    while root.scheduled:
+        assert time.monotonic() < deadline, "jobs did not finish"
+        root.scheduled.pop(0)()
+        time.sleep(0.005)
+
+
+def summing_job(count):
+    return sum(range(count))
+
+
+@pytest.mark.parametrize("per_thread", [False] + ([True] if sys.version_info < (3, 12) else []))
+def test_jobs_run_while_profiling(monkeypatch, per_thread):
+    # From 3.12 a second profiler cannot start while the Tk thread's runs, so
+    # jobs only get their own where cProfile is per thread
+    monkeypatch.setattr(instrumentation, "PROFILE_PER_THREAD", per_thread)
+    root = FakeRoot()
+    runner = TaskRunner(root, max_workers=2, poll_interval=1)
+    results, errors = [], []
+    metrics.reset()
+    metrics.start_profile()
+    try:
+        for _ in range(4):
+            runner.submit(summing_job, 10000, on_success=results.append, on_error=errors.append)
+        drain(runner, root)
+    finally:
+        report = metrics.stop_profile()
+        runner.shutdown()
+    assert errors == []
+    assert results == [sum(range(10000))] * 4
+    assert metrics.snapshot()["job: summing_job"]["count"] == 4
+    if per_thread or sys.version_info >= (3, 12):
+        assert "summing_job" in report
+    metrics.reset()
+
+
+def test_superseded_job_result_is_dropped():
+    root = FakeRoot()
+    runner = TaskRunner(root, max_workers=1, poll_interval=1)
+    started, release = threading.Event(), threading.Event()
+    results = []
+
+    def slow(value):
+        started.set()
+        release.wait(5)
+        return value
+
+    runner.submit(slow, "old", key="chart", on_success=results.append)
+    started.wait(5)
+    runner.submit(slow, "new", key="chart", on_success=results.append)
+    release.set()
+    drain(runner, root)
+    runner.shutdown()
+    assert results == ["new"]
+    assert not runner.is_busy()
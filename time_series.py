@@ -0,0 +1,109 @@
+import numpy as np
+
+# Vectorised spending series for the trends tab. The database returns daily
+# (day, category, total) rows; these become a dense categories x days matrix
+# that is resampled, smoothed and accumulated with whole-array NumPy
+# operations, then downsampled to the width of the plot before drawing.
+
+FREQUENCIES = ("day", "week", "month")
+# Days since 1970-01-01 (a Thursday) plus this, mod 7, is 0 on Mondays
+MONDAY_OFFSET = 3
+
+
+def daily_matrix(rows, top=None, start=None, end=None):
+    # Returns (days, categories, matrix): every day from the first to the last
+    # row (or from start to end, when given) as datetime64[D], category names,
+    # and float totals per category and day with zeros for days without
+    # spending. With `top`, the categories beyond the `top` largest are
+    # summed into one "Other" row.
+    days = np.array([str(day)[:10] for day, _, _ in rows], dtype="datetime64[D]")
+    first = np.datetime64(start, "D") if start else (days.min() if len(days) else None)
+    last = np.datetime64(end, "D") if end else (days.max() if len(days) else None)
+    if first is None or last is None or first > last:
+        return np.array([], dtype="datetime64[D]"), [], np.zeros((0, 0))
+    names, index = np.unique(np.array([category for _, category, _ in rows], dtype=object),
+                             return_inverse=True)
+    amounts = np.array([float(total) for _, _, total in rows])
+    axis = np.arange(first, last + 1)
+    matrix = np.zeros((len(names), len(axis)))
+    inside = (days >= first) & (days <= last)
+    np.add.at(matrix, (index[inside], (days[inside] - first).astype(np.int64)), amounts[inside])
+
+    order = np.argsort(-matrix.sum(axis=1), kind="stable")
+    names, matrix = names[order], matrix[order]
+    if top is not None and len(names) > top:
+        matrix = np.vstack([matrix[:top], matrix[top:].sum(axis=0)])
+        names = np.append(names[:top], "Other")
+    return axis, [str(name) for name in names], matrix
+
+
+def period_starts(days, freq):
+    # First day of the week (Monday) or month holding each day
+    if freq == "day":
+        return days
+    if freq == "week":
+        return days - (days.astype(np.int64) + MONDAY_OFFSET) % 7
+    if freq == "month":
+        return days.astype("datetime64[M]").astype("datetime64[D]")
+    raise ValueError(f"Unsupported frequency: {freq}")
+
+
+def resample(days, matrix, freq):
+    # Sums the daily columns per period; days must be sorted, as daily_matrix returns them
+    if freq == "day" or not len(days):
+        return days, matrix
+    buckets = period_starts(days, freq)
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    return buckets[starts], np.add.reduceat(matrix, starts, axis=1)
+
+
+def rolling_mean(matrix, window):
+    # Trailing mean over `window` periods; the first few periods average
+    # whatever precedes them rather than being dropped
+    window = max(1, int(window))
+    sums = np.cumsum(matrix, axis=1)
+    sums[:, window:] = sums[:, window:] - sums[:, :-window]
+    return sums / np.minimum(np.arange(1, matrix.shape[1] + 1), window)
+
+
+def cumulative(matrix):
+    return np.cumsum(matrix, axis=1)
+
+
+def lttb(x, y, threshold):
+    # Largest-Triangle-Three-Buckets: indices of at most `threshold` points
+    # that keep the visual shape of the line (peaks, troughs, slopes). The
+    # first and last points are always kept; every bucket in between keeps the
+    # point forming the largest triangle with the previous pick and the
+    # average of the next bucket.
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    # Mean of each bucket, used as the third vertex for the bucket before it
+    counts = np.diff(edges)
+    mean_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1) / counts
+    mean_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1) / counts
+    mean_x = np.append(mean_x[1:], x[-1])
+    mean_y = np.append(mean_y[1:], y[-1])
+
+    picked = np.empty(threshold, dtype=np.int64)
+    picked[0] = previous = 0
+    for bucket in range(threshold - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        px, py = x[previous], y[previous]
+        area = np.abs((px - mean_x[bucket]) * (y[start:stop] - py)
+                      - (px - x[start:stop]) * (mean_y[bucket] - py))
+        previous = picked[bucket + 1] = start + int(area.argmax())
+    picked[-1] = n - 1
+    return picked
+
+
+def visible_slice(x, low, high):
+    # Index range of the points inside [low, high] plus one either side, so
+    # lines still run to the edges of the view
+    start = max(int(np.searchsorted(x, low, side="left")) - 1, 0)
+    stop = min(int(np.searchsorted(x, high, side="right")) + 1, len(x))
+    return start, stop